@@ -1,7 +1,16 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
 from django.contrib.auth import get_user_model
+from django.db.models import Count, Q
+from django.shortcuts import get_object_or_404, render
+from django.urls import path
+from django.utils import timezone
 
-from apps.main.models import PickupPoint, CabinetProfile, Parcel, SiteSettings, ParcelHistory
+from apps.main.counters import record_moves, status_changed
+from apps.main.outbox import emit, make_event
+from apps.main.models import ApiToken, Bag, Notification, PickupPoint, CabinetProfile, Parcel, SiteSettings, ParcelHistory
+from apps.main.paginators import EstimatedCountPaginator
+from apps.main.search import history_fulltext_q
 
 User = get_user_model()
 
@@ -37,19 +46,179 @@ class CabinetProfileAdmin(admin.ModelAdmin):
     autocomplete_fields = ("pickup_point",)
 
 
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist для таблиц на миллионы строк: без точного COUNT(*) и с
+    поиском по префиксу (LIKE 'x%' идёт по индексу, '%x%' — нет).
+    Поисковая строка приводится к верхнему регистру: треки хранятся в UPPER.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        # ограниченный подсчёт идёт от текущей страницы, иначе дальше count_cap не пролистать
+        try:
+            page = int(request.GET.get(PAGE_VAR, 1))
+        except ValueError:
+            page = 1
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, current_page=page)
+
+    def get_search_results(self, request, queryset, search_term):
+        return super().get_search_results(request, queryset, search_term.strip().upper())
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    """
+    Токены создаются командой create_api_token (сырой токен показывается один раз);
+    здесь — отключить или удалить.
+    """
+
+    list_display = ("name", "user", "is_active", "created_at", "last_used_at")
+    list_filter = ("is_active",)
+    search_fields = ("name",)
+    raw_id_fields = ("user",)
+    readonly_fields = ("key_hash", "created_at", "last_used_at")
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ("parcel", "user", "state", "attempts", "next_attempt_at", "sent_at", "last_error")
+    list_filter = ("state",)
+    list_select_related = ("parcel", "user")
+    ordering = ("-created_at",)
+    raw_id_fields = ("user", "parcel")
+    readonly_fields = ("created_at", "sent_at")
+
+
+@admin.register(Bag)
+class BagAdmin(LargeTableAdmin):
+    list_display = ("code", "created_by", "first_scanned_at", "second_scanned_at", "created_at")
+    list_select_related = ("created_by",)
+    search_fields = ("code__startswith",)
+    ordering = ("-created_at",)
+    raw_id_fields = ("created_by",)
+    readonly_fields = ("first_scanned_at", "second_scanned_at", "created_at")
+
+
 @admin.register(Parcel)
-class ParcelAdmin(admin.ModelAdmin):
-    list_display = ("track_number", "user", "status", "created_at", "updated_at")
-    list_filter = ("status", "created_at", "updated_at")
-    search_fields = ("track_number", "user__username", "user__first_name", "user__last_name")
+class ParcelAdmin(LargeTableAdmin):
+    list_display = ("track_number", "user", "status", "pickup_point", "created_at", "updated_at")
+    list_filter = ("status", "pickup_point", "created_at", "updated_at")
+    list_select_related = ("user", "pickup_point")
+    search_fields = ("track_number__startswith", "user__username__startswith")
+    search_help_text = "Начало трек-номера или телефона (логина) клиента."
     ordering = ("-created_at",)
-    raw_id_fields = ("user",)
+    raw_id_fields = ("user", "bag")
+    autocomplete_fields = ("pickup_point",)
+    # из профиля владельца (signals.py), руками не правится
+    readonly_fields = ("destination",)
+
+    history_page_size = 50
+
+    def get_urls(self):
+        urls = [
+            path(
+                "<int:object_id>/history-fragment/",
+                self.admin_site.admin_view(self.history_fragment_view),
+                name="main_parcel_history_fragment",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    # правки из админки тоже двигают счётчики статусов (admin уже в транзакции)
+    def save_model(self, request, obj, form, change):
+        # старое состояние — под блокировкой: иначе переход, который параллельно
+        # сделал process_parcel_flows, попадёт в счётчики и ленту второй раз
+        old = None
+        if change:
+            old = Parcel.objects.select_for_update().filter(pk=obj.pk).values("user_id", "status").first()
+        old_user, old_status = (old["user_id"], old["status"]) if old else (None, None)
+        if obj.user_id != old_user:
+            obj.destination_id = (
+                CabinetProfile.objects.filter(user_id=obj.user_id).values_list("pickup_point_id", flat=True).first()
+                if obj.user_id else None
+            )
+        super().save_model(request, obj, form, change)
+        if old_user == obj.user_id:
+            status_changed(obj.user_id, old_status, obj.status)
+        else:
+            status_changed(old_user, old_status, None)
+            status_changed(obj.user_id, None, obj.status)
+        if old and old_status != obj.status:
+            emit([make_event(obj.pk, obj.track_number, obj.user_id, old_status, obj.status, timezone.now())])
+
+    def delete_model(self, request, obj):
+        user_id, status = obj.user_id, obj.status
+        super().delete_model(request, obj)
+        status_changed(user_id, status, None)
+
+    def delete_queryset(self, request, queryset):
+        moves = {
+            (row["user_id"], row["status"], None): row["n"]
+            for row in queryset.filter(user__isnull=False)
+            .values("user_id", "status")
+            .annotate(n=Count("id"))
+            .order_by()
+        }
+        super().delete_queryset(request, queryset)
+        record_moves(moves)
+
+    def history_fragment_view(self, request, object_id):
+        """
+        HTML-фрагмент истории для страницы посылки: грузится по кнопке,
+        страницами по history_page_size (keyset по occurred_at/id).
+        """
+        parcel = get_object_or_404(Parcel, pk=object_id)
+        if not self.has_view_permission(request, parcel):
+            return render(request, "admin/main/parcel/history_fragment.html", {"events": [], "denied": True})
+
+        qs = ParcelHistory.objects.filter(parcel_id=parcel.pk).order_by("-occurred_at", "-id")
+        before = request.GET.get("before")
+        if before and before.isdigit():
+            anchor = ParcelHistory.objects.filter(parcel_id=parcel.pk, pk=int(before)).values("occurred_at").first()
+            if anchor:
+                qs = qs.filter(occurred_at__lte=anchor["occurred_at"]).exclude(
+                    occurred_at=anchor["occurred_at"], id__gte=int(before)
+                )
+        events = list(qs.only("id", "status", "message", "occurred_at")[: self.history_page_size + 1])
+        has_more = len(events) > self.history_page_size
+        events = events[: self.history_page_size]
+        return render(
+            request,
+            "admin/main/parcel/history_fragment.html",
+            {
+                "parcel": parcel,
+                "events": events,
+                "next_before": events[-1].pk if has_more and events else None,
+            },
+        )
 
 
 @admin.register(ParcelHistory)
-class ParcelHistoryAdmin(admin.ModelAdmin):
-    list_display = ("parcel", "status", "created_at")
-    list_filter = ("status", "created_at")
-    search_fields = ("parcel__track_number", "message")
-    ordering = ("-created_at",)
+class ParcelHistoryAdmin(LargeTableAdmin):
+    list_display = ("parcel", "status", "occurred_at", "created_at")
+    list_filter = ("status", "occurred_at")
+    list_select_related = ("parcel",)
+    search_fields = ("parcel__track_number__startswith",)
+    search_help_text = "Начало трек-номера или слова из сообщения (полнотекстовый поиск)."
+    # created_at без индекса — сортируем по индексируемому occurred_at
+    ordering = ("-occurred_at", "-id")
     raw_id_fields = ("parcel",)
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Префикс трека (как в LargeTableAdmin) ИЛИ полнотекстовый индекс по message.
+        Трек — подзапросом по id посылок: с JOIN на Parcel внутри OR индекс
+        track_number не используется.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        track_q = Q(parcel_id__in=Parcel.objects.filter(track_number__startswith=term.upper()).values("id"))
+        return queryset.filter(track_q | history_fulltext_q(term, using=queryset.db)), False
@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+# профиль и пункт выдачи нужны почти каждому view — грузим одним JOIN
+USER_CONTEXT_RELATED = ("cabinet_profile__pickup_point",)
+
+
+class CabinetModelBackend(ModelBackend):
+    """
+    ModelBackend, который загружает пользователя сразу с cabinet_profile
+    и pickup_point: один запрос на аутентифицированный запрос вместо трёх.
+    """
+
+    def _user_queryset(self):
+        return UserModel._default_manager.select_related(*USER_CONTEXT_RELATED)
+
+    def get_user(self, user_id):
+        try:
+            user = self._user_queryset().get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        try:
+            user = await self._user_queryset().aget(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = self._user_queryset().get(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            # как в ModelBackend: хэшируем пароль впустую против timing-атак
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -2,10 +2,24 @@ from datetime import timedelta
 import hashlib
 
 from django.conf import settings
-from django.db import transaction, IntegrityError
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, router, transaction
+from django.db.models import Q
+from django.db.models.functions import Greatest
 from django.utils import timezone
 
-from .models import Parcel, ParcelHistory, track_validator
+from .counters import record_moves, status_changed
+from .outbox import emit, make_event
+from .models import Bag, Parcel, ParcelHistory, bag_code_validator, track_validator
+from .tracing import span, traced
+
+
+# Тексты этапов Китая (t0, +10 сек, +2 дня)
+CN_STAGE_1_MESSAGE = "Товар поступил на склад в Китае"
+CN_STAGE_2_MESSAGE = "Товар отправлен на хранение."
+CN_STAGE_3_MESSAGE = "Товар отправлен со склада и уже в пути."
+CN_STAGE_2_OFFSET = timedelta(seconds=10)
+CN_STAGE_3_OFFSET = timedelta(days=2)
 
 
 def _get_second_scan_delay() -> timedelta:
@@ -17,6 +31,7 @@ def _norm_dt(dt):
     return dt.replace(microsecond=0) if dt else dt
 
 
+@traced("scan.sanitize")
 def _sanitize_track(track_number: str) -> str:
     track = (track_number or "").strip().replace(" ", "")
     if not track:
@@ -40,6 +55,43 @@ def _sanitize_track(track_number: str) -> str:
     return track
 
 
+def _sanitize_bag_code(code: str) -> str:
+    code = (code or "").strip().replace(" ", "").upper()
+    if not code:
+        raise ValueError("Код мешка пустой.")
+    try:
+        bag_code_validator(code)
+    except ValidationError as e:
+        raise ValueError(e.messages[0])
+    return code
+
+
+def _pickup_message(pickup, track_number: str) -> str:
+    """
+    Текст события AT_PICKUP (как на скрине).
+    """
+    pp_name = (pickup.name if pickup else "").strip()
+    pp_addr = (pickup.address if pickup and pickup.address else "").strip()
+
+    title = "Товар прибыл в пункт выдачи"
+    if pp_name:
+        if pp_addr:
+            title += f" [{pp_name}, адрес: {pp_addr}]"
+        else:
+            title += f" [{pp_name}]"
+
+    msg_lines = [
+        title + ",",
+        f"трек-номер: {track_number},",
+    ]
+
+    # если адрес не попал в заголовок — добавим отдельной строкой
+    if pp_addr and "адрес:" not in title:
+        msg_lines.append(f"адрес: {pp_addr}")
+
+    return "\n".join(msg_lines)
+
+
 def _hash_message(msg: str) -> str:
     s = (msg or "").strip()
     if not s:
@@ -47,33 +99,137 @@ def _hash_message(msg: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
 
-def _add_history_once(parcel: Parcel, status: int, message: str, occurred_at) -> None:
+@traced("history.insert")
+def _add_history_once(parcel: Parcel, status: int, message: str, occurred_at) -> bool:
     """
-    Идемпотентная запись истории.
+    Идемпотентная запись истории. True — если строка реально добавлена.
     Требование: в ParcelHistory есть UniqueConstraint:
       (parcel, status, occurred_at, message_hash)
     """
     msg = (message or "").strip()
     if not msg:
-        return
+        return False
 
     occurred_at = _norm_dt(occurred_at)
     msg_hash = _hash_message(msg)
 
     try:
-        ParcelHistory.objects.create(
-            parcel=parcel,
-            status=status,
-            message=msg,
-            message_hash=msg_hash,
-            occurred_at=occurred_at,
-        )
+        # savepoint: дубль не должен ломать внешнюю транзакцию (PostgreSQL)
+        with transaction.atomic():
+            ParcelHistory.objects.create(
+                parcel=parcel,
+                status=status,
+                message=msg,
+                message_hash=msg_hash,
+                occurred_at=occurred_at,
+            )
     except IntegrityError:
         # дубль — ок
+        return False
+    return True
+
+
+def _history_row(parcel_id, status: int, message: str, occurred_at) -> ParcelHistory:
+    """
+    Несохранённая запись истории для _bulk_add_history.
+    """
+    msg = (message or "").strip()
+    return ParcelHistory(
+        parcel_id=parcel_id,
+        status=status,
+        message=msg,
+        message_hash=_hash_message(msg),
+        occurred_at=_norm_dt(occurred_at),
+    )
+
+
+@traced("history.bulk_insert")
+def _bulk_add_history(rows, batch_size: int = 2000) -> None:
+    """
+    Массовая идемпотентная запись истории: дубли по
+    uniq_parcel_history_event_hash молча пропускаются.
+    bulk_create не вызывает save(), поэтому строки собирать через _history_row.
+    """
+    ParcelHistory.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+
+
+def _status_changed(parcel: Parcel, transitions) -> None:
+    """
+    Единая точка после записи нового статуса посылки (в той же транзакции):
+    счётчики пользователя + outbox. transitions — [(старый, новый, occurred_at)]
+    по порядку; счётчикам важен только итог. Вызывать, только если запись
+    действительно сменила строку (блокировка или условный UPDATE) — иначе
+    в ленте будет дубль события.
+    """
+    if not transitions:
         return
+    status_changed(parcel.user_id, transitions[0][0], transitions[-1][1])
+    emit([
+        make_event(parcel.pk, parcel.track_number, parcel.user_id, old, new, occurred_at)
+        for old, new, occurred_at in transitions
+    ])
+
+
+def _cn_flow_due(parcel: Parcel, now) -> bool:
+    """
+    Есть ли у посылки наступившие, но ещё не записанные этапы Китая.
+    Без запросов к БД — чтобы async-view не уходили в sync-поток зря.
+    """
+    if not parcel.auto_flow_started_at:
+        return False
+
+    dt = _norm_dt(now) - _norm_dt(parcel.auto_flow_started_at)
+    if parcel.auto_flow_stage < 1:
+        return dt.total_seconds() >= 0
+    if parcel.auto_flow_stage < 2:
+        return dt >= CN_STAGE_2_OFFSET
+    if parcel.auto_flow_stage < 3:
+        return dt >= CN_STAGE_3_OFFSET
+    return False
+
+
+def _cn_due_q(now) -> Q:
+    """
+    Фильтр посылок, у которых наступил следующий этап Китая (см. _cn_flow_due).
+    """
+    now = _norm_dt(now)
+    return Q(auto_flow_started_at__isnull=False) & (
+        Q(auto_flow_stage__lt=1)
+        | (Q(auto_flow_stage__lt=2) & Q(auto_flow_started_at__lte=now - CN_STAGE_2_OFFSET))
+        | (Q(auto_flow_stage__lt=3) & Q(auto_flow_started_at__lte=now - CN_STAGE_3_OFFSET))
+    )
+
+
+def _cn_flow_lag_seconds(now) -> float:
+    """
+    Возраст самого старого просроченного перехода: сколько секунд назад
+    наступил этап, который процессор ещё не записал. 0 — отставания нет.
+    По запросу на этап — первая строка индекса parcel_cn_due_idx, без
+    агрегата по таблице. Считает process_parcel_flows и публикует gauge.
+    """
+    now = _norm_dt(now)
+    due_times = []
+    for stage, offset in ((0, timedelta(0)), (1, CN_STAGE_2_OFFSET), (2, CN_STAGE_3_OFFSET)):
+        started = (
+            # auto_flow_stage__lt=3 — условие частичного индекса, SQLite сам его не выводит
+            Parcel.objects.filter(
+                auto_flow_started_at__isnull=False,
+                auto_flow_stage__lt=3,
+                auto_flow_stage=stage,
+                auto_flow_started_at__lte=now - offset,
+            )
+            .order_by("auto_flow_started_at")
+            .values_list("auto_flow_started_at", flat=True)
+            .first()
+        )
+        if started is not None:
+            due_times.append(started + offset)
+    if not due_times:
+        return 0.0
+    return max(0.0, (now - min(due_times)).total_seconds())
 
 
-def _advance_cn_flow(parcel: Parcel, now) -> None:
+def _advance_cn_flow(parcel: Parcel, now) -> int:
     """
     ЛОГИКА КАК НА СКРИНЕ (оставляем только 3 этапа Китая):
       1) AT_CN: "Товар поступил на склад в Китае" (сразу, t0)
@@ -81,53 +237,83 @@ def _advance_cn_flow(parcel: Parcel, now) -> None:
       3) FROM_CN: "Товар отправлен со склада и уже в пути." (+2 дня)
 
     Этапы типа "Кашгар/Бишкек/Классификация" — УБРАНЫ.
+    Возвращает число добавленных строк истории.
+
+    parcel может быть прочитан без блокировки (кабинет, публичный трекинг —
+    в том числе с реплики) параллельно с process_parcel_flows. Поэтому
+    статус пишется условным UPDATE по прочитанным (status, auto_flow_stage):
+    счётчики и outbox получает только тот, кто реально сменил строку.
     """
     if not parcel.auto_flow_started_at:
-        return
+        return 0
 
+    old_status, old_stage = parcel.status, parcel.auto_flow_stage
     t0 = _norm_dt(parcel.auto_flow_started_at)
     now = _norm_dt(now)
     dt = now - t0
     seconds = dt.total_seconds()
+    transitions = []
     changed = False
+    inserted = 0
 
     # stage 1: сразу
     if parcel.auto_flow_stage < 1 and seconds >= 0:
-        _add_history_once(
+        inserted += _add_history_once(
             parcel,
             Parcel.Status.AT_CN,
-            "Товар поступил на склад в Китае",
+            CN_STAGE_1_MESSAGE,
             occurred_at=t0,
         )
+        if parcel.status != Parcel.Status.AT_CN:
+            transitions.append((parcel.status, Parcel.Status.AT_CN, t0))
         parcel.status = Parcel.Status.AT_CN
         parcel.auto_flow_stage = 1
         changed = True
 
     # stage 2: +10 сек
     if parcel.auto_flow_stage < 2 and seconds >= 10:
-        _add_history_once(
+        inserted += _add_history_once(
             parcel,
             Parcel.Status.AT_CN,
-            "Товар отправлен на хранение.",
-            occurred_at=t0 + timedelta(seconds=10),
+            CN_STAGE_2_MESSAGE,
+            occurred_at=t0 + CN_STAGE_2_OFFSET,
         )
         parcel.auto_flow_stage = 2
         changed = True
 
     # stage 3: +2 дня
-    if parcel.auto_flow_stage < 3 and dt >= timedelta(days=2):
-        _add_history_once(
+    if parcel.auto_flow_stage < 3 and dt >= CN_STAGE_3_OFFSET:
+        inserted += _add_history_once(
             parcel,
             Parcel.Status.FROM_CN,
-            "Товар отправлен со склада и уже в пути.",
-            occurred_at=t0 + timedelta(days=2),
+            CN_STAGE_3_MESSAGE,
+            occurred_at=t0 + CN_STAGE_3_OFFSET,
         )
+        if parcel.status != Parcel.Status.FROM_CN:
+            transitions.append((parcel.status, Parcel.Status.FROM_CN, t0 + CN_STAGE_3_OFFSET))
         parcel.status = Parcel.Status.FROM_CN
         parcel.auto_flow_stage = 3
         changed = True
 
     if changed:
-        parcel.save(update_fields=["status", "auto_flow_stage"])
+        with transaction.atomic():
+            won = Parcel.objects.filter(pk=parcel.pk, status=old_status, auto_flow_stage=old_stage).update(
+                status=parcel.status, auto_flow_stage=parcel.auto_flow_stage
+            )
+            if won:
+                _status_changed(parcel, transitions)
+        if not won:
+            # строку уже сдвинул другой — берём её состояние с основной БД
+            current = (
+                Parcel.objects.using(router.db_for_write(Parcel))
+                .filter(pk=parcel.pk)
+                .values("status", "auto_flow_stage")
+                .first()
+            )
+            if current is not None:
+                parcel.status = current["status"]
+                parcel.auto_flow_stage = current["auto_flow_stage"]
+    return inserted
 
 
 def _advance_local_flow(parcel: Parcel, pickup_point, now) -> None:
@@ -138,12 +324,14 @@ def _advance_local_flow(parcel: Parcel, pickup_point, now) -> None:
     return
 
 
+@traced("flows.advance_all")
 def _advance_all_flows(parcel: Parcel, pickup_point, now) -> None:
     _advance_cn_flow(parcel, now)
     _advance_local_flow(parcel, pickup_point, now)
 
 
-def _process_staff_scan(user, track_number: str) -> str:
+@traced("scan.process")
+def _process_staff_scan(user, track_number: str, bag_code: str = "") -> str:
     """
     1-й скан:
       - ставим started_at для Китая и локалки
@@ -153,17 +341,36 @@ def _process_staff_scan(user, track_number: str) -> str:
     2-й скан (только через delay):
       - ставим AT_PICKUP и history с occurred_at=now
       - никакие локальные авто-этапы не добавляем
+
+    bag_code — упаковка на складе в Китае: посылка кладётся в мешок
+    (создаётся при первом использовании кода). Уже начатую посылку только
+    перекладываем в мешок, 2-й скан при этом не делается.
     """
     now = _norm_dt(timezone.now())
     track = _sanitize_track(track_number)
+    bag_code = _sanitize_bag_code(bag_code) if bag_code else ""
 
     profile = getattr(user, "cabinet_profile", None)
     pickup = getattr(profile, "pickup_point", None)
 
     with transaction.atomic():
-        parcel = Parcel.objects.select_for_update().filter(track_number=track).first()
-        if not parcel:
-            parcel = Parcel.objects.create(track_number=track, status=Parcel.Status.WAITING_CN)
+        with span("scan.lock") as s:
+            parcel = Parcel.objects.select_for_update().filter(track_number=track).first()
+            if not parcel:
+                parcel = Parcel.objects.create(track_number=track, status=Parcel.Status.WAITING_CN)
+                if s is not None:
+                    s.set(created=True)
+
+        bag = None
+        if bag_code:
+            bag, _ = Bag.objects.get_or_create(code=bag_code, defaults={"created_by": user})
+            if parcel.status in (Parcel.Status.AT_PICKUP, Parcel.Status.RECEIVED):
+                raise ValueError("Посылка уже в пункте выдачи — в мешок не добавляется.")
+            if parcel.auto_flow_started_at is not None:
+                if parcel.bag_id != bag.pk:
+                    parcel.bag = bag
+                    parcel.save(update_fields=["bag"])
+                return f"Посылка добавлена в мешок {bag.code}."
 
         # ===== 1 СКАН =====
         if parcel.auto_flow_started_at is None:
@@ -173,16 +380,20 @@ def _process_staff_scan(user, track_number: str) -> str:
             parcel.local_flow_started_at = now
             parcel.local_flow_stage = 0
 
-            parcel.save(
-                update_fields=[
-                    "auto_flow_started_at",
-                    "auto_flow_stage",
-                    "local_flow_started_at",
-                    "local_flow_stage",
-                ]
-            )
+            update_fields = [
+                "auto_flow_started_at",
+                "auto_flow_stage",
+                "local_flow_started_at",
+                "local_flow_stage",
+            ]
+            if bag is not None:
+                parcel.bag = bag
+                update_fields.append("bag")
+            parcel.save(update_fields=update_fields)
 
             _advance_all_flows(parcel, pickup, now)
+            if bag is not None:
+                return f"1 скан: Товар зафиксирован на складе в Китае, мешок {bag.code}."
             return "1 скан: Товар зафиксирован на складе в Китае."
 
         # ===== 2 СКАН =====
@@ -202,32 +413,159 @@ def _process_staff_scan(user, track_number: str) -> str:
         if parcel.status == Parcel.Status.AT_PICKUP:
             return "2 скан уже был: посылка уже в пункте выдачи."
 
-        # ===== сообщение как на скрине =====
-        pp_name = (pickup.name if pickup else "").strip()
-        pp_addr = (pickup.address if pickup and pickup.address else "").strip()
-
-        title = "Товар прибыл в пункт выдачи"
-        if pp_name:
-            if pp_addr:
-                title += f" [{pp_name}, адрес: {pp_addr}]"
-            else:
-                title += f" [{pp_name}]"
-
-        msg_lines = [
-            title + ",",
-            f"трек-номер: {parcel.track_number},",
-        ]
-
-        # если адрес не попал в заголовок — добавим отдельной строкой
-        if pp_addr and "адрес:" not in title:
-            msg_lines.append(f"адрес: {pp_addr}")
-
-        msg = "\n".join(msg_lines)
+        msg = _pickup_message(pickup, parcel.track_number)
 
         _add_history_once(parcel, Parcel.Status.AT_PICKUP, msg, occurred_at=now)
 
+        old_status = parcel.status
         parcel.status = Parcel.Status.AT_PICKUP
         parcel.local_flow_stage = max(parcel.local_flow_stage or 0, 3)
-        parcel.save(update_fields=["status", "local_flow_stage"])
+        parcel.pickup_point = pickup
+        parcel.save(update_fields=["status", "local_flow_stage", "pickup_point"])
+        _status_changed(parcel, [(old_status, parcel.status, now)])
 
         return "2 скан: Товар прибыл в пункт выдачи."
+
+
+# ================== СКАН МЕШКА ==================
+
+
+def _cn_pending_stages(started_at, stage: int, now):
+    """
+    Наступившие, но не записанные этапы Китая — те же правила, что в
+    _advance_cn_flow: [(новый stage, статус события, статус посылки или None, текст, occurred_at)].
+    """
+    if not started_at:
+        return []
+    t0 = _norm_dt(started_at)
+    dt = _norm_dt(now) - t0
+    pending = []
+    if stage < 1 and dt.total_seconds() >= 0:
+        pending.append((1, Parcel.Status.AT_CN, Parcel.Status.AT_CN, CN_STAGE_1_MESSAGE, t0))
+    if stage < 2 and dt >= CN_STAGE_2_OFFSET:
+        pending.append((2, Parcel.Status.AT_CN, None, CN_STAGE_2_MESSAGE, t0 + CN_STAGE_2_OFFSET))
+    if stage < 3 and dt >= CN_STAGE_3_OFFSET:
+        pending.append((3, Parcel.Status.FROM_CN, Parcel.Status.FROM_CN, CN_STAGE_3_MESSAGE, t0 + CN_STAGE_3_OFFSET))
+    return pending
+
+
+@traced("scan.bag")
+def _process_bag_scan(user, bag_code: str) -> str:
+    """
+    Один скан мешка = скан каждой посылки в нём, но пачкой:
+      - ещё не сканированные -> 1-й скан (старт цепочки + наступившие этапы Китая);
+      - сканированные раньше чем STAFF_SECOND_SCAN_DELAY_HOURS назад -> 2-й скан (AT_PICKUP);
+      - остальные (рано / уже в ПВЗ / получены) пропускаются.
+    Всё в одной транзакции: UPDATE ... WHERE id IN (...) по группам и один
+    bulk_create истории, вместо сотен _process_staff_scan.
+    """
+    now = _norm_dt(timezone.now())
+    code = _sanitize_bag_code(bag_code)
+
+    profile = getattr(user, "cabinet_profile", None)
+    pickup = getattr(profile, "pickup_point", None)
+    ready_before = now - _get_second_scan_delay()
+
+    with transaction.atomic():
+        bag = Bag.objects.select_for_update().filter(code=code).first()
+        if bag is None:
+            raise ValueError(f"Мешок {code} не найден.")
+
+        with span("scan.bag.lock") as s:
+            members = list(
+                Parcel.objects.select_for_update()
+                .filter(bag=bag)
+                .order_by("id")
+                .values("id", "user_id", "track_number", "status", "auto_flow_started_at", "auto_flow_stage")
+            )
+            if s is not None:
+                s.set(members=len(members))
+        if not members:
+            raise ValueError(f"Мешок {code} пуст.")
+
+        first, second, skipped = [], [], 0
+        for m in members:
+            if m["status"] in (Parcel.Status.AT_PICKUP, Parcel.Status.RECEIVED):
+                skipped += 1
+            elif m["auto_flow_started_at"] is None:
+                first.append(m)
+            elif _norm_dt(m["auto_flow_started_at"]) <= ready_before:
+                second.append(m)
+            else:
+                skipped += 1
+
+        history = []
+        cn_updates = {}  # (status, stage) -> [id]
+        moves = {}  # (user_id, старый статус, новый) -> n, для счётчиков
+        events = []  # outbox
+
+        if first:
+            Parcel.objects.filter(pk__in=[m["id"] for m in first]).update(
+                auto_flow_started_at=now,
+                auto_flow_stage=0,
+                local_flow_started_at=now,
+                local_flow_stage=0,
+            )
+            for m in first:
+                m["auto_flow_started_at"] = now
+                m["auto_flow_stage"] = 0
+
+        # этапы Китая, которые уже наступили (как _advance_cn_flow, но без запросов на посылку)
+        second_ids = {m["id"] for m in second}
+        for m in first + second:
+            status, stage = m["status"], m["auto_flow_stage"]
+            for new_stage, event_status, new_status, message, occurred_at in _cn_pending_stages(
+                m["auto_flow_started_at"], stage, now
+            ):
+                history.append(_history_row(m["id"], event_status, message, occurred_at))
+                stage = new_stage
+                if new_status is not None and new_status != status:
+                    events.append(make_event(m["id"], m["track_number"], m["user_id"], status, new_status, occurred_at))
+                    status = new_status
+            if (status, stage) != (m["status"], m["auto_flow_stage"]):
+                cn_updates.setdefault((status, stage), []).append(m["id"])
+            final = Parcel.Status.AT_PICKUP if m["id"] in second_ids else status
+            key = (m["user_id"], m["status"], final)
+            moves[key] = moves.get(key, 0) + 1
+
+        for m in second:
+            history.append(
+                _history_row(m["id"], Parcel.Status.AT_PICKUP, _pickup_message(pickup, m["track_number"]), now)
+            )
+        # статус 2-го скана — после этапов Китая, как в _process_staff_scan
+        cn_status = {pk: status for (status, _), ids in cn_updates.items() for pk in ids}
+        for m in second:
+            events.append(
+                make_event(
+                    m["id"], m["track_number"], m["user_id"],
+                    cn_status.get(m["id"], m["status"]), Parcel.Status.AT_PICKUP, now,
+                )
+            )
+
+        with span("scan.bag.write", history_rows=len(history)):
+            _bulk_add_history(history)
+            for (status, stage), ids in cn_updates.items():
+                Parcel.objects.filter(pk__in=ids).update(status=status, auto_flow_stage=stage)
+            if second:
+                Parcel.objects.filter(pk__in=[m["id"] for m in second]).update(
+                    status=Parcel.Status.AT_PICKUP,
+                    local_flow_stage=Greatest("local_flow_stage", 3),
+                    pickup_point=pickup,
+                )
+            record_moves(moves)
+            emit(events)
+
+        bag_fields = []
+        if first and bag.first_scanned_at is None:
+            bag.first_scanned_at = now
+            bag_fields.append("first_scanned_at")
+        if second:
+            bag.second_scanned_at = now
+            bag_fields.append("second_scanned_at")
+        if bag_fields:
+            bag.save(update_fields=bag_fields)
+
+    return (
+        f"Мешок {code}: 1 скан — {len(first)}, 2 скан — {len(second)}, "
+        f"пропущено — {skipped} (всего {len(members)})."
+    )
@@ -0,0 +1,99 @@
+"""
+Общие помощники для бенчмарков (команды bench_*).
+"""
+import math
+import time
+
+
+def percentile(sorted_values, q: float) -> float:
+    """
+    Перцентиль методом ближайшего ранга. sorted_values — уже отсортирован.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, wall_seconds: float | None = None) -> dict:
+    """
+    Сводка по списку задержек в секундах: миллисекунды + RPS, если задано общее время.
+    """
+    values = sorted(latencies)
+    n = len(values)
+    result = {
+        "count": n,
+        "min_ms": round(values[0] * 1000, 3) if n else 0.0,
+        "mean_ms": round(sum(values) / n * 1000, 3) if n else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if n else 0.0,
+    }
+    if wall_seconds:
+        result["rps"] = round(n / wall_seconds, 1)
+    return result
+
+
+def format_row(name: str, stats: dict) -> str:
+    line = (
+        f"{name:<40} n={stats['count']:<6} "
+        f"p50={stats['p50_ms']:>9.2f}ms p95={stats['p95_ms']:>9.2f}ms "
+        f"p99={stats['p99_ms']:>9.2f}ms max={stats['max_ms']:>9.2f}ms"
+    )
+    if "rps" in stats:
+        line += f" rps={stats['rps']:>8.1f}"
+    return line
+
+
+class QueryCounter:
+    """
+    Считает запросы и их суммарное время на соединении через execute_wrapper.
+    Легче, чем CaptureQueriesContext: SQL не сохраняется.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.count = 0
+        self.seconds = 0.0
+        self._cm = None
+
+    def __call__(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - t0
+
+    def __enter__(self):
+        self._cm = self.connection.execute_wrapper(self)
+        self._cm.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cm.__exit__(*exc)
+
+
+def measure(func, iterations: int, connection, warmup: int = 1, setup=None) -> dict:
+    """
+    Запускает func(arg) iterations раз; возвращает summarize() + число запросов.
+    arg — результат setup(i) (подготовка в замер не входит) или None.
+    """
+    for i in range(warmup):
+        func(setup(-1 - i) if setup else None)
+
+    latencies = []
+    queries = []
+    for i in range(iterations):
+        arg = setup(i) if setup else None
+        with QueryCounter(connection) as qc:
+            t0 = time.perf_counter()
+            func(arg)
+            latencies.append(time.perf_counter() - t0)
+        queries.append(qc.count)
+
+    stats = summarize(latencies)
+    stats["queries_mean"] = round(sum(queries) / len(queries), 2) if queries else 0.0
+    stats["queries_max"] = max(queries) if queries else 0
+    return stats
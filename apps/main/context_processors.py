@@ -1,11 +1,12 @@
-from .models import SiteSettings
+from .refcache import get_site_settings
 
 
 def site_settings(request):
     """
     Добавляет в контекст переменную site_settings во все шаблоны.
+    Берётся из кэша справочников, без запроса к БД на каждый рендер.
     """
-    settings_obj = SiteSettings.objects.first()
+    settings_obj = get_site_settings()
     return {
         "site_settings": settings_obj,
     }
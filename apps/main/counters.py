@@ -0,0 +1,164 @@
+"""
+Счётчики посылок пользователя по статусам (UserStatusCounter).
+
+Любое место, где у посылки с владельцем меняется статус или владелец,
+сообщает об этом через status_changed()/record_moves() — в той же
+транзакции, уже после записи самой посылки. Счётчик правится через
+UPDATE ... SET x = x + 1; если строки ещё нет, она считается с нуля по
+таблице посылок (значит, уже с учётом этой смены).
+
+Внутри deferred() перемещения копятся и пишутся одним UPDATE на
+пользователя при выходе — так пачка process_parcel_flows не делает по
+запросу на каждую посылку. Пользователи обновляются по возрастанию id,
+чтобы параллельные пачки не ловили взаимную блокировку.
+"""
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Parcel, UserStatusCounter
+
+STATUS_FIELDS = {
+    Parcel.Status.WAITING_CN: "waiting_cn",
+    Parcel.Status.AT_CN: "at_cn",
+    Parcel.Status.FROM_CN: "from_cn",
+    Parcel.Status.AT_PICKUP: "at_pickup",
+    Parcel.Status.RECEIVED: "received",
+}
+
+# Накопитель deferred(): Counter{(user_id, old, new): n} или None
+_pending = ContextVar("main_status_moves", default=None)
+
+
+def status_changed(user_id, old_status, new_status, n: int = 1) -> None:
+    """
+    Посылка пользователя user_id перешла old_status -> new_status.
+    None вместо статуса — посылка появилась у пользователя / ушла от него.
+    """
+    if user_id is None or old_status == new_status:
+        return
+    record_moves({(user_id, old_status, new_status): n})
+
+
+def record_moves(moves) -> None:
+    """
+    moves: {(user_id, old_status, new_status): n} — пачка перемещений.
+    """
+    pending = _pending.get()
+    if pending is not None:
+        pending.update(moves)
+        return
+    _apply(moves)
+
+
+@contextmanager
+def deferred():
+    """
+    Копит перемещения до конца блока и применяет их разом.
+    Использовать внутри той же транзакции, что и изменения посылок.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    moves = Counter()
+    token = _pending.set(moves)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    _apply(moves)
+
+
+def _apply(moves) -> None:
+    deltas = defaultdict(Counter)
+    for (user_id, old, new), n in moves.items():
+        if user_id is None or old == new or not n:
+            continue
+        if old in STATUS_FIELDS:
+            deltas[user_id][STATUS_FIELDS[old]] -= n
+        if new in STATUS_FIELDS:
+            deltas[user_id][STATUS_FIELDS[new]] += n
+
+    now = timezone.now()
+    for user_id in sorted(deltas):
+        delta = {field: F(field) + d for field, d in deltas[user_id].items() if d}
+        if not delta:
+            continue
+        if UserStatusCounter.objects.filter(pk=user_id).update(updated_at=now, **delta):
+            continue
+        try:
+            with transaction.atomic():
+                UserStatusCounter.objects.create(user_id=user_id, **_count_from_parcels(user_id))
+        except IntegrityError:
+            # строку только что создал параллельный запрос — по своим данным, без нашей смены
+            UserStatusCounter.objects.filter(pk=user_id).update(updated_at=now, **delta)
+
+
+def _count_from_parcels(user_id) -> dict:
+    counts = {field: 0 for field in STATUS_FIELDS.values()}
+    for row in Parcel.objects.filter(user_id=user_id).values("status").annotate(c=Count("id")).order_by():
+        field = STATUS_FIELDS.get(row["status"])
+        if field:
+            counts[field] = row["c"]
+    return counts
+
+
+def get_status_counts(user_id) -> dict:
+    """
+    {status: count} для пользователя: одно чтение по PK, при отсутствии
+    строки — подсчёт по посылкам и создание строки.
+    """
+    row = UserStatusCounter.objects.filter(pk=user_id).values(*STATUS_FIELDS.values()).first()
+    if row is None:
+        row = _count_from_parcels(user_id)
+        try:
+            with transaction.atomic():
+                UserStatusCounter.objects.create(user_id=user_id, **row)
+        except IntegrityError:
+            pass
+    return {status: row[field] for status, field in STATUS_FIELDS.items()}
+
+
+def rebuild_status_counters(user_ids=None, batch_size: int = 5000) -> int:
+    """
+    Пересчитывает счётчики по таблице посылок (всех пользователей или
+    user_ids): удаление и bulk_create одной транзакцией. Возвращает число строк.
+    """
+    parcels = Parcel.objects.filter(user__isnull=False)
+    counters = UserStatusCounter.objects.all()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        parcels = parcels.filter(user_id__in=user_ids)
+        counters = counters.filter(pk__in=user_ids)
+
+    grouped = (
+        parcels.values("user_id", "status")
+        .annotate(c=Count("id"))
+        .order_by("user_id")
+        .iterator(chunk_size=batch_size)
+    )
+
+    written = 0
+    with transaction.atomic():
+        counters.delete()
+        batch = []
+        current = None
+        for row in grouped:
+            if current is None or current.user_id != row["user_id"]:
+                if len(batch) >= batch_size:
+                    UserStatusCounter.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+                current = UserStatusCounter(user_id=row["user_id"])
+                batch.append(current)
+            field = STATUS_FIELDS.get(row["status"])
+            if field:
+                setattr(current, field, row["c"])
+        if batch:
+            UserStatusCounter.objects.bulk_create(batch)
+            written += len(batch)
+    return written
@@ -0,0 +1,174 @@
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Сессия «приклеивается» к основной БД до этого момента (unix time),
+# чтобы клиент сразу после записи видел свои же изменения.
+PIN_SESSION_KEY = "_db_primary_until"
+
+# Алиас, с которого сейчас разрешено читать (ставит декоратор replica_reads).
+_read_alias = ContextVar("main_db_read_alias", default=None)
+
+# Состояние текущего запроса: была ли запись. Словарь, а не bool,
+# чтобы изменения были видны и из sync_to_async-потоков.
+_request_state = ContextVar("main_db_request_state", default=None)
+
+
+def _replica_alias():
+    alias = getattr(settings, "REPLICA_DATABASE_ALIAS", "replica")
+    return alias if alias in connections.databases else None
+
+
+def _sticky_seconds() -> float:
+    return float(getattr(settings, "REPLICA_STICKY_SECONDS", 10))
+
+
+def _mark_write():
+    state = _request_state.get()
+    if state is not None:
+        state["wrote"] = True
+
+
+def _wrote_in_request() -> bool:
+    state = _request_state.get()
+    return bool(state and state.get("wrote"))
+
+
+class ReplicaRouter:
+    """
+    Чтение идёт на реплику только внутри view с @replica_reads.
+    Всё остальное (сканы, админка, команды) — на основную БД.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if not alias or _wrote_in_request():
+            return DEFAULT_DB_ALIAS
+        # сессии всегда читаем с основной: свежий логин может ещё не доехать до реплики
+        if model._meta.app_label == "sessions":
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        _mark_write()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        allowed = {DEFAULT_DB_ALIAS, _replica_alias()}
+        if obj1._state.db in allowed and obj2._state.db in allowed:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # реплика получает схему репликацией, а не миграциями
+        if db == _replica_alias():
+            return False
+        return None
+
+
+def _pinned_until_is_active(until) -> bool:
+    return bool(until and until > time.time())
+
+
+def _should_use_replica(request) -> bool:
+    if request.method not in ("GET", "HEAD"):
+        return False
+    session = getattr(request, "session", None)
+    if session is None:
+        return True
+    return not _pinned_until_is_active(session.get(PIN_SESSION_KEY))
+
+
+async def _ashould_use_replica(request) -> bool:
+    if request.method not in ("GET", "HEAD"):
+        return False
+    session = getattr(request, "session", None)
+    if session is None:
+        return True
+    return not _pinned_until_is_active(await session.aget(PIN_SESSION_KEY))
+
+
+def replica_reads(view_func):
+    """
+    Отправляет чтения view на реплику (если она настроена).
+    Не действует для POST и для сессий, недавно писавших в БД.
+    """
+    if iscoroutinefunction(view_func):
+
+        async def _wrapped(request, *args, **kwargs):
+            alias = _replica_alias()
+            if not alias or not await _ashould_use_replica(request):
+                return await view_func(request, *args, **kwargs)
+            token = _read_alias.set(alias)
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+
+        markcoroutinefunction(_wrapped)
+    else:
+
+        def _wrapped(request, *args, **kwargs):
+            alias = _replica_alias()
+            if not alias or not _should_use_replica(request):
+                return view_func(request, *args, **kwargs)
+            token = _read_alias.set(alias)
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+
+    return wraps(view_func)(_wrapped)
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Отслеживает записи в БД за запрос и после записи «приклеивает»
+    сессию к основной БД на REPLICA_STICKY_SECONDS (read-your-writes).
+    Должен стоять после SessionMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        state = {"wrote": False}
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        self._pin_after_write(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state = {"wrote": False}
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+
+        if self._needs_pin(request, state):
+            await request.session.aset(PIN_SESSION_KEY, time.time() + _sticky_seconds())
+        return response
+
+    def _needs_pin(self, request, state) -> bool:
+        return state["wrote"] and _replica_alias() is not None and hasattr(request, "session")
+
+    def _pin_after_write(self, request, state):
+        if self._needs_pin(request, state):
+            request.session[PIN_SESSION_KEY] = time.time() + _sticky_seconds()
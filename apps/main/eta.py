@@ -0,0 +1,229 @@
+"""
+Оценка даты прибытия посылки в ПВЗ по статистике TransitStat.
+
+update_transit_stats() читает только новые строки ParcelHistory со
+статусом AT_PICKUP — после JobWatermark("transit_stats").last_id, с тем
+же запасом ROLLUP_SAFETY_SECONDS, что и сводки дашборда, — и добавляет
+время в пути в почасовые гистограммы (по ПВЗ и общую), затем
+пересчитывает перцентили затронутых строк.
+
+Гистограммы не копятся вечно: вес посылки убывает вдвое за
+ETA_HALF_LIFE_DAYS от её прибытия (occurred_at, а не времени запуска —
+поэтому пересборка с нуля даёт те же веса), и окно следует за текущими
+сроками доставки.
+
+Время отправки из Китая не читается из истории: этап FROM_CN всегда
+ставится на auto_flow_started_at + CN_STAGE_3_OFFSET (см. _advance_cn_flow).
+
+Вся таблица — две строки на ПВЗ, поэтому при показе посылки она берётся
+целиком из refcache (get_transit_stats) и на запрос не тратится SQL.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .auto_status import CN_STAGE_3_OFFSET
+from .models import JobWatermark, Parcel, ParcelHistory, TransitStat
+
+JOB_NAME = "transit_stats"
+BATCH_SIZE = 5000
+
+BUCKET_SECONDS = 3600
+# всё, что дольше 60 дней, — в последнюю корзину
+MAX_BUCKET = 60 * 24
+
+# вес корзины меньше этого выбрасывается из гистограммы
+MIN_WEIGHT = 0.001
+
+# от какого статуса считаем время до ПВЗ
+STAGES = (Parcel.Status.AT_CN, Parcel.Status.FROM_CN)
+
+
+def _safety_seconds() -> float:
+    return float(getattr(settings, "ROLLUP_SAFETY_SECONDS", 120))
+
+
+def _min_samples() -> int:
+    return int(getattr(settings, "ETA_MIN_SAMPLES", 20))
+
+
+def _half_life_seconds() -> float:
+    return float(getattr(settings, "ETA_HALF_LIFE_DAYS", 30)) * 86400
+
+
+def _decay(seconds: float) -> float:
+    return 0.5 ** (seconds / _half_life_seconds())
+
+
+def _stage_start(stage, started_at):
+    if stage == Parcel.Status.FROM_CN:
+        return started_at + CN_STAGE_3_OFFSET
+    return started_at
+
+
+def _aggregate(rows):
+    """
+    Строки истории AT_PICKUP -> {(pickup_point_id, stage): [(occurred_at, корзина)]}.
+    """
+    acc = defaultdict(list)
+    for row in rows:
+        started = row["parcel__auto_flow_started_at"]
+        if started is None:
+            continue
+        for stage in STAGES:
+            seconds = (row["occurred_at"] - _stage_start(stage, started)).total_seconds()
+            if seconds < 0:
+                continue
+            bucket = min(int(seconds // BUCKET_SECONDS), MAX_BUCKET)
+            acc[(row["parcel__pickup_point_id"], stage)].append((row["occurred_at"], bucket))
+            if row["parcel__pickup_point_id"] is not None:
+                acc[(None, stage)].append((row["occurred_at"], bucket))
+    return acc
+
+
+def _percentile(histogram: dict, total: float, q: float):
+    """
+    Верхняя граница корзины, в которую попадает q-я доля веса, в секундах.
+    """
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for bucket in sorted(histogram, key=int):
+        seen += histogram[bucket]
+        if seen >= target:
+            return (int(bucket) + 1) * BUCKET_SECONDS
+    return (MAX_BUCKET + 1) * BUCKET_SECONDS
+
+
+def _merge(acc) -> None:
+    """
+    Прибавляет посылки пачки к TransitStat и пересчитывает перцентили.
+    Гистограмма приводится к самому позднему прибытию (decayed_to), каждая
+    посылка входит с весом по давности относительно него.
+    Строк мало (ПВЗ × этапы), поэтому читаются все сразу.
+    """
+    now = timezone.now()
+    existing = {(r.pickup_point_id, r.stage): r for r in TransitStat.objects.all()}
+    to_update, to_create = [], []
+    for (point_id, stage), arrivals in acc.items():
+        row = existing.get((point_id, stage))
+        if row is None:
+            row = TransitStat(pickup_point_id=point_id, stage=stage, histogram={})
+            to_create.append(row)
+        else:
+            to_update.append(row)
+        ref = max(t for t, _ in arrivals)
+        if row.decayed_to is not None and row.decayed_to > ref:
+            ref = row.decayed_to
+        # ключи JSON — строки
+        weights = Counter({bucket: float(w) for bucket, w in row.histogram.items()})
+        if row.decayed_to is not None and ref > row.decayed_to:
+            factor = _decay((ref - row.decayed_to).total_seconds())
+            weights = Counter({bucket: w * factor for bucket, w in weights.items()})
+        for t, bucket in arrivals:
+            weights[str(bucket)] += _decay((ref - t).total_seconds())
+        # совсем старое уже ни на что не влияет
+        row.histogram = {bucket: round(w, 4) for bucket, w in weights.items() if w >= MIN_WEIGHT}
+        row.decayed_to = ref
+        total = sum(row.histogram.values())
+        row.samples = round(total)
+        row.p50_seconds = _percentile(row.histogram, total, 0.5)
+        row.p90_seconds = _percentile(row.histogram, total, 0.9)
+        # bulk_update не трогает auto_now
+        row.updated_at = now
+    if to_update:
+        TransitStat.objects.bulk_update(
+            to_update, ["samples", "histogram", "decayed_to", "p50_seconds", "p90_seconds", "updated_at"]
+        )
+    if to_create:
+        TransitStat.objects.bulk_create(to_create)
+
+
+def update_transit_stats(batch_size: int = BATCH_SIZE, max_batches: int | None = None, on_batch=None) -> dict:
+    """
+    Догоняет статистику до текущего момента (минус запас); каждая пачка —
+    одна транзакция со сдвигом водяного знака. Возвращает {"rows", "batches", "last_id"}.
+    """
+    rows_total = 0
+    batches = 0
+    last_id = 0
+    done = False
+
+    while not done and (max_batches is None or batches < max_batches):
+        cutoff = timezone.now() - timedelta(seconds=_safety_seconds())
+        with transaction.atomic():
+            mark, _ = JobWatermark.objects.select_for_update().get_or_create(name=JOB_NAME)
+            # водяной знак двигаем по всем строкам, а AT_PICKUP отбираем уже в памяти:
+            # фильтр по статусу в SQL заставил бы сканировать историю до конца ради пустой пачки
+            rows = list(
+                ParcelHistory.objects.filter(id__gt=mark.last_id)
+                .order_by("id")
+                .values("id", "status", "occurred_at", "created_at", "parcel__pickup_point_id",
+                        "parcel__auto_flow_started_at")[:batch_size]
+            )
+            for i, row in enumerate(rows):
+                if row["created_at"] > cutoff:
+                    rows = rows[:i]
+                    done = True
+                    break
+            if len(rows) < batch_size:
+                done = True
+            if rows:
+                acc = _aggregate(r for r in rows if r["status"] == Parcel.Status.AT_PICKUP)
+                if acc:
+                    _merge(acc)
+                mark.last_id = rows[-1]["id"]
+                mark.save(update_fields=["last_id", "updated_at"])
+            last_id = mark.last_id
+
+        if rows:
+            batches += 1
+            rows_total += len(rows)
+            if on_batch is not None:
+                on_batch(batches, rows_total, last_id)
+
+    return {"rows": rows_total, "batches": batches, "last_id": last_id}
+
+
+def reset_transit_stats() -> None:
+    with transaction.atomic():
+        TransitStat.objects.all().delete()
+        JobWatermark.objects.filter(name=JOB_NAME).delete()
+
+
+def load_stats() -> dict:
+    """
+    {(pickup_point_id, stage): (p50_seconds, p90_seconds, samples)} — для refcache.
+    """
+    return {
+        (r["pickup_point_id"], r["stage"]): (r["p50_seconds"], r["p90_seconds"], r["samples"])
+        for r in TransitStat.objects.filter(samples__gt=0).values(
+            "pickup_point_id", "stage", "p50_seconds", "p90_seconds", "samples"
+        )
+    }
+
+
+def parcel_eta(stats: dict, status, started_at, pickup_point_id=None):
+    """
+    Окно прибытия посылки в пути: {"from", "to", "samples"} (медиана и
+    90-й перцентиль от начала этапа) или None. Если по ПВЗ мало посылок
+    (ETA_MIN_SAMPLES) — по всем ПВЗ.
+    """
+    if status not in STAGES or started_at is None:
+        return None
+    entry = stats.get((pickup_point_id, status)) if pickup_point_id is not None else None
+    if entry is None or entry[2] < _min_samples():
+        entry = stats.get((None, status))
+    if entry is None or entry[2] < _min_samples():
+        return None
+    p50, p90, samples = entry
+    start = _stage_start(status, started_at)
+    return {
+        "from": (start + timedelta(seconds=p50)).isoformat(),
+        "to": (start + timedelta(seconds=p90)).isoformat(),
+        "samples": samples,
+    }
@@ -0,0 +1,286 @@
+"""
+Асинхронный HTTP-генератор нагрузки для команды load_test.
+
+Только stdlib: asyncio-соединения HTTP/1.1 с keep-alive, свои cookie и CSRF.
+Виртуальный пользователь выбирает сценарий по весам и гоняет его до конца
+теста; каждый запрос записывается под именем эндпоинта.
+"""
+import asyncio
+import random
+import re
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from .bench import summarize
+
+HISTORY_URL_RE = re.compile(r'data-history-url="([^"]+)"')
+
+
+class HttpError(Exception):
+    pass
+
+
+class HttpClient:
+    """
+    Одно keep-alive соединение + cookie jar. Не потокобезопасен — один на виртуального пользователя.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        parts = urlsplit(base_url)
+        if parts.scheme != "http":
+            raise ValueError("Поддерживается только http://")
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.host_header = parts.netloc
+        self.timeout = timeout
+        self.cookies = {}
+        self._reader = None
+        self._writer = None
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self._reader = self._writer = None
+
+    async def _connect(self):
+        if self._writer is None or self._writer.is_closing():
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method: str, path: str, data: dict | None = None, headers: dict | None = None):
+        """
+        Возвращает (status, headers, body). Один повтор при оборванном keep-alive.
+        """
+        for attempt in (1, 2):
+            await self._connect()
+            try:
+                return await asyncio.wait_for(self._roundtrip(method, path, data, headers), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if attempt == 2:
+                    raise
+
+    async def _roundtrip(self, method, path, data, headers):
+        body = urlencode(data).encode() if data is not None else b""
+        lines = [
+            f"{method} {path} HTTP/1.1",
+            f"Host: {self.host_header}",
+            "Connection: keep-alive",
+            "User-Agent: kargo-load-test",
+        ]
+        if self.cookies:
+            lines.append("Cookie: " + "; ".join(f"{k}={v}" for k, v in self.cookies.items()))
+        if data is not None:
+            lines.append("Content-Type: application/x-www-form-urlencoded")
+        if body or method == "POST":
+            lines.append(f"Content-Length: {len(body)}")
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+
+        self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        resp_headers = {}
+        while True:
+            line = await self._reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name = name.strip().lower()
+            value = value.strip()
+            if name == "set-cookie":
+                cookie = SimpleCookie()
+                cookie.load(value)
+                for key, morsel in cookie.items():
+                    if morsel.value:
+                        self.cookies[key] = morsel.value
+                    else:
+                        self.cookies.pop(key, None)
+            resp_headers[name] = value
+
+        if resp_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self._reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    await self._reader.readuntil(b"\r\n")
+                    break
+                chunks.append(await self._reader.readexactly(size))
+                await self._reader.readexactly(2)
+            resp_body = b"".join(chunks)
+        elif "content-length" in resp_headers:
+            resp_body = await self._reader.readexactly(int(resp_headers["content-length"]))
+        else:
+            resp_body = await self._reader.read()
+            await self.close()
+
+        if resp_headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, resp_headers, resp_body
+
+    async def login(self, phone: str, password: str):
+        """
+        Логин через форму: GET выдаёт csrftoken-cookie, POST отправляет его обратно.
+        """
+        await self.request("GET", "/login/")
+        token = self.cookies.get("csrftoken", "")
+        status, headers, _ = await self.request(
+            "POST",
+            "/login/",
+            {"phone": phone, "password": password, "csrfmiddlewaretoken": token},
+            {"Referer": f"http://{self.host_header}/login/"},
+        )
+        if status != 302 or "/login/" in headers.get("location", ""):
+            raise HttpError(f"Не удалось войти как {phone} (HTTP {status}).")
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+
+    def record(self, endpoint: str, seconds: float, status: int):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        per_status = self.statuses.setdefault(endpoint, {})
+        per_status[status] = per_status.get(status, 0) + 1
+
+    def record_error(self, endpoint: str, exc: Exception):
+        key = f"{endpoint}: {type(exc).__name__}"
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def report(self, wall_seconds: float) -> dict:
+        endpoints = {}
+        for name, values in sorted(self.latencies.items()):
+            stats = summarize(values, wall_seconds)
+            stats["statuses"] = {str(k): v for k, v in sorted(self.statuses[name].items())}
+            endpoints[name] = stats
+        all_values = [v for values in self.latencies.values() for v in values]
+        return {
+            "wall_seconds": round(wall_seconds, 2),
+            "total": summarize(all_values, wall_seconds),
+            "endpoints": endpoints,
+            "errors": self.errors,
+        }
+
+
+async def _timed(client, stats, endpoint, method, path, data=None, headers=None):
+    t0 = time.perf_counter()
+    try:
+        status, _headers, body = await client.request(method, path, data, headers)
+    except (OSError, asyncio.TimeoutError, HttpError, asyncio.IncompleteReadError) as exc:
+        stats.record_error(endpoint, exc)
+        return None, b""
+    stats.record(endpoint, time.perf_counter() - t0, status)
+    return status, body
+
+
+class Scenarios:
+    """
+    Профили нагрузки. Каждый метод — один «виток» виртуального пользователя.
+    """
+
+    def __init__(self, base_url, stats, tracks, customers, staff, password, think_time, rnd):
+        self.base_url = base_url
+        self.stats = stats
+        self.tracks = tracks
+        self.customers = customers
+        self.staff = staff
+        self.password = password
+        self.think_time = think_time
+        self.rnd = rnd
+        self.scan_seq = 0
+
+    async def _think(self):
+        if self.think_time:
+            await asyncio.sleep(self.rnd.uniform(0, self.think_time * 2))
+
+    async def scan_burst(self, client, deadline):
+        """
+        Сотрудник сканирует пачку треков подряд: половина новых (1-й скан), половина известных.
+        """
+        if not self.staff:
+            return
+        await client.login(self.rnd.choice(self.staff), self.password)
+        await _timed(client, self.stats, "staff_parcels GET", "GET", "/staff/parcels/")
+        for _ in range(self.rnd.randint(10, 40)):
+            if time.monotonic() >= deadline:
+                break
+            self.scan_seq += 1
+            if self.tracks and self.rnd.random() < 0.5:
+                track = self.rnd.choice(self.tracks)
+            else:
+                track = f"LT{int(time.time()) % 100000:05d}{self.scan_seq:07d}"
+            await _timed(
+                client,
+                self.stats,
+                "staff_parcels POST (scan)",
+                "POST",
+                "/staff/parcels/",
+                {"track_number": track, "csrfmiddlewaretoken": client.cookies.get("csrftoken", "")},
+                {"Referer": f"{self.base_url}/staff/parcels/"},
+            )
+
+    async def lookup_storm(self, client, deadline):
+        """
+        Анонимные клиенты опрашивают публичный трекинг.
+        """
+        if not self.tracks:
+            return
+        for _ in range(self.rnd.randint(5, 20)):
+            if time.monotonic() >= deadline:
+                break
+            track = self.rnd.choice(self.tracks)
+            await _timed(
+                client, self.stats, "track_public_lookup", "GET", f"/cabinet/api/track/public/?track={track}"
+            )
+            await self._think()
+
+    async def cabinet_browsing(self, client, deadline):
+        """
+        Клиент входит, открывает кабинет и несколько модалок истории.
+        """
+        if not self.customers:
+            return
+        await client.login(self.rnd.choice(self.customers), self.password)
+        for _ in range(self.rnd.randint(1, 4)):
+            if time.monotonic() >= deadline:
+                break
+            status, body = await _timed(client, self.stats, "cabinet_home", "GET", "/cabinet/")
+            urls = HISTORY_URL_RE.findall(body.decode("utf-8", "replace")) if status == 200 else []
+            for url in self.rnd.sample(urls, min(len(urls), self.rnd.randint(1, 3))):
+                await _timed(client, self.stats, "parcel_history", "GET", url)
+                await self._think()
+            await self._think()
+
+
+async def run_load(base_url, duration, users, weights, scenarios, seed=None):
+    """
+    users виртуальных пользователей в течение duration секунд; weights — {сценарий: вес}.
+    """
+    rnd = random.Random(seed)
+    names = [n for n, w in weights.items() if w > 0]
+    probs = [weights[n] for n in names]
+    deadline = time.monotonic() + duration
+
+    async def virtual_user(n):
+        while time.monotonic() < deadline:
+            name = rnd.choices(names, probs)[0]
+            client = HttpClient(base_url)
+            try:
+                await getattr(scenarios, name)(client, deadline)
+            except (OSError, asyncio.TimeoutError, HttpError, asyncio.IncompleteReadError) as exc:
+                scenarios.stats.record_error(name, exc)
+                await asyncio.sleep(0.5)
+            finally:
+                await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(n) for n in range(users)))
+    return scenarios.stats.report(time.perf_counter() - started)
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import AsyncClient, Client
+
+from apps.main.bench import format_row, summarize
+from apps.main.models import Parcel
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent throughput of the JSON endpoints "
+        "(public lookup, parcel history) through the WSGI and ASGI handlers in-process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000, help="Requests per handler.")
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--mode", choices=["wsgi", "asgi", "both"], default="both")
+        parser.add_argument("--json", dest="json_path", default="", help="Save results to this file.")
+
+    def handle(self, *args, **options):
+        owner_row = (
+            Parcel.objects.filter(user__isnull=False)
+            .values("user")
+            .annotate(c=Count("id"))
+            .order_by("-c")
+            .first()
+        )
+        if not owner_row:
+            raise CommandError("Нет посылок с владельцем — нечего бенчмаркать.")
+
+        owner_id = owner_row["user"]
+        own = list(Parcel.objects.filter(user_id=owner_id).values_list("id", "track_number")[:100])
+        tracks = list(Parcel.objects.values_list("track_number", flat=True)[:500])
+
+        login_client = Client()
+        login_client.force_login(Parcel.objects.get(pk=own[0][0]).user)
+        session_key = login_client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        paths = []
+        for i in range(options["requests"]):
+            kind = i % 3
+            if kind == 0:
+                paths.append(("track_public_lookup", f"/cabinet/api/track/public/?track={tracks[i % len(tracks)]}"))
+            elif kind == 1:
+                paths.append(("parcel_history", f"/cabinet/parcel/{own[i % len(own)][0]}/history/"))
+            else:
+                paths.append(("parcel_history_public", f"/cabinet/api/parcels/{own[i % len(own)][0]}/history-public/"))
+
+        results = {}
+        if options["mode"] in ("wsgi", "both"):
+            results["wsgi"] = self._run_wsgi(paths, session_key, options["concurrency"])
+        if options["mode"] in ("asgi", "both"):
+            results["asgi"] = asyncio.run(self._run_asgi(paths, session_key, options["concurrency"]))
+
+        for mode, res in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{mode.upper()} (concurrency={options['concurrency']})"))
+            self.stdout.write(format_row("total", res["total"]))
+            for name, stats in res["endpoints"].items():
+                self.stdout.write(format_row(name, stats))
+
+        if options["json_path"]:
+            with open(options["json_path"], "w", encoding="utf-8") as f:
+                json.dump(
+                    {"requests": options["requests"], "concurrency": options["concurrency"], "results": results},
+                    f,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+            self.stdout.write(self.style.SUCCESS(f"Saved: {options['json_path']}"))
+
+    def _collect(self, samples, wall):
+        by_endpoint = {}
+        for name, latency, _status in samples:
+            by_endpoint.setdefault(name, []).append(latency)
+        errors = sum(1 for _, _, status in samples if status >= 500)
+        return {
+            "total": summarize([s[1] for s in samples], wall),
+            "endpoints": {name: summarize(vals, wall) for name, vals in sorted(by_endpoint.items())},
+            "errors": errors,
+        }
+
+    def _run_wsgi(self, paths, session_key, concurrency):
+        local = threading.local()
+
+        def one(item):
+            name, path = item
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = Client()
+                client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+            t0 = time.perf_counter()
+            resp = client.get(path)
+            return name, time.perf_counter() - t0, resp.status_code
+
+        def close_thread_connections(_):
+            connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(one, paths))
+            list(pool.map(close_thread_connections, range(concurrency)))
+        return self._collect(samples, time.perf_counter() - started)
+
+    async def _run_asgi(self, paths, session_key, concurrency):
+        sem = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+        client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+
+        async def one(item):
+            name, path = item
+            async with sem:
+                t0 = time.perf_counter()
+                resp = await client.get(path)
+                return name, time.perf_counter() - t0, resp.status_code
+
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(one(item) for item in paths))
+        return self._collect(samples, time.perf_counter() - started)
@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.main.outbox import create_token
+
+
+class Command(BaseCommand):
+    help = (
+        "Create a change-feed API token and print it once (only its SHA-256 is stored). "
+        "--user limits the feed to that user's parcels."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("name")
+        parser.add_argument("--user", default=None, help="Username (phone) whose parcels the token may read.")
+
+    def handle(self, *args, **options):
+        user = None
+        if options["user"]:
+            user = get_user_model().objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"Пользователь {options['user']} не найден.")
+        token, raw = create_token(options["name"], user=user)
+        self.stdout.write(self.style.SUCCESS(f"Token #{token.pk} '{token.name}' created:"))
+        self.stdout.write(raw)
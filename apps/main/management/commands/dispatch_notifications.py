@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.main import slow_queries
+from apps.main.notifications import dispatch, get_provider
+
+
+class Command(BaseCommand):
+    help = (
+        "Send due customer notifications in coalesced batches through NOTIFY_PROVIDER. "
+        "Runs until the queue has nothing due; --loop keeps polling."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=None, help="Queue rows per pass (NOTIFY_BATCH_SIZE).")
+        parser.add_argument("--loop", action="store_true", help="Keep running, polling every --interval seconds.")
+        parser.add_argument("--interval", type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        provider = get_provider()
+        with slow_queries.source("command:dispatch_notifications"):
+            while True:
+                totals = {"notifications": 0, "messages": 0, "sent": 0, "retry": 0, "failed": 0}
+                while True:
+                    stats = dispatch(batch_size=options["batch"], provider=provider)
+                    for key, value in stats.items():
+                        totals[key] += value
+                    # неудачные отложены на будущее, так что пустой проход = созревших больше нет
+                    if not stats["notifications"]:
+                        break
+
+                if totals["notifications"] or options["verbosity"] >= 2:
+                    self.stdout.write(
+                        f"notifications {totals['notifications']} -> messages {totals['messages']}: "
+                        f"sent {totals['sent']}, retry {totals['retry']}, failed {totals['failed']}"
+                    )
+                if not options["loop"]:
+                    return
+                time.sleep(options["interval"])
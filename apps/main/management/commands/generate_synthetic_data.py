@@ -0,0 +1,225 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from apps.main.auto_status import (
+    CN_STAGE_1_MESSAGE,
+    CN_STAGE_2_MESSAGE,
+    CN_STAGE_2_OFFSET,
+    CN_STAGE_3_MESSAGE,
+    CN_STAGE_3_OFFSET,
+    _bulk_add_history,
+    _get_second_scan_delay,
+    _history_row,
+    _pickup_message,
+)
+from apps.main.counters import rebuild_status_counters
+from apps.main.models import CabinetProfile, Parcel, PickupPoint
+
+User = get_user_model()
+
+TRACK_PREFIX = "SYN"
+PHONE_PREFIX = "+99699"
+PICKUP_PREFIX = "SYN ПВЗ"
+RECEIVED_MESSAGE = "Посылка получена."
+
+DEFAULT_MIX = "waiting=5,at_cn=10,from_cn=40,at_pickup=30,received=15"
+MIX_KEYS = ("waiting", "at_cn", "from_cn", "at_pickup", "received")
+
+
+def _parse_mix(raw: str):
+    weights = {}
+    for part in (raw or "").split(","):
+        if not part.strip():
+            continue
+        key, _, value = part.partition("=")
+        key = key.strip()
+        if key not in MIX_KEYS:
+            raise CommandError(f"Неизвестный этап в --mix: {key}. Допустимо: {', '.join(MIX_KEYS)}")
+        weights[key] = float(value)
+    if not weights or sum(weights.values()) <= 0:
+        raise CommandError("--mix должен содержать хотя бы один положительный вес.")
+    return list(weights), list(weights.values())
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic users, profiles, parcels and history with a realistic stage mix "
+        "(e.g. --parcels 1000000 for ~3.3M history rows). Synthetic rows use the SYN prefix."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--employees", type=int, default=3)
+        parser.add_argument("--pickup-points", type=int, default=5)
+        parser.add_argument("--parcels", type=int, default=10000)
+        parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Stage weights, default: {DEFAULT_MIX}")
+        parser.add_argument(
+            "--owner-skew",
+            type=float,
+            default=3.0,
+            help="Higher value concentrates parcels on fewer heavy users (1 = uniform).",
+        )
+        parser.add_argument("--unowned-share", type=float, default=0.1)
+        parser.add_argument("--batch", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--clear", action="store_true", help="Delete previously generated SYN data first.")
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options["seed"])
+        stages, weights = _parse_mix(options["mix"])
+
+        if options["clear"]:
+            self._clear()
+
+        points = self._ensure_pickup_points(options["pickup_points"])
+        self._create_users(options["employees"], points, rnd, employees=True)
+        user_ids = self._create_users(options["users"], points, rnd, employees=False)
+        profiles = dict(
+            CabinetProfile.objects.filter(user_id__in=user_ids).values_list("user_id", "pickup_point_id")
+        )
+        points_by_id = {p.pk: p for p in points}
+
+        start = Parcel.objects.filter(track_number__startswith=TRACK_PREFIX).count()
+        total = options["parcels"]
+        batch = max(1, options["batch"])
+        now = timezone.now().replace(microsecond=0)
+        delay = _get_second_scan_delay()
+
+        started = time.perf_counter()
+        created_parcels = 0
+        created_events = 0
+
+        for offset in range(0, total, batch):
+            size = min(batch, total - offset)
+            plan = []
+            parcels = []
+            for i in range(start + offset, start + offset + size):
+                stage = rnd.choices(stages, weights)[0]
+                owner = None
+                if user_ids and rnd.random() >= options["unowned_share"]:
+                    idx = int(len(user_ids) * (rnd.random() ** options["owner_skew"]))
+                    owner = user_ids[min(idx, len(user_ids) - 1)]
+                parcel, timeline = self._build_parcel(i, stage, owner, now, delay, rnd)
+                if parcel.status < Parcel.Status.AT_PICKUP:
+                    parcel.destination_id = profiles.get(owner)
+                else:
+                    # как 2-й скан: ПВЗ, куда пришла посылка (у ничьей — любой из синтетических)
+                    parcel.pickup_point_id = profiles.get(owner) or (rnd.choice(points).pk if points else None)
+                parcels.append(parcel)
+                plan.append((owner, timeline))
+
+            with transaction.atomic():
+                Parcel.objects.bulk_create(parcels, batch_size=batch)
+                rows = []
+                for parcel, (owner, timeline) in zip(parcels, plan):
+                    pickup = points_by_id.get(parcel.pickup_point_id)
+                    for status, message, occurred_at in timeline:
+                        if message is None:
+                            message = _pickup_message(pickup, parcel.track_number)
+                        rows.append(_history_row(parcel.pk, status, message, occurred_at))
+                _bulk_add_history(rows, batch_size=batch)
+
+            created_parcels += size
+            created_events += len(rows)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"parcels {created_parcels}/{total}, history {created_events}, "
+                f"{created_parcels / elapsed:.0f} parcels/s"
+            )
+
+        # bulk_create идёт мимо счётчиков статусов — пересчитываем затронутых
+        rebuild_status_counters(user_ids)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created: users={len(user_ids)}, parcels={created_parcels}, history={created_events}"
+        ))
+
+    def _clear(self):
+        with transaction.atomic():
+            deleted_parcels, _ = Parcel.objects.filter(track_number__startswith=TRACK_PREFIX).delete()
+            deleted_users, _ = User.objects.filter(username__startswith=PHONE_PREFIX).delete()
+            PickupPoint.objects.filter(name__startswith=PICKUP_PREFIX).delete()
+        self.stdout.write(f"Cleared: {deleted_parcels} parcel rows, {deleted_users} user rows")
+
+    def _ensure_pickup_points(self, count):
+        existing = list(PickupPoint.objects.filter(name__startswith=PICKUP_PREFIX).order_by("id"))
+        missing = [
+            PickupPoint(name=f"{PICKUP_PREFIX} {n}", address=f"ул. Синтетическая, {n}")
+            for n in range(len(existing) + 1, count + 1)
+        ]
+        if missing:
+            PickupPoint.objects.bulk_create(missing)
+        return list(PickupPoint.objects.filter(name__startswith=PICKUP_PREFIX).order_by("id"))[:count]
+
+    def _create_users(self, count, points, rnd, employees: bool):
+        if count <= 0:
+            return []
+        password = make_password("synthetic")
+        start = User.objects.filter(username__startswith=PHONE_PREFIX).count()
+        users = [
+            User(username=f"{PHONE_PREFIX}{n:07d}", first_name=f"Синтетический {n}", password=password)
+            for n in range(start, start + count)
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=5000)
+            profiles = [
+                CabinetProfile(
+                    user_id=u.pk,
+                    full_name=u.first_name,
+                    phone=u.username,
+                    pickup_point=rnd.choice(points) if points else None,
+                    is_employee=employees,
+                )
+                for u in users
+            ]
+            CabinetProfile.objects.bulk_create(profiles, batch_size=5000)
+        return [u.pk for u in users]
+
+    def _build_parcel(self, n, stage, owner, now, delay, rnd):
+        """
+        Посылка и её события [(status, message, occurred_at)] для итогового этапа.
+        message=None у AT_PICKUP: текст зависит от пункта выдачи посылки.
+        """
+        parcel = Parcel(track_number=f"{TRACK_PREFIX}{n:012d}", user_id=owner)
+        if stage == "waiting":
+            return parcel, []
+
+        if stage == "at_cn":
+            t0 = now - timedelta(seconds=rnd.randint(0, int(CN_STAGE_3_OFFSET.total_seconds()) - 1))
+        elif stage == "from_cn":
+            t0 = now - CN_STAGE_3_OFFSET - timedelta(hours=rnd.randint(0, 24 * 12))
+        else:
+            t0 = now - delay - timedelta(hours=rnd.randint(24, 24 * 30))
+
+        timeline = [(Parcel.Status.AT_CN, CN_STAGE_1_MESSAGE, t0)]
+        parcel.status = Parcel.Status.AT_CN
+        parcel.auto_flow_stage = 1
+        if now - t0 >= CN_STAGE_2_OFFSET:
+            timeline.append((Parcel.Status.AT_CN, CN_STAGE_2_MESSAGE, t0 + CN_STAGE_2_OFFSET))
+            parcel.auto_flow_stage = 2
+
+        if stage in ("from_cn", "at_pickup", "received"):
+            timeline.append((Parcel.Status.FROM_CN, CN_STAGE_3_MESSAGE, t0 + CN_STAGE_3_OFFSET))
+            parcel.status = Parcel.Status.FROM_CN
+            parcel.auto_flow_stage = 3
+
+        if stage in ("at_pickup", "received"):
+            arrived = min(now, t0 + delay + timedelta(hours=rnd.randint(0, 24 * 10)))
+            timeline.append((Parcel.Status.AT_PICKUP, None, arrived))
+            parcel.status = Parcel.Status.AT_PICKUP
+            parcel.local_flow_stage = 3
+            if stage == "received":
+                received = min(now, arrived + timedelta(hours=rnd.randint(1, 24 * 7)))
+                timeline.append((Parcel.Status.RECEIVED, RECEIVED_MESSAGE, received))
+                parcel.status = Parcel.Status.RECEIVED
+
+        parcel.auto_flow_started_at = t0
+        parcel.local_flow_started_at = t0
+        return parcel, timeline
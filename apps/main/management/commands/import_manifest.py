@@ -0,0 +1,68 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.main import slow_queries
+from apps.main.manifest import CHUNK_SIZE, import_manifest, text_stream
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a CSV/TSV warehouse manifest, create missing parcels and start their CN flow in chunks "
+        "(same effect as the first staff scan). Use '-' to read stdin."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Manifest file (CSV/TSV, UTF-8) or '-' for stdin.")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        parser.add_argument("--encoding", default="utf-8-sig")
+        parser.add_argument(
+            "--rejects",
+            default=None,
+            help="Write rejected rows to this CSV (line, value, reason) instead of stderr.",
+        )
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size должен быть > 0.")
+
+        rejects_file = None
+        if options["rejects"]:
+            rejects_file = open(options["rejects"], "w", encoding="utf-8", newline="")
+            writer = csv.writer(rejects_file)
+            writer.writerow(["line", "value", "reason"])
+
+            def on_reject(line_no, value, reason):
+                writer.writerow([line_no, value, reason])
+        else:
+            def on_reject(line_no, value, reason):
+                self.stderr.write(f"line {line_no}: {value!r}: {reason}")
+
+        def on_progress(result):
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"{result.rows} rows, {result.rows_per_sec:.0f} rows/s")
+
+        try:
+            if options["path"] == "-":
+                source = text_stream(sys.stdin.buffer, options["encoding"])
+            else:
+                try:
+                    source = text_stream(open(options["path"], "rb"), options["encoding"])
+                except OSError as e:
+                    raise CommandError(str(e))
+
+            with source, slow_queries.source("command:import_manifest"):
+                result = import_manifest(
+                    source,
+                    chunk_size=options["chunk_size"],
+                    on_reject=on_reject,
+                    max_rejects=0,
+                    on_progress=on_progress,
+                )
+        finally:
+            if rejects_file is not None:
+                rejects_file.close()
+
+        style = self.style.SUCCESS if not result.rejected else self.style.WARNING
+        self.stdout.write(style(f"Manifest imported: {result.summary()}"))
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.main.bench import format_row
+from apps.main.http_load import LoadStats, Scenarios, run_load
+from apps.main.management.commands.generate_synthetic_data import PHONE_PREFIX
+from apps.main.models import CabinetProfile, Parcel
+
+User = get_user_model()
+
+PROFILES = {
+    # типичный день в пункте: сканы идут пачками, клиенты в основном смотрят статус
+    "mixed": {"scan_burst": 1, "lookup_storm": 6, "cabinet_browsing": 3},
+    "scan_burst": {"scan_burst": 1},
+    "lookup_storm": {"lookup_storm": 1},
+    "cabinet_browsing": {"cabinet_browsing": 1},
+}
+
+
+def _parse_weights(raw: str):
+    weights = {}
+    for part in raw.split(","):
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name not in PROFILES["mixed"]:
+            raise CommandError(f"Неизвестный сценарий: {name}")
+        weights[name] = float(value or 1)
+    return weights
+
+
+class Command(BaseCommand):
+    help = (
+        "Run an asyncio HTTP load test with weighted scenarios (scan bursts, public lookup storm, "
+        "cabinet browsing) against a running server; reports throughput and p50/p95/p99 per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--duration", type=float, default=60.0, help="Seconds.")
+        parser.add_argument("--users", type=int, default=50, help="Concurrent virtual users.")
+        parser.add_argument("--profile", choices=sorted(PROFILES), default="mixed")
+        parser.add_argument(
+            "--weights",
+            default="",
+            help="Custom scenario weights, e.g. scan_burst=1,lookup_storm=10 (overrides --profile).",
+        )
+        parser.add_argument("--password", default="synthetic", help="Password of the test accounts.")
+        parser.add_argument("--staff", nargs="*", default=None, help="Employee phones (default: synthetic employees).")
+        parser.add_argument("--customers", nargs="*", default=None, help="Customer phones (default: synthetic customers).")
+        parser.add_argument("--think-time", type=float, default=0.2, help="Mean pause between clicks, seconds.")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--json", dest="json_path", default="")
+
+    def handle(self, *args, **options):
+        weights = _parse_weights(options["weights"]) if options["weights"] else PROFILES[options["profile"]]
+
+        # учётки и треки берём из той же БД, что и сервер: синтетические
+        # аккаунты generate_synthetic_data с общим паролем
+        staff = options["staff"]
+        if staff is None:
+            staff = list(
+                CabinetProfile.objects.filter(is_employee=True, user__username__startswith=PHONE_PREFIX)
+                .values_list("user__username", flat=True)[:20]
+            )
+        customers = options["customers"]
+        if customers is None:
+            customers = list(
+                User.objects.filter(
+                    username__startswith=PHONE_PREFIX,
+                    parcels__isnull=False,
+                    cabinet_profile__is_employee=False,
+                )
+                .values_list("username", flat=True)
+                .distinct()[:500]
+            )
+        tracks = list(Parcel.objects.order_by("-id").values_list("track_number", flat=True)[:5000])
+
+        if weights.get("scan_burst") and not staff:
+            raise CommandError("Для scan_burst нужен хотя бы один сотрудник (--staff).")
+
+        scenarios = Scenarios(
+            base_url=options["url"].rstrip("/"),
+            stats=LoadStats(),
+            tracks=tracks,
+            customers=customers,
+            staff=staff,
+            password=options["password"],
+            think_time=options["think_time"],
+            rnd=random.Random(options["seed"]),
+        )
+
+        self.stdout.write(
+            f"Load test {options['url']}: {options['users']} users, {options['duration']}s, weights={weights}"
+        )
+        report = asyncio.run(
+            run_load(
+                options["url"].rstrip("/"),
+                options["duration"],
+                options["users"],
+                weights,
+                scenarios,
+                seed=options["seed"],
+            )
+        )
+
+        self.stdout.write(format_row("total", report["total"]))
+        for name, stats in report["endpoints"].items():
+            self.stdout.write(format_row(name, stats) + f" {stats['statuses']}")
+        for name, count in report["errors"].items():
+            self.stdout.write(self.style.WARNING(f"errors {name}: {count}"))
+
+        if options["json_path"]:
+            report["weights"] = weights
+            report["users"] = options["users"]
+            with open(options["json_path"], "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved: {options['json_path']}"))
@@ -1,20 +1,50 @@
-from datetime import timedelta
+import json
+import logging
+import time
 
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from django.db.models import Q
 from django.utils import timezone
 
+from apps.main import counters, metrics, outbox, profiling, slow_queries, tracing
 from apps.main.models import Parcel
-from apps.main.auto_status import _advance_cn_flow
+from apps.main.auto_status import _advance_cn_flow, _cn_due_q, _cn_flow_lag_seconds
+
+logger = logging.getLogger("apps.main.flows")
+
+BATCH_SIZE = 200
 
 
 class Command(BaseCommand):
     help = "Advance parcels flows by time (Postgres, CN only, 3 steps)."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Run under cProfile, save .prof/.txt to PROFILE_DIR and print the top functions.",
+        )
+        parser.add_argument("--profile-sort", choices=profiling.SORT_KEYS, default="cumulative")
+        parser.add_argument("--profile-top", type=int, default=None)
+
     def handle(self, *args, **options):
+        with slow_queries.source("command:process_parcel_flows"):
+            if not options["profile"]:
+                self._run(options)
+                return
+            with profiling.profiled("command:process_parcel_flows") as result:
+                self._run(options)
+            result.save()
+            self.stdout.write(result.summary(sort=options["profile_sort"], top=options["profile_top"]))
+
+    def _run(self, options):
         processed = 0
         changed_total = 0
+        history_total = 0
+        batches = 0
+        run_started = time.perf_counter()
+
+        lag_before = _cn_flow_lag_seconds(timezone.now())
 
         while True:
             now = timezone.now().replace(microsecond=0)
@@ -23,39 +53,87 @@ class Command(BaseCommand):
             # stage 1: сразу (t0)
             # stage 2: +10 секунд
             # stage 3: +2 дня
-            t10 = now - timedelta(seconds=10)
-            t2d = now - timedelta(days=2)
-
-            due_cn = (
-                Q(auto_flow_started_at__isnull=False)
-                & (
-                    Q(auto_flow_stage__lt=1)
-                    | (Q(auto_flow_stage__lt=2) & Q(auto_flow_started_at__lte=t10))
-                    | (Q(auto_flow_stage__lt=3) & Q(auto_flow_started_at__lte=t2d))
-                )
-            )
+            due_cn = _cn_due_q(now)
 
-            with transaction.atomic():
-                batch = list(
-                    Parcel.objects
-                    .filter(due_cn)
-                    .order_by("id")
-                    .select_for_update(skip_locked=True)[:200]
-                )
+            t_batch = time.perf_counter()
+            # каждая пачка — отдельная трасса (семплируется по TRACE_SAMPLE_RATE)
+            with tracing.trace("flows.batch") as batch_span, transaction.atomic():
+                with tracing.span("flows.lock"):
+                    batch = list(
+                        Parcel.objects
+                        .filter(due_cn)
+                        .order_by("id")
+                        .select_for_update(skip_locked=True)[:BATCH_SIZE]
+                    )
+                lock_wait = time.perf_counter() - t_batch
 
                 if not batch:
                     break
 
-                for p in batch:
-                    before_status = p.status
-                    before_stage = p.auto_flow_stage
+                t_advance = time.perf_counter()
+                changed = 0
+                history_rows = 0
+                # счётчики пользователей и outbox — одним UPDATE на пользователя
+                # и одним INSERT событий в конце пачки, в её же транзакции
+                with tracing.span("flows.advance"), counters.deferred(), outbox.deferred():
+                    for p in batch:
+                        before_status = p.status
+                        before_stage = p.auto_flow_stage
 
-                    _advance_cn_flow(p, now)
+                        history_rows += _advance_cn_flow(p, now)
 
-                    processed += 1
-                    if p.status != before_status or p.auto_flow_stage != before_stage:
-                        changed_total += 1
+                        processed += 1
+                        if p.status != before_status or p.auto_flow_stage != before_stage:
+                            changed += 1
+                            metrics.inc("kargo_flow_transitions_total", {"stage": str(p.auto_flow_stage)})
+                advance = time.perf_counter() - t_advance
+                if batch_span is not None:
+                    batch_span.set(size=len(batch), changed=changed, history_rows=history_rows)
+                t_commit = time.perf_counter()
+            commit = time.perf_counter() - t_commit
+
+            batches += 1
+            changed_total += changed
+            history_total += history_rows
+            self._record_batch(
+                {
+                    "batch": batches,
+                    "size": len(batch),
+                    "changed": changed,
+                    "history_rows": history_rows,
+                    "lock_wait_ms": round(lock_wait * 1000, 2),
+                    "advance_ms": round(advance * 1000, 2),
+                    "commit_ms": round(commit * 1000, 2),
+                },
+                options["verbosity"],
+            )
+
+        lag_after = _cn_flow_lag_seconds(timezone.now())
+        elapsed = time.perf_counter() - run_started
+        metrics.observe("kargo_flow_run_seconds", elapsed)
+        # /metrics и /health/flows/ берут отставание отсюда, а не считают на каждый опрос
+        metrics.set_gauge("kargo_flow_lag_seconds", lag_after)
+        metrics.set_gauge("kargo_flow_last_run_timestamp_seconds", time.time())
+        metrics.set_gauge("kargo_flow_last_run_processed", processed, flush=True)
 
         self.stdout.write(self.style.SUCCESS(
-            f"Processed: {processed}, Changed: {changed_total}"
+            f"Processed: {processed}, Changed: {changed_total}, History rows: {history_total}, "
+            f"Batches: {batches}, Time: {elapsed:.2f}s, Lag: {lag_before:.0f}s -> {lag_after:.0f}s"
         ))
+
+    def _record_batch(self, row: dict, verbosity: int) -> None:
+        """
+        Метрики одной пачки: гистограммы в /metrics + JSON-строка в лог
+        apps.main.flows (и в stdout при -v 2).
+        """
+        metrics.observe("kargo_flow_batch_size", row["size"], buckets=metrics.QUERY_BUCKETS)
+        metrics.observe("kargo_flow_lock_wait_seconds", row["lock_wait_ms"] / 1000)
+        metrics.observe("kargo_flow_phase_seconds", row["advance_ms"] / 1000, {"phase": "advance"})
+        metrics.observe("kargo_flow_phase_seconds", row["commit_ms"] / 1000, {"phase": "commit"})
+        metrics.inc("kargo_flow_parcels_total", value=row["size"])
+        metrics.inc("kargo_flow_history_rows_total", value=row["history_rows"])
+
+        line = json.dumps(row)
+        logger.info(line)
+        if verbosity >= 2:
+            self.stdout.write(line)
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.main.outbox import prune_events
+
+
+class Command(BaseCommand):
+    help = "Delete change-feed events (ParcelEvent) older than CHANGE_FEED_RETENTION_DAYS, in id batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=getattr(settings, "CHANGE_FEED_RETENTION_DAYS", 30))
+        parser.add_argument("--batch", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        deleted = prune_events(options["days"], batch_size=max(1, options["batch"]))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} events older than {options['days']} days."))
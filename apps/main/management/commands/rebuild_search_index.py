@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from apps.main.search import (
+    drop_history_search_index,
+    drop_search_indexes,
+    install_history_search_index,
+    install_search_indexes,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recreate staff search and history full-text indexes (pg_trgm/tsvector GIN on PostgreSQL, "
+        "FTS5 tables and triggers on SQLite) and refill the SQLite FTS tables."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        with transaction.atomic(using=connection.alias):
+            drop_search_indexes(connection)
+            install_search_indexes(connection)
+            drop_history_search_index(connection)
+            install_history_search_index(connection)
+        self.stdout.write(self.style.SUCCESS(f"Search indexes rebuilt ({connection.vendor})."))
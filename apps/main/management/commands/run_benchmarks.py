@@ -0,0 +1,221 @@
+import json
+import random
+import uuid
+from datetime import timedelta
+from io import StringIO
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.utils import timezone
+
+from apps.main.auth_backends import USER_CONTEXT_RELATED
+from apps.main.auto_status import _get_second_scan_delay, _process_staff_scan
+from apps.main.bench import format_row, measure
+from apps.main.models import CabinetProfile, Parcel, ParcelHistory
+from apps.main.views import _serialize_history
+
+User = get_user_model()
+
+SCENARIOS = (
+    "scan_first",
+    "scan_second",
+    "cabinet_home_light",
+    "cabinet_home_heavy",
+    "serialize_history",
+    "track_public_lookup",
+    "flow_sweep",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmarks for the hot paths: latency distribution and query counts. "
+        "Use generate_synthetic_data first for realistic volumes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--sweeps", type=int, default=1, help="Iterations for flow_sweep.")
+        parser.add_argument("--only", nargs="*", choices=SCENARIOS, default=None)
+        parser.add_argument("--output", default="", help="Save results as JSON.")
+        parser.add_argument("--compare", default="", help="Previous JSON result to compare with.")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options["seed"])
+        self.iterations = max(1, options["iterations"])
+        self.run_id = uuid.uuid4().hex[:8].upper()
+        selected = options["only"] or list(SCENARIOS)
+
+        results = {}
+        try:
+            for name in selected:
+                self.stdout.write(f"running {name}...")
+                stats = getattr(self, f"bench_{name}")(options)
+                if stats is None:
+                    self.stdout.write(self.style.WARNING("  skipped: no suitable data"))
+                    continue
+                results[name] = stats
+                self.stdout.write(format_row(name, stats) + f" q={stats['queries_mean']}")
+        finally:
+            Parcel.objects.filter(track_number__startswith=self._track_prefix()).delete()
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "db_vendor": connection.vendor,
+            "django": django.get_version(),
+            "iterations": self.iterations,
+            "dataset": {
+                "users": User.objects.count(),
+                "parcels": Parcel.objects.count(),
+                "history": ParcelHistory.objects.count(),
+            },
+            "results": results,
+        }
+
+        if options["compare"]:
+            self._compare(options["compare"], results)
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved: {options['output']}"))
+
+    # ---------- данные ----------
+
+    def _track_prefix(self):
+        return f"BN{self.run_id}"
+
+    def _employee(self):
+        profile = (
+            CabinetProfile.objects.filter(is_employee=True)
+            .select_related("user")
+            .order_by("id")
+            .first()
+        )
+        if not profile:
+            raise CommandError("Нет сотрудника (CabinetProfile.is_employee) для сканов.")
+        return User.objects.select_related(*USER_CONTEXT_RELATED).get(pk=profile.user_id)
+
+    def _owner(self, heaviest: bool):
+        order = "-c" if heaviest else "c"
+        row = (
+            Parcel.objects.filter(user__isnull=False)
+            .values("user")
+            .annotate(c=Count("id"))
+            .order_by(order)
+            .first()
+        )
+        return row["user"] if row else None
+
+    def _sample_parcel_ids(self, **filters):
+        ids = list(Parcel.objects.filter(**filters).order_by("-id").values_list("id", flat=True)[:5000])
+        self.rnd.shuffle(ids)
+        return ids
+
+    # ---------- сценарии ----------
+
+    def bench_scan_first(self, options):
+        user = self._employee()
+        prefix = self._track_prefix()
+
+        def scan(track):
+            _process_staff_scan(user, track)
+
+        return measure(scan, self.iterations, connection, setup=lambda i: f"{prefix}F{i + 1000:05d}")
+
+    def bench_scan_second(self, options):
+        user = self._employee()
+        prefix = self._track_prefix()
+        started = timezone.now().replace(microsecond=0) - _get_second_scan_delay() - timedelta(hours=1)
+
+        def prepare(i):
+            track = f"{prefix}S{i + 1000:05d}"
+            Parcel.objects.create(
+                track_number=track,
+                status=Parcel.Status.FROM_CN,
+                auto_flow_started_at=started,
+                auto_flow_stage=3,
+                local_flow_started_at=started,
+            )
+            return track
+
+        def scan(track):
+            _process_staff_scan(user, track)
+
+        return measure(scan, self.iterations, connection, setup=prepare)
+
+    def _bench_cabinet(self, heaviest: bool):
+        owner_id = self._owner(heaviest)
+        if owner_id is None:
+            return None
+        client = Client()
+        client.force_login(User.objects.get(pk=owner_id))
+
+        def get_home(_):
+            resp = client.get("/cabinet/")
+            if resp.status_code != 200:
+                raise CommandError(f"/cabinet/ вернул {resp.status_code}")
+
+        stats = measure(get_home, self.iterations, connection)
+        stats["parcels"] = Parcel.objects.filter(user_id=owner_id).count()
+        return stats
+
+    def bench_cabinet_home_light(self, options):
+        return self._bench_cabinet(heaviest=False)
+
+    def bench_cabinet_home_heavy(self, options):
+        return self._bench_cabinet(heaviest=True)
+
+    def bench_serialize_history(self, options):
+        ids = self._sample_parcel_ids(status__gte=Parcel.Status.FROM_CN)
+        if not ids:
+            return None
+        return measure(
+            _serialize_history,
+            self.iterations,
+            connection,
+            setup=lambda i: Parcel.objects.get(pk=ids[i % len(ids)]),
+        )
+
+    def bench_track_public_lookup(self, options):
+        ids = self._sample_parcel_ids()
+        if not ids:
+            return None
+        tracks = dict(Parcel.objects.filter(pk__in=ids[:1000]).values_list("id", "track_number"))
+        track_list = list(tracks.values())
+        client = Client()
+
+        def lookup(track):
+            client.get("/cabinet/api/track/public/", {"track": track})
+
+        return measure(lookup, self.iterations, connection, setup=lambda i: track_list[i % len(track_list)])
+
+    def bench_flow_sweep(self, options):
+        def sweep(_):
+            call_command("process_parcel_flows", stdout=StringIO())
+
+        return measure(sweep, max(1, options["sweeps"]), connection, warmup=0)
+
+    # ---------- сравнение ----------
+
+    def _compare(self, path, results):
+        with open(path, encoding="utf-8") as f:
+            previous = json.load(f).get("results", {})
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Compared with {path}"))
+        for name, stats in results.items():
+            old = previous.get(name)
+            if not old:
+                continue
+            parts = []
+            for key in ("p50_ms", "p95_ms", "p99_ms", "queries_mean"):
+                before, after = old.get(key) or 0, stats.get(key) or 0
+                change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+                parts.append(f"{key}={after} ({change})")
+            self.stdout.write(f"{name:<24} " + " ".join(parts))
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from apps.main.bench import percentile
+from apps.main.slow_queries import read_log
+
+
+class Command(BaseCommand):
+    help = (
+        "Summarize the slow-query log (SLOW_QUERY_THRESHOLD_MS): worst query shapes by total time, "
+        "with sources and the latest captured plan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--log", default="", help="Log path (default: SLOW_QUERY_LOG).")
+        parser.add_argument("--top", type=int, default=10)
+        parser.add_argument("--hours", type=float, default=None, help="Only samples from the last N hours.")
+        parser.add_argument(
+            "--order",
+            choices=("total", "max", "count", "p95"),
+            default="total",
+            help="Ranking key.",
+        )
+        parser.add_argument("--plans", action="store_true", help="Print the latest plan for each query.")
+
+    def handle(self, *args, **options):
+        path = options["log"] or getattr(settings, "SLOW_QUERY_LOG", "")
+        if not path:
+            raise CommandError("SLOW_QUERY_LOG не задан.")
+        since = timezone.now() - timedelta(hours=options["hours"]) if options["hours"] else None
+
+        groups = {}
+        for row in read_log(str(path)):
+            if since is not None:
+                ts = parse_datetime(row.get("ts", ""))
+                if ts is None or ts < since:
+                    continue
+            g = groups.setdefault(row["fingerprint"], {"times": [], "sources": {}, "plan": None, "sql": row["sql"]})
+            g["times"].append(row["ms"])
+            g["sources"][row["source"]] = g["sources"].get(row["source"], 0) + 1
+            if row.get("plan"):
+                g["plan"] = row["plan"]
+
+        if not groups:
+            self.stdout.write("Нет записей.")
+            return
+
+        def key(item):
+            times = item[1]["times"]
+            return {
+                "total": sum(times),
+                "max": max(times),
+                "count": len(times),
+                "p95": percentile(sorted(times), 95),
+            }[options["order"]]
+
+        ranked = sorted(groups.items(), key=key, reverse=True)[: options["top"]]
+        for n, (fp, g) in enumerate(ranked, 1):
+            times = sorted(g["times"])
+            sources = ", ".join(f"{s}×{c}" for s, c in sorted(g["sources"].items(), key=lambda x: -x[1]))
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"#{n} count={len(times)} total={sum(times):.0f}ms p50={percentile(times, 50):.1f}ms "
+                f"p95={percentile(times, 95):.1f}ms max={times[-1]:.1f}ms"
+            ))
+            self.stdout.write(f"   sources: {sources}")
+            self.stdout.write(f"   sql: {fp[:500]}")
+            if options["plans"] and g["plan"]:
+                for line in g["plan"].splitlines():
+                    self.stdout.write(f"   | {line}")
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.main import slow_queries
+from apps.main.rollups import BATCH_SIZE, reset_rollups, update_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold new ParcelHistory rows (after the watermark) into the daily rollup table behind the "
+        "staff dashboard. Safe to run from cron every few minutes; --rebuild recomputes from scratch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=BATCH_SIZE)
+        parser.add_argument("--max-batches", type=int, default=None)
+        parser.add_argument("--rebuild", action="store_true", help="Drop rollups and the watermark first.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def on_batch(batches, rows, last_id):
+            if options["verbosity"] >= 2:
+                self.stdout.write(f"batch {batches}: {rows} rows, watermark {last_id}")
+
+        with slow_queries.source("command:update_rollups"):
+            if options["rebuild"]:
+                reset_rollups()
+            result = update_rollups(
+                batch_size=max(1, options["batch"]),
+                max_batches=options["max_batches"],
+                on_batch=on_batch,
+            )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rollups updated: {result['rows']} history rows in {result['batches']} batches, "
+            f"watermark {result['last_id']}, {elapsed:.1f}s"
+        ))
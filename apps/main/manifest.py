@@ -0,0 +1,224 @@
+"""
+Импорт манифестов склада в Китае (CSV/TSV с трек-номерами).
+
+Файл читается построчно и обрабатывается пачками по chunk_size строк:
+на пачку — один SELECT ... FOR UPDATE, bulk_create недостающих посылок,
+один UPDATE старта цепочки и bulk_create истории этапа 1. Это тот же
+результат, что и 1-й скан сотрудника (_process_staff_scan), только без
+запросов на каждую посылку. Дальше этапы двигает process_parcel_flows.
+
+В памяти держатся текущая пачка и множество уже встреченных треков (для
+отсеивания повторов по всему файлу) — сами строки файла не накапливаются.
+"""
+import codecs
+import csv
+import io
+import itertools
+import time
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .auto_status import CN_STAGE_1_MESSAGE, _bulk_add_history, _history_row, _norm_dt, _sanitize_track
+from .counters import record_moves
+from .outbox import emit, make_event
+from .models import Parcel
+from .tracing import span
+
+CHUNK_SIZE = 2000
+
+# Названия колонки с треком в заголовке (в нижнем регистре)
+TRACK_HEADERS = ("track", "track_number", "tracking", "tracking_number", "трек", "трек-номер", "трек номер")
+
+
+@dataclass
+class ManifestResult:
+    rows: int = 0
+    accepted: int = 0
+    created: int = 0
+    started: int = 0
+    skipped: int = 0  # уже отсканированы/в пути — не трогаем
+    rejected: int = 0
+    seconds: float = 0.0
+    rejects: list = field(default_factory=list)  # первые max_rejects: (строка, значение, причина)
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"строк: {self.rows}, принято: {self.accepted} (новых: {self.created}, "
+            f"запущено: {self.started}, пропущено: {self.skipped}), отклонено: {self.rejected}; "
+            f"{self.seconds:.1f} с, {self.rows_per_sec:.0f} строк/с"
+        )
+
+
+def text_stream(binary_file, encoding: str = "utf-8-sig"):
+    """
+    Бинарный файл (open(..., "rb"), UploadedFile) -> текстовый поток для csv,
+    без чтения целиком. utf-8-sig съедает BOM из Excel.
+    """
+    if hasattr(binary_file, "readable"):
+        return io.TextIOWrapper(binary_file, encoding=encoding, errors="replace", newline="")
+    return codecs.iterdecode(binary_file, encoding)
+
+
+def _detect_dialect(first_line: str):
+    if "\t" in first_line:
+        return "excel-tab"
+    if ";" in first_line and "," not in first_line:
+        class Semicolon(csv.excel):
+            delimiter = ";"
+
+        return Semicolon
+    return "excel"
+
+
+def iter_manifest(lines):
+    """
+    (номер строки, сырое значение трека) по строкам CSV/TSV. Разделитель — по
+    первой строке; если она заголовок с колонкой из TRACK_HEADERS, трек берётся
+    из неё, иначе из первой колонки.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+
+    reader = csv.reader(itertools.chain([first], lines), dialect=_detect_dialect(first))
+    column = 0
+    for line_no, row in enumerate(reader, start=1):
+        if line_no == 1:
+            names = [c.strip().lower() for c in row]
+            header = next((i for i, name in enumerate(names) if name in TRACK_HEADERS), None)
+            if header is not None:
+                column = header
+                continue
+        if not any(c.strip() for c in row):
+            continue
+        yield line_no, (row[column] if column < len(row) else "")
+
+
+def _import_chunk(chunk, now, result: ManifestResult) -> None:
+    tracks = [track for _, track in chunk]
+    with transaction.atomic():
+        existing = {
+            p["track_number"]: p
+            for p in Parcel.objects.select_for_update()
+            .filter(track_number__in=tracks)
+            .values("id", "user_id", "track_number", "status", "auto_flow_started_at")
+        }
+
+        missing = [t for t in tracks if t not in existing]
+        if missing:
+            Parcel.objects.bulk_create(
+                [Parcel(track_number=t, status=Parcel.Status.WAITING_CN) for t in missing],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            # ignore_conflicts не возвращает pk — дочитываем созданные (и вставленные параллельно)
+            for p in (
+                Parcel.objects.select_for_update()
+                .filter(track_number__in=missing)
+                .values("id", "user_id", "track_number", "status", "auto_flow_started_at")
+            ):
+                existing[p["track_number"]] = p
+                # вставленные параллельно и уже запущенные — созданными не считаем
+                if p["auto_flow_started_at"] is None and p["status"] == Parcel.Status.WAITING_CN:
+                    result.created += 1
+
+        started = [
+            p
+            for p in existing.values()
+            if p["auto_flow_started_at"] is None and p["status"] == Parcel.Status.WAITING_CN
+        ]
+        to_start = [p["id"] for p in started]
+        if to_start:
+            # 1-й скан + этап 1 Китая сразу: как _process_staff_scan + _advance_cn_flow
+            Parcel.objects.filter(pk__in=to_start).update(
+                status=Parcel.Status.AT_CN,
+                auto_flow_started_at=now,
+                auto_flow_stage=1,
+                local_flow_started_at=now,
+                local_flow_stage=0,
+            )
+            _bulk_add_history([_history_row(pk, Parcel.Status.AT_CN, CN_STAGE_1_MESSAGE, now) for pk in to_start])
+            # треки, заранее добавленные клиентами в кабинет
+            moves = {}
+            for p in started:
+                key = (p["user_id"], Parcel.Status.WAITING_CN, Parcel.Status.AT_CN)
+                moves[key] = moves.get(key, 0) + 1
+            record_moves(moves)
+            emit([
+                make_event(p["id"], p["track_number"], p["user_id"], Parcel.Status.WAITING_CN, Parcel.Status.AT_CN, now)
+                for p in started
+            ])
+
+    result.accepted += len(tracks)
+    result.started += len(to_start)
+    result.skipped += len(tracks) - len(to_start)
+
+
+def import_manifest(lines, chunk_size: int = CHUNK_SIZE, on_reject=None, max_rejects: int = 100,
+                    on_progress=None, result: ManifestResult | None = None) -> ManifestResult:
+    """
+    Импорт строк манифеста (текстовый итератор, см. text_stream).
+
+    Треки проверяются как при скане (_sanitize_track); повтор трека в любом
+    месте файла отклоняется. Отклонённые строки передаются в
+    on_reject(line_no, value, reason) и первые max_rejects сохраняются в
+    result.rejects. on_progress(result) — после каждой пачки.
+    Каждая пачка — своя транзакция: при падении уже обработанные пачки остаются,
+    и переданный result показывает, сколько их было.
+    """
+    if result is None:
+        result = ManifestResult()
+    now = _norm_dt(timezone.now())
+    t0 = time.perf_counter()
+
+    def reject(line_no, value, reason):
+        result.rejected += 1
+        if len(result.rejects) < max_rejects:
+            result.rejects.append((line_no, value, reason))
+        if on_reject is not None:
+            on_reject(line_no, value, reason)
+
+    chunk = []
+    seen = set()
+
+    def flush():
+        with span("manifest.chunk", size=len(chunk)):
+            _import_chunk(chunk, now, result)
+        metrics.inc("kargo_manifest_rows_total", {"result": "accepted"}, len(chunk))
+        chunk.clear()
+        result.seconds = time.perf_counter() - t0
+        if on_progress is not None:
+            on_progress(result)
+
+    for line_no, raw in iter_manifest(lines):
+        result.rows += 1
+        try:
+            track = _sanitize_track(raw)
+        except (ValueError, ValidationError) as e:
+            reject(line_no, raw, e.messages[0] if isinstance(e, ValidationError) else str(e))
+            continue
+        if track in seen:
+            reject(line_no, raw, "Повтор трек-номера в файле.")
+            continue
+        seen.add(track)
+        chunk.append((line_no, track))
+        if len(chunk) >= chunk_size:
+            flush()
+
+    if chunk:
+        flush()
+
+    result.seconds = time.perf_counter() - t0
+    if result.rejected:
+        metrics.inc("kargo_manifest_rows_total", {"result": "rejected"}, result.rejected)
+    metrics.observe("kargo_manifest_import_seconds", result.seconds)
+    return result
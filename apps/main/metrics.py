@@ -0,0 +1,337 @@
+"""
+Метрики процесса в формате Prometheus (text exposition 0.0.4).
+
+Каждый процесс копит счётчики/гистограммы/gauge в памяти и раз в
+METRICS_FLUSH_SECONDS сбрасывает снимок в METRICS_DIR/metrics-<pid>.json.
+Эндпоинт /metrics складывает снимки всех воркеров (и процессов команд):
+counter и histogram суммируются, у gauge берётся самое свежее значение.
+Снимки завершившихся процессов при опросе сливаются в один
+metrics-exited.json и удаляются — файлов не больше, чем живых процессов.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_HELP = {}
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+_last_flush = 0.0
+
+# сюда сливаются снимки завершившихся процессов
+_EXITED = "metrics-exited.json"
+
+# Статистика SQL текущего запроса/команды: {"count": int, "seconds": float}
+_query_stats = ContextVar("main_query_stats", default=None)
+
+
+def _labels_key(labels: dict):
+    return tuple(sorted((labels or {}).items()))
+
+
+def describe(name: str, kind: str, help_text: str) -> None:
+    _HELP[name] = (kind, help_text)
+
+
+def inc(name: str, labels: dict | None = None, value: float = 1.0) -> None:
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+    _maybe_flush()
+
+
+def observe(name: str, value: float, labels: dict | None = None, buckets=LATENCY_BUCKETS) -> None:
+    key = (name, _labels_key(labels))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {"buckets": list(buckets), "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(h["buckets"]):
+            if value <= bound:
+                h["counts"][i] += 1
+        h["sum"] += value
+        h["count"] += 1
+    _maybe_flush()
+
+
+def set_gauge(name: str, value: float, labels: dict | None = None, flush: bool = False) -> None:
+    key = (name, _labels_key(labels))
+    with _lock:
+        _gauges[key] = (value, time.time())
+    if flush:
+        flush_now()
+    else:
+        _maybe_flush()
+
+
+# ---------- снимки на диск ----------
+
+
+def _metrics_dir():
+    return getattr(settings, "METRICS_DIR", None)
+
+
+def _snapshot() -> dict:
+    with _lock:
+        return _as_snapshot({"counters": _counters, "histograms": _histograms, "gauges": _gauges})
+
+
+def flush_now() -> None:
+    global _last_flush
+    directory = _metrics_dir()
+    _last_flush = time.monotonic()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _write(os.path.join(directory, f"metrics-{os.getpid()}.json"), _snapshot())
+
+
+def _maybe_flush() -> None:
+    interval = float(getattr(settings, "METRICS_FLUSH_SECONDS", 2))
+    if time.monotonic() - _last_flush >= interval:
+        try:
+            flush_now()
+        except OSError:
+            pass
+
+
+def _flush_at_exit():
+    if _counters or _histograms or _gauges:
+        try:
+            flush_now()
+        except OSError:
+            pass
+
+
+atexit.register(_flush_at_exit)
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write(path, data) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _fold_exited(directory) -> None:
+    """
+    Снимки процессов, которых уже нет, прибавляет к metrics-exited.json и
+    удаляет. Под flock: два опроса сразу не сложат один снимок дважды —
+    второй найдёт файл уже удалённым.
+    """
+    dead = []
+    for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+        pid = os.path.basename(path)[len("metrics-"):-len(".json")]
+        if pid.isdigit() and int(pid) != os.getpid() and not _pid_alive(int(pid)):
+            dead.append(path)
+    if not dead:
+        return
+    exited = os.path.join(directory, _EXITED)
+    with open(os.path.join(directory, "metrics.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        snapshots, folded = [], []
+        for path in [exited] + dead:
+            try:
+                snapshots.append(_read(path))
+            except (OSError, ValueError):
+                continue
+            if path != exited:
+                folded.append(path)
+        if not folded:
+            return
+        _write(exited, _as_snapshot(_merge(snapshots)))
+        for path in folded:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def _load_snapshots():
+    directory = _metrics_dir()
+    own = os.path.join(directory, f"metrics-{os.getpid()}.json") if directory else None
+    snapshots = [_snapshot()]
+    if directory:
+        try:
+            _fold_exited(directory)
+        except OSError:
+            pass
+        for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+            if path == own:
+                continue
+            try:
+                snapshots.append(_read(path))
+            except (OSError, ValueError):
+                continue
+    return snapshots
+
+
+def _as_snapshot(data) -> dict:
+    return {
+        "counters": [[n, list(map(list, lk)), v] for (n, lk), v in data["counters"].items()],
+        "histograms": [[n, list(map(list, lk)), h] for (n, lk), h in data["histograms"].items()],
+        "gauges": [[n, list(map(list, lk)), v, ts] for (n, lk), (v, ts) in data["gauges"].items()],
+    }
+
+
+def collect() -> dict:
+    """
+    Сводит снимки всех процессов: {"counters": {...}, "histograms": {...}, "gauges": {...}}.
+    """
+    return _merge(_load_snapshots())
+
+
+def _merge(snapshots) -> dict:
+    counters, histograms, gauges = {}, {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap.get("counters", []):
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, h in snap.get("histograms", []):
+            key = (name, tuple(map(tuple, labels)))
+            agg = histograms.get(key)
+            if agg is None or agg["buckets"] != h["buckets"]:
+                histograms[key] = agg = {
+                    "buckets": h["buckets"], "counts": [0] * len(h["buckets"]), "sum": 0.0, "count": 0
+                }
+            agg["counts"] = [a + b for a, b in zip(agg["counts"], h["counts"])]
+            agg["sum"] += h["sum"]
+            agg["count"] += h["count"]
+        for name, labels, value, ts in snap.get("gauges", []):
+            key = (name, tuple(map(tuple, labels)))
+            if key not in gauges or gauges[key][1] < ts:
+                gauges[key] = (value, ts)
+    return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+def _fmt_labels(labels, extra=None) -> str:
+    items = list(labels) + list(extra or [])
+    if not items:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items)
+    return "{" + body + "}"
+
+
+def render_prometheus(extra_gauges=None, data=None) -> str:
+    """
+    Текст для Prometheus. extra_gauges — [(name, labels_dict, value)], вычисленные при опросе;
+    data — уже собранный collect(), если он был нужен вызывающему.
+    """
+    data = data or collect()
+    for name, labels, value in extra_gauges or []:
+        data["gauges"][(name, _labels_key(labels))] = (value, time.time())
+
+    by_name = {}
+    for (name, labels), value in data["counters"].items():
+        by_name.setdefault(name, ("counter", []))[1].append((labels, value))
+    for (name, labels), h in data["histograms"].items():
+        by_name.setdefault(name, ("histogram", []))[1].append((labels, h))
+    for (name, labels), (value, _ts) in data["gauges"].items():
+        by_name.setdefault(name, ("gauge", []))[1].append((labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, samples = by_name[name]
+        help_text = _HELP.get(name, (kind, name))[1]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(samples, key=lambda s: s[0]):
+            if kind == "histogram":
+                for bound, count in zip(value["buckets"], value["counts"]):
+                    lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {value['count']}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {value['sum']}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {value['count']}")
+            else:
+                lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- учёт SQL ----------
+
+
+def _query_hook(execute, sql, params, many, context):
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats["count"] += 1
+        stats["seconds"] += time.perf_counter() - t0
+
+
+def _install_query_hook(sender, connection, **kwargs):
+    if _query_hook not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_query_hook)
+
+
+connection_created.connect(_install_query_hook, dispatch_uid="main_metrics_query_hook")
+
+
+def start_query_stats() -> tuple:
+    """
+    Начинает учёт SQL в текущем контексте; вернуть токен в stop_query_stats().
+    """
+    stats = {"count": 0, "seconds": 0.0}
+    return stats, _query_stats.set(stats)
+
+
+def stop_query_stats(token) -> None:
+    _query_stats.reset(token)
+
+
+describe("kargo_http_requests_total", "counter", "HTTP requests by view, method and status.")
+describe("kargo_http_request_duration_seconds", "histogram", "Wall time per request.")
+describe("kargo_http_request_db_queries", "histogram", "DB queries per request.")
+describe("kargo_http_request_db_seconds", "histogram", "DB time per request.")
+describe("kargo_http_response_size_bytes", "histogram", "Response body size.")
+describe("kargo_http_over_budget_total", "counter", "Requests over the query or latency budget.")
+
+describe("kargo_flow_batch_size", "histogram", "Parcels per process_parcel_flows batch.")
+describe("kargo_flow_lock_wait_seconds", "histogram", "Time to select and lock a flow batch.")
+describe("kargo_flow_phase_seconds", "histogram", "Flow batch time by phase (advance, commit).")
+describe("kargo_flow_parcels_total", "counter", "Parcels examined by the flow processor.")
+describe("kargo_flow_history_rows_total", "counter", "History rows inserted by the flow processor.")
+describe("kargo_flow_transitions_total", "counter", "Flow stage transitions by target stage.")
+describe("kargo_flow_run_seconds", "histogram", "Wall time of one process_parcel_flows run.")
+describe("kargo_flow_last_run_timestamp_seconds", "gauge", "Unix time of the last finished flow run.")
+describe("kargo_flow_last_run_processed", "gauge", "Parcels processed by the last flow run.")
+describe("kargo_flow_lag_seconds", "gauge", "Age of the oldest overdue flow transition.")
+
+describe("kargo_manifest_rows_total", "counter", "Manifest import rows by result (accepted, rejected).")
+describe("kargo_manifest_import_seconds", "histogram", "Wall time of one manifest import.")
+
+describe("kargo_notify_notifications_total", "counter", "Queued notifications processed by result (sent, retry, failed).")
+describe("kargo_notify_messages_total", "counter", "Coalesced messages handed to the notification provider.")
+
+describe("kargo_reconcile_mismatches_total", "counter", "Parcel/history mismatches found by reconcile_parcels, by kind.")
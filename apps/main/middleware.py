@@ -0,0 +1,190 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+from . import metrics, profiling, slow_queries, tracing
+
+perf_logger = logging.getLogger("apps.main.perf")
+
+
+def _view_name(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return match.view_name or match._func_path
+
+
+class RequestMetricsMiddleware:
+    """
+    Время, число и время SQL, размер ответа — по каждому view в гистограммы
+    metrics.py. Запросы сверх PERF_QUERY_BUDGET / PERF_LATENCY_BUDGET_MS
+    пишутся в лог apps.main.perf с именем view. Заодно привязывает запрос
+    к журналу медленных SQL (slow_queries), чтобы там было видно view.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats, token = metrics.start_query_stats()
+        source_token = slow_queries.bind_request(request)
+        t0 = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            slow_queries.unbind_request(source_token)
+            metrics.stop_query_stats(token)
+        self._record(request, response, time.perf_counter() - t0, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats, token = metrics.start_query_stats()
+        source_token = slow_queries.bind_request(request)
+        t0 = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            slow_queries.unbind_request(source_token)
+            metrics.stop_query_stats(token)
+        self._record(request, response, time.perf_counter() - t0, stats)
+        return response
+
+    def _record(self, request, response, elapsed, stats):
+        view = _view_name(request)
+        labels = {"view": view, "method": request.method}
+        size = 0 if response.streaming else len(response.content)
+
+        metrics.inc("kargo_http_requests_total", {**labels, "status": str(response.status_code)})
+        metrics.observe("kargo_http_request_duration_seconds", elapsed, labels)
+        metrics.observe("kargo_http_request_db_queries", stats["count"], labels, buckets=metrics.QUERY_BUCKETS)
+        metrics.observe("kargo_http_request_db_seconds", stats["seconds"], labels)
+        metrics.observe("kargo_http_response_size_bytes", size, labels, buckets=metrics.SIZE_BUCKETS)
+
+        query_budget = getattr(settings, "PERF_QUERY_BUDGET", None)
+        latency_budget_ms = getattr(settings, "PERF_LATENCY_BUDGET_MS", None)
+        over_queries = query_budget is not None and stats["count"] > query_budget
+        over_latency = latency_budget_ms is not None and elapsed * 1000 > latency_budget_ms
+        if over_queries or over_latency:
+            metrics.inc("kargo_http_over_budget_total", labels)
+            perf_logger.warning(
+                "Over budget: view=%s method=%s path=%s status=%s time=%.1fms queries=%d db=%.1fms bytes=%d",
+                view,
+                request.method,
+                request.path,
+                response.status_code,
+                elapsed * 1000,
+                stats["count"],
+                stats["seconds"] * 1000,
+                size,
+            )
+
+
+
+def _finish_root(root, request, response) -> None:
+    if root is not None:
+        root.name = f"http {request.method} {_view_name(request)}"
+        root.set(status=response.status_code)
+
+
+class TracingMiddleware:
+    """
+    Корневой span запроса (семплирование — TRACE_SAMPLE_RATE, см. tracing.py).
+    Имя span-а — «METHOD view», известное только после resolve.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with tracing.trace("http", method=request.method, path=request.path) as root:
+            response = self.get_response(request)
+            _finish_root(root, request, response)
+        return response
+
+    async def __acall__(self, request):
+        with tracing.trace("http", method=request.method, path=request.path) as root:
+            response = await self.get_response(request)
+            _finish_root(root, request, response)
+        return response
+
+
+def _wants_profile(request) -> bool:
+    return request.GET.get("__profile") not in (None, "", "0")
+
+
+def _profile_label(request) -> str:
+    return f"http:{request.method}:{request.path}"
+
+
+def _profile_response(request, response, result):
+    result.save()
+    body = f"status: {response.status_code}\n" + result.summary(sort=request.GET.get("__profile_sort", "cumulative"))
+    return HttpResponse(body, content_type="text/plain; charset=utf-8")
+
+
+class ProfilingMiddleware:
+    """
+    ?__profile=1 у суперпользователя: запрос выполняется под cProfile,
+    вместо ответа отдаётся текстовая сводка top-N (сортировка —
+    ?__profile_sort=cumulative|tottime|ncalls), сырые данные — в PROFILE_DIR.
+    Стоит после AuthenticationMiddleware.
+
+    Под WSGI в профиль попадает и поток event loop, в котором async_to_sync
+    выполняет async-view (см. profiling.profiled(threads=True)); второй
+    профилируемый запрос, пока идёт первый, получает 409. Под ASGI cProfile
+    на потоке event loop записал бы заодно все конкурентные запросы —
+    там отвечаем 400.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _wants_profile(request) or not request.user.is_superuser:
+            return self.get_response(request)
+
+        try:
+            with profiling.profiled(_profile_label(request), threads=True) as result:
+                response = self.get_response(request)
+        except profiling.ProfileBusy as e:
+            return HttpResponse(f"{e}\n", status=409, content_type="text/plain; charset=utf-8")
+        return _profile_response(request, response, result)
+
+    async def __acall__(self, request):
+        if not _wants_profile(request):
+            return await self.get_response(request)
+        user = await request.auser()
+        if not user.is_superuser:
+            return await self.get_response(request)
+        return HttpResponse(
+            "?__profile работает только под WSGI (runserver/gunicorn sync): "
+            "под ASGI в профиль попали бы чужие запросы.\n",
+            status=400,
+            content_type="text/plain; charset=utf-8",
+        )
+
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def forwards(apps, schema_editor):
+    from apps.main.search import install_search_indexes
+
+    install_search_indexes(schema_editor.connection)
+
+
+def backwards(apps, schema_editor):
+    from apps.main.search import drop_search_indexes
+
+    drop_search_indexes(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    """
+    Индексы поиска сотрудника: pg_trgm/GIN на PostgreSQL, FTS5 trigram на SQLite.
+    DDL живёт в apps/main/search.py (его же использует rebuild_search_index).
+    """
+
+    dependencies = [
+        ('main', '0012_parcelhistory_uniq_parcel_history_event_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def forwards(apps, schema_editor):
+    from apps.main.search import install_history_search_index
+
+    install_history_search_index(schema_editor.connection)
+
+
+def backwards(apps, schema_editor):
+    from apps.main.search import drop_history_search_index
+
+    drop_history_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    """
+    Полнотекстовый индекс по ParcelHistory.message: GIN по tsvector на PostgreSQL,
+    external-content FTS5 на SQLite. DDL — в apps/main/search.py.
+    """
+
+    dependencies = [
+        ('main', '0013_staff_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.9 on 2026-10-19 00:34
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_history_fulltext_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Bag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=64, unique=True, validators=[django.core.validators.RegexValidator(message='Код мешка должен быть от 4 до 32 символов: буквы/цифры и символы . _ -', regex='^[A-Za-z0-9._\\-]{4,32}$')], verbose_name='Код мешка')),
+                ('first_scanned_at', models.DateTimeField(blank=True, null=True, verbose_name='1-й скан мешка')),
+                ('second_scanned_at', models.DateTimeField(blank=True, null=True, verbose_name='2-й скан мешка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Создал')),
+            ],
+            options={
+                'verbose_name': 'Мешок',
+                'verbose_name_plural': 'Мешки',
+            },
+        ),
+        migrations.AddField(
+            model_name='parcel',
+            name='bag',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='parcels', to='main.bag', verbose_name='Мешок'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.9 on 2026-10-19 00:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_pickup_point(apps, schema_editor):
+    """
+    Уже прибывшие посылки: ПВЗ берём из профиля владельца — раньше он
+    определялся только так (или из текста события AT_PICKUP).
+    """
+    Parcel = apps.get_model("main", "Parcel")
+    CabinetProfile = apps.get_model("main", "CabinetProfile")
+    Parcel.objects.filter(status__in=[3, 4], pickup_point__isnull=True, user__isnull=False).update(
+        pickup_point=Subquery(
+            CabinetProfile.objects.filter(user_id=OuterRef("user_id")).values("pickup_point_id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_bag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parcel',
+            name='pickup_point',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='parcels', to='main.pickuppoint', verbose_name='Пункт выдачи'),
+        ),
+        migrations.AddIndex(
+            model_name='parcel',
+            index=models.Index(fields=['pickup_point', 'status', 'id'], name='main_parcel_pickup__096ec5_idx'),
+        ),
+        migrations.RunPython(backfill_pickup_point, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-19 00:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_parcel_pickup_point'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStatusCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='status_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('waiting_cn', models.IntegerField(default=0, verbose_name='Ожидает Китай')),
+                ('at_cn', models.IntegerField(default=0, verbose_name='На складе в Китае')),
+                ('from_cn', models.IntegerField(default=0, verbose_name='Отправлен из Китая')),
+                ('at_pickup', models.IntegerField(default=0, verbose_name='В пункте выдачи')),
+                ('received', models.IntegerField(default=0, verbose_name='Получен')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Счётчик статусов',
+                'verbose_name_plural': 'Счётчики статусов',
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.9 on 2026-10-19 00:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_user_status_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True, verbose_name='Задача')),
+                ('last_id', models.BigIntegerField(default=0, verbose_name='Последний обработанный id')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Водяной знак задачи',
+                'verbose_name_plural': 'Водяные знаки задач',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Ожидает поступления на склад в Китае'), (1, 'Принят на склад в Китае'), (2, 'Отправлен из Китая'), (3, 'Прибыл в пункт выдачи'), (4, 'Получен')], verbose_name='Статус')),
+                ('events', models.IntegerField(default=0, verbose_name='Событий')),
+                ('transit_seconds_sum', models.BigIntegerField(default=0, verbose_name='Сумма времени в пути, сек')),
+                ('transit_count', models.IntegerField(default=0, verbose_name='Посылок со временем в пути')),
+                ('pickup_point', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='main.pickuppoint', verbose_name='Пункт выдачи')),
+            ],
+            options={
+                'verbose_name': 'Сводка за день',
+                'verbose_name_plural': 'Сводки за день',
+                'indexes': [models.Index(fields=['day', 'pickup_point', 'status'], name='main_dailyr_day_e1b76c_idx')],
+            },
+        ),
+    ]
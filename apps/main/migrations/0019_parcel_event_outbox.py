@@ -0,0 +1,50 @@
+# Generated by Django 5.2.9 on 2026-10-19 00:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_daily_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApiToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('key_hash', models.CharField(editable=False, max_length=64, unique=True, verbose_name='SHA-256 токена')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Активен')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(blank=True, null=True, verbose_name='Последнее использование')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='api_tokens', to=settings.AUTH_USER_MODEL, verbose_name='Только посылки пользователя')),
+            ],
+            options={
+                'verbose_name': 'API-токен',
+                'verbose_name_plural': 'API-токены',
+            },
+        ),
+        migrations.CreateModel(
+            name='ParcelEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('track_number', models.CharField(max_length=64, verbose_name='Трек-номер')),
+                ('old_status', models.PositiveSmallIntegerField(choices=[(0, 'Ожидает поступления на склад в Китае'), (1, 'Принят на склад в Китае'), (2, 'Отправлен из Китая'), (3, 'Прибыл в пункт выдачи'), (4, 'Получен')], null=True, verbose_name='Был статус')),
+                ('status', models.PositiveSmallIntegerField(choices=[(0, 'Ожидает поступления на склад в Китае'), (1, 'Принят на склад в Китае'), (2, 'Отправлен из Китая'), (3, 'Прибыл в пункт выдачи'), (4, 'Получен')], verbose_name='Статус')),
+                ('occurred_at', models.DateTimeField(verbose_name='Время события')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('parcel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='main.parcel', verbose_name='Посылка')),
+                ('user', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Событие посылки',
+                'verbose_name_plural': 'События посылок',
+                'indexes': [models.Index(fields=['user', 'id'], name='main_parcel_user_id_7a2fe3_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-19 00:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_notification_queue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parcel',
+            index=models.Index(condition=models.Q(('auto_flow_started_at__isnull', False), ('status__lt', 3)), fields=['auto_flow_started_at', 'id'], name='parcel_second_scan_queue_idx'),
+        ),
+    ]
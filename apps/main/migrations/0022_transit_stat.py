@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-19 00:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_parcel_second_scan_queue_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransitStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.PositiveSmallIntegerField(choices=[(0, 'Ожидает поступления на склад в Китае'), (1, 'Принят на склад в Китае'), (2, 'Отправлен из Китая'), (3, 'Прибыл в пункт выдачи'), (4, 'Получен')], verbose_name='Отсчёт от статуса')),
+                ('samples', models.IntegerField(default=0, verbose_name='Посылок')),
+                ('histogram', models.JSONField(default=dict, verbose_name='Гистограмма по часам')),
+                ('p50_seconds', models.IntegerField(blank=True, null=True, verbose_name='Медиана, сек')),
+                ('p90_seconds', models.IntegerField(blank=True, null=True, verbose_name='90-й перцентиль, сек')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('pickup_point', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.pickuppoint', verbose_name='Пункт выдачи')),
+            ],
+            options={
+                'verbose_name': 'Статистика времени в пути',
+                'verbose_name_plural': 'Статистика времени в пути',
+                'indexes': [models.Index(fields=['pickup_point', 'stage'], name='main_transi_pickup__6ac52e_idx')],
+            },
+        ),
+    ]
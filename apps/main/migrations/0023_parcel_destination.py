@@ -0,0 +1,38 @@
+# Generated by Django 5.2.9 on 2026-10-19 01:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_destination(apps, schema_editor):
+    """
+    Посылки в пути: ПВЗ назначения — из профиля владельца.
+    """
+    Parcel = apps.get_model("main", "Parcel")
+    CabinetProfile = apps.get_model("main", "CabinetProfile")
+    Parcel.objects.filter(status__lt=3, user__isnull=False).update(
+        destination=Subquery(
+            CabinetProfile.objects.filter(user_id=OuterRef("user_id")).values("pickup_point_id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_transit_stat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parcel',
+            name='destination',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='main.pickuppoint', verbose_name='ПВЗ назначения'),
+        ),
+        migrations.AddIndex(
+            model_name='parcel',
+            index=models.Index(condition=models.Q(('auto_flow_started_at__isnull', False), ('status__lt', 3)), fields=['destination', 'auto_flow_started_at', 'id'], name='parcel_second_scan_dest_idx'),
+        ),
+        migrations.RunPython(backfill_destination, migrations.RunPython.noop),
+    ]
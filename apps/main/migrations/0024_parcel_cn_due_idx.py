@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-19 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_parcel_destination'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='parcel',
+            index=models.Index(condition=models.Q(('auto_flow_stage__lt', 3), ('auto_flow_started_at__isnull', False)), fields=['auto_flow_stage', 'auto_flow_started_at'], name='parcel_cn_due_idx'),
+        ),
+    ]
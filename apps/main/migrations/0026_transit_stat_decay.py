@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0024_parcel_cn_due_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transitstat',
+            name='decayed_to',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Веса приведены к'),
+        ),
+    ]
@@ -18,6 +18,11 @@ track_validator = RegexValidator(
     message=_("Трек-номер должен быть от 6 до 18 символов и может содержать только буквы/цифры и символы . _ -"),
 )
 
+bag_code_validator = RegexValidator(
+    regex=r"^[A-Za-z0-9._\-]{4,32}$",
+    message=_("Код мешка должен быть от 4 до 32 символов: буквы/цифры и символы . _ -"),
+)
+
 
 class SiteSettings(models.Model):
     title = models.CharField("Название проекта", max_length=100, default="kargoexpress")
@@ -126,6 +131,38 @@ class CabinetProfile(models.Model):
         return f"Профиль {getattr(self.user, 'username', self.user_id)}"
 
 
+class Bag(models.Model):
+    """
+    Мешок/контейнер: посылки привязываются при 1-м скане на складе в Китае,
+    один скан мешка в ПВЗ проводит 2-й скан сразу для всех (см. _process_bag_scan).
+    """
+
+    code = models.CharField(
+        "Код мешка",
+        max_length=64,
+        unique=True,
+        validators=[bag_code_validator],
+    )
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Создал",
+    )
+    first_scanned_at = models.DateTimeField("1-й скан мешка", null=True, blank=True)
+    second_scanned_at = models.DateTimeField("2-й скан мешка", null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Мешок"
+        verbose_name_plural = "Мешки"
+
+    def __str__(self):
+        return self.code
+
+
 class Parcel(models.Model):
     class Status(models.IntegerChoices):
         WAITING_CN = 0, "Ожидает поступления на склад в Китае"
@@ -150,6 +187,39 @@ class Parcel(models.Model):
         validators=[track_validator],
     )
 
+    bag = models.ForeignKey(
+        Bag,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="parcels",
+        verbose_name="Мешок",
+    )
+
+    # Куда прибыла посылка: ставится 2-м сканом из профиля сотрудника.
+    # Отдельный индекс по FK не нужен — его покрывает (pickup_point, status, id).
+    pickup_point = models.ForeignKey(
+        PickupPoint,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name="parcels",
+        verbose_name="Пункт выдачи",
+    )
+    # Куда посылка едет: ПВЗ из профиля владельца, пока она в пути. Держится
+    # в строке ради очереди 2-го скана (индекс parcel_second_scan_dest_idx):
+    # ставится при привязке трека и при смене ПВЗ в профиле (signals.py).
+    destination = models.ForeignKey(
+        PickupPoint,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name="+",
+        verbose_name="ПВЗ назначения",
+    )
+
     status = models.PositiveSmallIntegerField(
         "Текущий статус",
         choices=Status.choices,
@@ -189,6 +259,7 @@ class Parcel(models.Model):
         verbose_name_plural = "Посылки"
         indexes = [
             models.Index(fields=["user", "status"]),
+            models.Index(fields=["pickup_point", "status", "id"]),
             models.Index(fields=["status", "auto_flow_stage", "auto_flow_started_at"]),
             models.Index(fields=["status", "local_flow_stage", "local_flow_started_at"]),
             models.Index(
@@ -201,12 +272,261 @@ class Parcel(models.Model):
                 name="parcel_local_flow_active_idx",
                 condition=Q(local_flow_started_at__isnull=False) & ~Q(status=4),
             ),
+            # этапы Китая: самая старая посылка на каждом (_cn_flow_lag_seconds)
+            models.Index(
+                fields=["auto_flow_stage", "auto_flow_started_at"],
+                name="parcel_cn_due_idx",
+                condition=Q(auto_flow_started_at__isnull=False, auto_flow_stage__lt=3),
+            ),
+            # очередь на 2-й скан: отсканированы, но ещё не в ПВЗ (status < AT_PICKUP) —
+            # по ПВЗ назначения и по всем ПВЗ сразу
+            models.Index(
+                fields=["destination", "auto_flow_started_at", "id"],
+                name="parcel_second_scan_dest_idx",
+                condition=Q(auto_flow_started_at__isnull=False, status__lt=3),
+            ),
+            models.Index(
+                fields=["auto_flow_started_at", "id"],
+                name="parcel_second_scan_queue_idx",
+                condition=Q(auto_flow_started_at__isnull=False, status__lt=3),
+            ),
         ]
 
     def __str__(self):
         return self.track_number
 
 
+class UserStatusCounter(models.Model):
+    """
+    Сколько посылок пользователя в каждом статусе — для плиток кабинета
+    одним чтением по PK. Ведётся инкрементально в той же транзакции, что и
+    смена статуса (см. counters.py); починка — rebuild_status_counters.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="status_counter",
+    )
+    waiting_cn = models.IntegerField("Ожидает Китай", default=0)
+    at_cn = models.IntegerField("На складе в Китае", default=0)
+    from_cn = models.IntegerField("Отправлен из Китая", default=0)
+    at_pickup = models.IntegerField("В пункте выдачи", default=0)
+    received = models.IntegerField("Получен", default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Счётчик статусов"
+        verbose_name_plural = "Счётчики статусов"
+
+    def __str__(self):
+        return f"Счётчик {self.user_id}"
+
+
+class JobWatermark(models.Model):
+    """
+    До какого id инкрементальная задача уже обработала свою таблицу
+    (строку блокирует сама задача — два экземпляра не пойдут параллельно).
+    """
+
+    name = models.CharField("Задача", max_length=64, unique=True)
+    last_id = models.BigIntegerField("Последний обработанный id", default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Водяной знак задачи"
+        verbose_name_plural = "Водяные знаки задач"
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
+
+
+class DailyRollup(models.Model):
+    """
+    Агрегаты событий истории по (день, ПВЗ, статус) для дашборда сотрудника.
+    Пишет только update_rollups (см. rollups.py). ПВЗ заполнен для событий
+    AT_PICKUP/RECEIVED; transit_* — время от 1-го скана в Китае до прибытия в ПВЗ.
+    """
+
+    day = models.DateField("День")
+    pickup_point = models.ForeignKey(
+        PickupPoint,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name="+",
+        verbose_name="Пункт выдачи",
+    )
+    status = models.PositiveSmallIntegerField("Статус", choices=Parcel.Status.choices)
+    events = models.IntegerField("Событий", default=0)
+    transit_seconds_sum = models.BigIntegerField("Сумма времени в пути, сек", default=0)
+    transit_count = models.IntegerField("Посылок со временем в пути", default=0)
+
+    class Meta:
+        verbose_name = "Сводка за день"
+        verbose_name_plural = "Сводки за день"
+        indexes = [
+            models.Index(fields=["day", "pickup_point", "status"]),
+        ]
+
+    def __str__(self):
+        return f"{self.day} / {self.pickup_point_id or '—'} / {self.status}"
+
+
+class TransitStat(models.Model):
+    """
+    Распределение времени в пути до ПВЗ — для оценки даты прибытия.
+    stage — статус, от которого считается время: AT_CN (от 1-го скана) или
+    FROM_CN (от отправки из Китая). pickup_point=None — по всем ПВЗ.
+    histogram — {номер часа: вес}, из неё пересчитываются перцентили. Вес
+    посылки убывает вдвое за ETA_HALF_LIFE_DAYS от её прибытия; гистограмма
+    приведена к моменту decayed_to, samples — округлённая сумма весов.
+    Пишет только update_transit_stats (см. eta.py).
+    """
+
+    pickup_point = models.ForeignKey(
+        PickupPoint,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name="+",
+        verbose_name="Пункт выдачи",
+    )
+    stage = models.PositiveSmallIntegerField("Отсчёт от статуса", choices=Parcel.Status.choices)
+    samples = models.IntegerField("Посылок", default=0)
+    histogram = models.JSONField("Гистограмма по часам", default=dict)
+    decayed_to = models.DateTimeField("Веса приведены к", null=True, blank=True)
+    p50_seconds = models.IntegerField("Медиана, сек", null=True, blank=True)
+    p90_seconds = models.IntegerField("90-й перцентиль, сек", null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Статистика времени в пути"
+        verbose_name_plural = "Статистика времени в пути"
+        indexes = [
+            models.Index(fields=["pickup_point", "stage"]),
+        ]
+
+    def __str__(self):
+        return f"{self.pickup_point_id or '—'} / {self.stage}: p50={self.p50_seconds}"
+
+
+class ApiToken(models.Model):
+    """
+    Токен интегратора для API ленты изменений (Authorization: Bearer ...).
+    Хранится только SHA-256; с user — лента только по посылкам этого пользователя.
+    """
+
+    name = models.CharField("Название", max_length=100)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="api_tokens",
+        verbose_name="Только посылки пользователя",
+    )
+    key_hash = models.CharField("SHA-256 токена", max_length=64, unique=True, editable=False)
+    is_active = models.BooleanField("Активен", default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField("Последнее использование", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "API-токен"
+        verbose_name_plural = "API-токены"
+
+    def __str__(self):
+        return self.name
+
+
+class ParcelEvent(models.Model):
+    """
+    Outbox смен статуса: пишется в той же транзакции, что и сама смена
+    (см. outbox.py), читается лентой /api/feed/events/ по возрастанию id.
+    """
+
+    parcel = models.ForeignKey(
+        Parcel,
+        on_delete=models.CASCADE,
+        related_name="events",
+        verbose_name="Посылка",
+    )
+    # владелец на момент события — для лент с токеном пользователя
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name="+",
+    )
+    track_number = models.CharField("Трек-номер", max_length=64)
+    old_status = models.PositiveSmallIntegerField("Был статус", choices=Parcel.Status.choices, null=True)
+    status = models.PositiveSmallIntegerField("Статус", choices=Parcel.Status.choices)
+    occurred_at = models.DateTimeField("Время события")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Событие посылки"
+        verbose_name_plural = "События посылок"
+        indexes = [
+            models.Index(fields=["user", "id"]),
+        ]
+
+    def __str__(self):
+        return f"{self.track_number}: {self.old_status} -> {self.status}"
+
+
+class Notification(models.Model):
+    """
+    Очередь уведомлений клиенту (SMS/мессенджер). Ставится в той же
+    транзакции, что и смена статуса; отправляет dispatch_notifications
+    пачками, склеивая посылки одного клиента (см. notifications.py).
+    """
+
+    class State(models.IntegerChoices):
+        PENDING = 0, "В очереди"
+        SENT = 1, "Отправлено"
+        FAILED = 2, "Не отправлено"
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="notifications",
+        verbose_name="Клиент",
+    )
+    parcel = models.ForeignKey(
+        Parcel,
+        on_delete=models.CASCADE,
+        related_name="notifications",
+        verbose_name="Посылка",
+    )
+    status = models.PositiveSmallIntegerField("Статус посылки", choices=Parcel.Status.choices)
+    state = models.PositiveSmallIntegerField("Состояние", choices=State.choices, default=State.PENDING)
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    next_attempt_at = models.DateTimeField("Следующая попытка")
+    last_error = models.CharField("Последняя ошибка", max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField("Отправлено", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Уведомление"
+        verbose_name_plural = "Уведомления"
+        indexes = [
+            # диспетчер читает только очередь — отправленные в индекс не попадают
+            models.Index(
+                fields=["next_attempt_at"],
+                name="notification_pending_idx",
+                condition=Q(state=0),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} / {self.parcel_id} / {self.get_state_display()}"
+
 
 class ParcelHistory(models.Model):
     parcel = models.ForeignKey(
@@ -0,0 +1,261 @@
+"""
+Уведомления клиентам о прибытии посылок в ПВЗ.
+
+Очередь — таблица Notification: строки ставит outbox.emit() для событий
+AT_PICKUP у посылок с владельцем, в той же транзакции, что и 2-й скан
+(сам скан при этом никуда не ходит). Первая попытка — через
+NOTIFY_DELAY_SECONDS, чтобы посылки одного клиента из разных сканов
+успели склеиться в одно сообщение.
+
+dispatch() в три шага: короткой транзакцией забирает созревшие строки
+(SELECT ... FOR UPDATE SKIP LOCKED — можно запускать несколько воркеров)
+вместе с остальными созревшими строками тех же клиентов и сдвигает им
+next_attempt_at на NOTIFY_CLAIM_SECONDS; вне транзакции склеивает их по
+клиенту и шлёт пачками через провайдер из NOTIFY_PROVIDER; второй
+транзакцией записывает итог. Неудачные — повтор с экспоненциальной
+задержкой, после NOTIFY_MAX_ATTEMPTS — FAILED. Доставка «хотя бы один
+раз»: если воркер упадёт между отправкой и записью итога, строки
+созреют снова и сообщение уйдёт повторно.
+"""
+import logging
+import random
+import sys
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .models import CabinetProfile, Notification, Parcel
+
+logger = logging.getLogger("apps.main.notify")
+
+NOTIFY_STATUSES = (Parcel.Status.AT_PICKUP,)
+# SMS короткие: остальные треки — «и ещё N»
+MAX_TRACKS_IN_TEXT = 5
+
+
+@dataclass
+class OutgoingMessage:
+    phone: str
+    text: str
+    notification_ids: list = field(default_factory=list)
+
+
+class NotificationProvider:
+    """
+    Интерфейс провайдера. send_batch получает до max_batch сообщений и
+    возвращает по элементу на каждое: None — отправлено, строка — ошибка.
+    Исключение из send_batch = ошибка для всей пачки.
+    """
+
+    max_batch = 100
+
+    def send_batch(self, messages):
+        raise NotImplementedError
+
+
+class ConsoleProvider(NotificationProvider):
+    """
+    Локальная замена SMS-шлюза: пишет сообщения в stdout и лог.
+    NOTIFY_CONSOLE_FAIL_RATE (0..1) — доля искусственных ошибок для проверки повторов.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.fail_rate = float(getattr(settings, "NOTIFY_CONSOLE_FAIL_RATE", 0.0))
+
+    def send_batch(self, messages):
+        results = []
+        for msg in messages:
+            if self.fail_rate and random.random() < self.fail_rate:
+                results.append("console: simulated failure")
+                continue
+            self.stream.write(f"[notify] {msg.phone}: {msg.text}\n")
+            logger.info("notify %s: %s", msg.phone, msg.text)
+            results.append(None)
+        return results
+
+
+def get_provider() -> NotificationProvider:
+    path = getattr(settings, "NOTIFY_PROVIDER", "apps.main.notifications.ConsoleProvider")
+    return import_string(path)()
+
+
+def _delay() -> timedelta:
+    return timedelta(seconds=float(getattr(settings, "NOTIFY_DELAY_SECONDS", 60)))
+
+
+def _backoff(attempts: int) -> timedelta:
+    base = float(getattr(settings, "NOTIFY_BACKOFF_SECONDS", 30))
+    cap = float(getattr(settings, "NOTIFY_BACKOFF_MAX_SECONDS", 3600))
+    seconds = min(cap, base * (2 ** (attempts - 1)))
+    # разброс, чтобы повторы после сбоя шлюза не шли одной волной
+    return timedelta(seconds=seconds * random.uniform(0.8, 1.2))
+
+
+def enqueue_from_events(events) -> None:
+    """
+    Ставит уведомления по несохранённым/сохранённым ParcelEvent (см. outbox.emit).
+    """
+    now = timezone.now()
+    rows = [
+        Notification(
+            user_id=e.user_id,
+            parcel_id=e.parcel_id,
+            status=e.status,
+            next_attempt_at=now + _delay(),
+        )
+        for e in events
+        if e.user_id is not None and e.status in NOTIFY_STATUSES
+    ]
+    if rows:
+        Notification.objects.bulk_create(rows, batch_size=2000)
+
+
+def _phone_for(user_ids) -> dict:
+    """
+    Телефон из профиля; логин клиента — тоже телефон, поэтому он запасной.
+    """
+    phones = {}
+    for row in CabinetProfile.objects.filter(user_id__in=user_ids).values("user_id", "phone", "user__username"):
+        phones[row["user_id"]] = (row["phone"] or row["user__username"] or "").strip()
+    return phones
+
+
+def _compose(items) -> str:
+    """
+    items: [(трек, ПВЗ)] одного клиента -> текст сообщения.
+    """
+    by_point = {}
+    for track, point in items:
+        by_point.setdefault(point or "", []).append(track)
+    parts = []
+    for point, tracks in by_point.items():
+        where = f"в пункт выдачи «{point}»" if point else "в пункт выдачи"
+        if len(tracks) == 1:
+            parts.append(f"Посылка {tracks[0]} прибыла {where}.")
+        else:
+            shown = ", ".join(tracks[:MAX_TRACKS_IN_TEXT])
+            more = len(tracks) - MAX_TRACKS_IN_TEXT
+            if more > 0:
+                shown += f" и ещё {more}"
+            parts.append(f"Посылки прибыли {where}: {shown}.")
+    return " ".join(parts)
+
+
+def _claim_seconds() -> timedelta:
+    return timedelta(seconds=float(getattr(settings, "NOTIFY_CLAIM_SECONDS", 300)))
+
+
+def _claim(batch_size: int, now) -> list:
+    """
+    Забирает до batch_size созревших строк и остальные созревшие строки тех
+    же клиентов — иначе граница пачки разрезала бы одно сообщение на два.
+    next_attempt_at сдвигается на NOTIFY_CLAIM_SECONDS, и после коммита
+    строки не видны другим воркерам, пока идёт отправка.
+    """
+    with transaction.atomic():
+        # of=("self",): блокируем только очередь, не посылки из JOIN
+        due = Notification.objects.select_for_update(skip_locked=True, of=("self",)).filter(
+            state=Notification.State.PENDING, next_attempt_at__lte=now
+        )
+        first = list(due.order_by("next_attempt_at").values("id", "user_id")[:batch_size])
+        if not first:
+            return []
+        ids = {r["id"] for r in first}
+        ids.update(due.filter(user_id__in={r["user_id"] for r in first}).values_list("id", flat=True))
+        Notification.objects.filter(pk__in=ids).update(next_attempt_at=now + _claim_seconds())
+        return list(
+            Notification.objects.filter(pk__in=ids)
+            .order_by("id")
+            .values("id", "user_id", "attempts", "parcel__track_number", "parcel__pickup_point__name")
+        )
+
+
+def _send(provider: NotificationProvider, messages) -> tuple:
+    """
+    Отправка вне транзакции -> (id отправленных, {id: ошибка}).
+    """
+    sent_ids, failed = [], {}
+    for i in range(0, len(messages), provider.max_batch):
+        chunk = messages[i:i + provider.max_batch]
+        try:
+            results = provider.send_batch(chunk)
+        except Exception as e:
+            logger.warning("notify provider error: %s", e)
+            results = [f"{type(e).__name__}: {e}"] * len(chunk)
+        for msg, error in zip(chunk, results):
+            if error is None:
+                sent_ids.extend(msg.notification_ids)
+            else:
+                failed.update({pk: str(error)[:255] for pk in msg.notification_ids})
+    return sent_ids, failed
+
+
+def dispatch(batch_size: int | None = None, provider: NotificationProvider | None = None) -> dict:
+    """
+    Один проход по созревшей очереди (до batch_size строк плюс остальные
+    строки тех же клиентов). Возвращает {"notifications", "messages", "sent", "retry", "failed"}.
+    """
+    batch_size = batch_size or int(getattr(settings, "NOTIFY_BATCH_SIZE", 500))
+    max_attempts = int(getattr(settings, "NOTIFY_MAX_ATTEMPTS", 6))
+    provider = provider or get_provider()
+    stats = {"notifications": 0, "messages": 0, "sent": 0, "retry": 0, "failed": 0}
+
+    now = timezone.now()
+    rows = _claim(batch_size, now)
+    if not rows:
+        return stats
+    stats["notifications"] = len(rows)
+    attempts = {r["id"]: r["attempts"] for r in rows}
+
+    by_user = {}
+    for r in rows:
+        by_user.setdefault(r["user_id"], []).append(r)
+    phones = _phone_for(list(by_user))
+
+    messages, no_phone = [], []
+    for user_id, items in by_user.items():
+        ids = [r["id"] for r in items]
+        phone = phones.get(user_id)
+        if not phone:
+            no_phone.extend(ids)
+            continue
+        text = _compose([(r["parcel__track_number"], r["parcel__pickup_point__name"]) for r in items])
+        messages.append(OutgoingMessage(phone=phone, text=text, notification_ids=ids))
+
+    sent_ids, failed = _send(provider, messages)
+    stats["messages"] = len(messages)
+
+    done = timezone.now()
+    with transaction.atomic():
+        if sent_ids:
+            Notification.objects.filter(pk__in=sent_ids).update(
+                state=Notification.State.SENT, sent_at=done, last_error=""
+            )
+        if no_phone:
+            Notification.objects.filter(pk__in=no_phone).update(
+                state=Notification.State.FAILED, last_error="нет телефона"
+            )
+        # попытки у строк разные — неудачные обновляем по одной
+        for pk, error in failed.items():
+            tries = attempts[pk] + 1
+            if tries >= max_attempts:
+                values = {"state": Notification.State.FAILED}
+                stats["failed"] += 1
+            else:
+                values = {"next_attempt_at": done + _backoff(tries)}
+                stats["retry"] += 1
+            Notification.objects.filter(pk=pk).update(attempts=tries, last_error=error, **values)
+
+    stats["sent"] = len(sent_ids)
+    stats["failed"] += len(no_phone)
+    metrics.inc("kargo_notify_notifications_total", {"result": "sent"}, stats["sent"])
+    metrics.inc("kargo_notify_notifications_total", {"result": "retry"}, stats["retry"])
+    metrics.inc("kargo_notify_notifications_total", {"result": "failed"}, stats["failed"])
+    metrics.inc("kargo_notify_messages_total", value=stats["messages"])
+    return stats
@@ -0,0 +1,160 @@
+"""
+Outbox смен статуса посылок (ParcelEvent) и чтение ленты изменений.
+
+Событие пишется в той же транзакции, что и смена статуса — либо оба
+видны, либо ни одного. Там же ставятся уведомления клиенту
+(notifications.py). Внутри deferred() события копятся и вставляются
+одним bulk_create при выходе (пачки process_parcel_flows).
+
+Лента отдаёт события по возрастанию id после курсора ?after=. id
+выдаются при INSERT, а коммитятся транзакции не по порядку, поэтому
+события моложе CHANGE_FEED_SAFETY_SECONDS не отдаются: иначе клиент
+сдвинул бы курсор за ещё не закоммиченное событие и потерял его.
+"""
+import hashlib
+import secrets
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ApiToken, ParcelEvent
+from .notifications import enqueue_from_events
+
+FEED_MAX_LIMIT = 5000
+
+# Накопитель deferred(): список несохранённых ParcelEvent или None
+_pending = ContextVar("main_outbox_pending", default=None)
+
+
+def _safety_seconds() -> float:
+    return float(getattr(settings, "CHANGE_FEED_SAFETY_SECONDS", 10))
+
+
+def make_event(parcel_id, track_number, user_id, old_status, status, occurred_at) -> ParcelEvent:
+    return ParcelEvent(
+        parcel_id=parcel_id,
+        track_number=track_number,
+        user_id=user_id,
+        old_status=old_status,
+        status=status,
+        occurred_at=occurred_at,
+    )
+
+
+def emit(events) -> None:
+    """
+    Записывает события (список make_event) — сразу или в конце deferred().
+    """
+    if not events:
+        return
+    pending = _pending.get()
+    if pending is not None:
+        pending.extend(events)
+        return
+    ParcelEvent.objects.bulk_create(events, batch_size=2000)
+    enqueue_from_events(events)
+
+
+@contextmanager
+def deferred():
+    """
+    Копит события до конца блока и вставляет одним bulk_create.
+    Использовать внутри транзакции, в которой меняются посылки.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    events = []
+    token = _pending.set(events)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    emit(events)
+
+
+def hash_token(raw: str) -> str:
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def create_token(name: str, user=None):
+    """
+    Новый токен ленты: (ApiToken, сырой токен). Сырой показывается один раз.
+    """
+    raw = secrets.token_urlsafe(32)
+    return ApiToken.objects.create(name=name, user=user, key_hash=hash_token(raw)), raw
+
+
+def authenticate_token(header: str):
+    """
+    "Bearer <токен>" -> активный ApiToken или None. Ищем по хэшу,
+    сравнение строк с секретом не нужно.
+    """
+    scheme, _, raw = (header or "").partition(" ")
+    if scheme.lower() != "bearer" or not raw.strip():
+        return None
+    return ApiToken.objects.filter(key_hash=hash_token(raw.strip()), is_active=True).first()
+
+
+def read_feed(after: int = 0, limit: int = 1000, user_id=None) -> dict:
+    """
+    Страница ленты после курсора after: {"events", "next_after", "has_more"}.
+    user_id — только события посылок этого пользователя (индекс (user, id)).
+    """
+    limit = max(1, min(limit, FEED_MAX_LIMIT))
+    qs = ParcelEvent.objects.filter(id__gt=after)
+    if user_id is not None:
+        qs = qs.filter(user_id=user_id)
+    rows = list(
+        qs.order_by("id").values(
+            "id", "parcel_id", "track_number", "old_status", "status", "occurred_at", "created_at"
+        )[: limit + 1]
+    )
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cutoff = timezone.now() - timedelta(seconds=_safety_seconds())
+    for i, row in enumerate(rows):
+        if row["created_at"] > cutoff:
+            # дальше могут быть «дыры» от незакоммиченных транзакций — отдадим в следующий раз
+            rows = rows[:i]
+            has_more = False
+            break
+
+    return {
+        "events": [
+            {
+                "id": r["id"],
+                "parcel_id": r["parcel_id"],
+                "track_number": r["track_number"],
+                "old_status": r["old_status"],
+                "status": r["status"],
+                "occurred_at": r["occurred_at"].isoformat(),
+            }
+            for r in rows
+        ],
+        "next_after": rows[-1]["id"] if rows else after,
+        "has_more": has_more,
+    }
+
+
+def prune_events(older_than_days: int, batch_size: int = 10000) -> int:
+    """
+    Удаляет события старше older_than_days пачками по id (по created_at
+    индекса нет: id растут вместе со временем, ищем границу один раз).
+    Возвращает число удалённых строк.
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    boundary = (
+        ParcelEvent.objects.filter(created_at__gte=cutoff).order_by("id").values_list("id", flat=True).first()
+    )
+    qs = ParcelEvent.objects.all() if boundary is None else ParcelEvent.objects.filter(id__lt=boundary)
+    deleted = 0
+    while True:
+        ids = list(qs.order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += ParcelEvent.objects.filter(id__in=ids).delete()[0]
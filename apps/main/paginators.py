@@ -0,0 +1,57 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших changelist-ов без точного COUNT(*).
+
+    - без фильтров на PostgreSQL — оценка из pg_class.reltuples (мгновенно);
+    - иначе — «ограниченный» подсчёт: SELECT COUNT(*) FROM (... LIMIT n + 1),
+      где n — записи до текущей страницы плюс count_cap. Дальше не считаем,
+      но с последней посчитанной страницы окно сдвигается вперёд, так что
+      листать можно до конца; в шаблоне — «больше n» (is_capped).
+
+    Последние страницы при оценке могут оказаться пустыми — admin в таком
+    случае сам возвращает на первую.
+    """
+
+    count_cap = 10000
+
+    def __init__(self, *args, current_page=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.current_page = max(1, current_page)
+        # подсчёт упёрся в count_limit — записей больше, чем показано
+        self.is_capped = False
+
+    @cached_property
+    def count_limit(self):
+        return (self.current_page - 1) * self.per_page + self.count_cap
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        query = getattr(qs, "query", None)
+        if query is None:
+            return super().count
+
+        if not query.where:
+            estimate = self._estimate(qs)
+            if estimate is not None and estimate > self.count_cap:
+                return estimate
+
+        count = qs.order_by()[: self.count_limit + 1].count()
+        self.is_capped = count > self.count_limit
+        return count
+
+    @staticmethod
+    def _estimate(qs):
+        connection = connections[qs.db]
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [qs.model._meta.db_table])
+            row = cursor.fetchone()
+        # reltuples = -1, пока таблицу не анализировали
+        return int(row[0]) if row and row[0] > 0 else None
@@ -0,0 +1,138 @@
+"""
+Профилирование по запросу: cProfile вокруг одного HTTP-запроса
+(?__profile=1, только суперпользователь) или команды (--profile).
+
+Сырые данные сохраняются в PROFILE_DIR/<метка>-<время>.prof (открывать
+python -m pstats, snakeviz и т.п.), рядом — .txt со сводкой top-N.
+
+cProfile видит только свой поток, а async-view под WSGI выполняются в
+потоке event loop, который запускает async_to_sync. Поэтому профиль
+запроса (threads=True) ставит threading.setprofile: в потоке, начатом за
+время профиля, свой cProfile включается, как только поток начинает работать
+в контексте этого профиля (contextvars async_to_sync переносит). Потоки
+чужих запросов в профиль не попадают.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+SORT_KEYS = ("cumulative", "tottime", "ncalls")
+
+_SAFE_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+# профиль текущего запроса — виден и в потоке event loop async_to_sync
+_current = ContextVar("main_profile", default=None)
+# threading.setprofile один на процесс — и профиль с потоками тоже один
+_threads_lock = threading.Lock()
+_active = None
+
+
+class ProfileBusy(RuntimeError):
+    pass
+
+
+def _profile_dir():
+    return getattr(settings, "PROFILE_DIR", None)
+
+
+def _top_n() -> int:
+    return int(getattr(settings, "PROFILE_TOP", 30))
+
+
+class ProfileResult:
+    def __init__(self, profiler, label: str, wall_seconds: float):
+        # первый — поток, который профиль начал; дальше — потоки, подключившиеся по ходу
+        self.profilers = [profiler]
+        self.closed = False
+        self.label = label
+        self.wall_seconds = wall_seconds
+        self.path = None
+
+    def summary(self, sort: str = "cumulative", top: int | None = None) -> str:
+        if sort not in SORT_KEYS:
+            sort = "cumulative"
+        out = io.StringIO()
+        out.write(f"{self.label}: wall {self.wall_seconds * 1000:.1f} ms\n")
+        if self.path:
+            out.write(f"saved: {self.path}\n")
+        stats = pstats.Stats(*self.profilers, stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(top or _top_n())
+        return out.getvalue()
+
+    def save(self) -> str:
+        """
+        Пишет .prof и .txt в PROFILE_DIR; без PROFILE_DIR — ничего (вернёт None).
+        """
+        directory = _profile_dir()
+        if not directory:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(directory, f"{_SAFE_RE.sub('_', self.label)[:80]}-{stamp}-{os.getpid()}")
+        self.path = f"{base}.prof"
+        pstats.Stats(*self.profilers).dump_stats(self.path)
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(self.summary())
+        return self.path
+
+
+def _thread_hook(frame, event, arg):
+    """
+    Профилирующая функция новых потоков (threading.setprofile): включает
+    поток в профиль, когда в нём появляется контекст профиля; после конца
+    профиля снимает себя.
+    """
+    result = _current.get()
+    if result is None:
+        if _active is None:
+            sys.setprofile(None)
+        return
+    if result.closed:
+        sys.setprofile(None)
+        return
+    profiler = cProfile.Profile()
+    result.profilers.append(profiler)
+    # заменяет эту функцию в потоке на cProfile
+    profiler.enable()
+
+
+@contextmanager
+def profiled(label: str, threads: bool = False):
+    """
+    with profiled("command:process_parcel_flows") as result: ...
+    После выхода из блока result готов к save()/summary().
+    threads=True — ещё и потоки, которые блок запустил (для HTTP-запроса
+    с async-view); такой профиль одновременно только один, иначе ProfileBusy.
+    """
+    global _active
+    profiler = cProfile.Profile()
+    result = ProfileResult(profiler, label, 0.0)
+    token = None
+    if threads:
+        if not _threads_lock.acquire(blocking=False):
+            raise ProfileBusy("Уже идёт профилирование другого запроса.")
+        _active = result
+        token = _current.set(result)
+        threading.setprofile(_thread_hook)
+    t0 = time.perf_counter()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        result.wall_seconds = time.perf_counter() - t0
+        if threads:
+            threading.setprofile(None)
+            result.closed = True
+            _active = None
+            _current.reset(token)
+            _threads_lock.release()
@@ -0,0 +1,299 @@
+"""
+Сверка Parcel.status / auto_flow_stage с ParcelHistory.
+
+Статус и история пишутся отдельными запросами (_advance_cn_flow, 2-й скан,
+админка — та историю не пишет вовсе), поэтому после сбоев и ручных правок
+они расходятся. Посылки проверяются кусками по диапазону id: на кусок —
+один SELECT посылок и один SELECT их истории (индекс (parcel, occurred_at)).
+
+Виды расхождений:
+  stage_behind  — в истории есть этап Китая, а auto_flow_stage меньше
+                  (упали между вставкой истории и сохранением посылки);
+  cn_history    — auto_flow_stage больше, чем этапов Китая в истории;
+  status_behind — последняя запись истории новее статуса посылки, а сама
+                  посылка после неё не менялась;
+  history_behind — статус посылки не совпадает с последней записью истории
+                  (ручная правка) или истории нет вовсе.
+
+Починка (repair): этапы Китая детерминированы (t0 + смещения), поэтому
+недостающие строки вставляются, а стадия и статус догоняются до истории;
+для ручных правок в историю добавляется строка текущего статуса. Смены
+статуса проходят через счётчики и outbox, как и везде. За проход у
+посылки чинится одно расхождение (сначала Китай) — остальное найдёт следующий.
+
+Без repair посылки не блокируются, и в отчёт может попасть посылка, которую
+в этот момент двигает другая транзакция; с repair кусок берётся под
+SELECT ... FOR UPDATE, и такого не бывает.
+"""
+import multiprocessing
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+import django
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .auto_status import (
+    CN_STAGE_1_MESSAGE,
+    CN_STAGE_2_MESSAGE,
+    CN_STAGE_2_OFFSET,
+    CN_STAGE_3_MESSAGE,
+    CN_STAGE_3_OFFSET,
+    _bulk_add_history,
+    _hash_message,
+    _history_row,
+    _norm_dt,
+    _pickup_message,
+)
+from .counters import record_moves
+from .models import JobWatermark, Parcel, ParcelHistory, PickupPoint
+from .outbox import emit, make_event
+
+JOB_NAME = "reconcile_parcels"
+CHUNK_SIZE = 2000
+# примеров расхождений на кусок в отчёте
+SAMPLES_PER_CHUNK = 5
+
+KINDS = ("stage_behind", "cn_history", "status_behind", "history_behind")
+
+# этап Китая -> (статус, текст, смещение от t0)
+CN_STAGES = {
+    1: (Parcel.Status.AT_CN, CN_STAGE_1_MESSAGE, None),
+    2: (Parcel.Status.AT_CN, CN_STAGE_2_MESSAGE, CN_STAGE_2_OFFSET),
+    3: (Parcel.Status.FROM_CN, CN_STAGE_3_MESSAGE, CN_STAGE_3_OFFSET),
+}
+_CN_STAGE_BY_HASH = {(status, _hash_message(msg)): stage for stage, (status, msg, _) in CN_STAGES.items()}
+
+
+def _job_name(repair: bool) -> str:
+    return f"{JOB_NAME}:repair" if repair else JOB_NAME
+
+
+def _cn_rows(parcel_id, started_at, upto_stage):
+    rows = []
+    for stage in range(1, upto_stage + 1):
+        status, msg, offset = CN_STAGES[stage]
+        rows.append(_history_row(parcel_id, status, msg, started_at + offset if offset else started_at))
+    return rows
+
+
+def _status_row(parcel, points, occurred_at):
+    """
+    Строка истории для текущего статуса посылки (после ручной правки).
+    """
+    status = parcel["status"]
+    if status == Parcel.Status.AT_PICKUP:
+        msg = _pickup_message(points.get(parcel["pickup_point_id"]), parcel["track_number"])
+    elif status == Parcel.Status.AT_CN:
+        msg = CN_STAGE_1_MESSAGE
+    elif status == Parcel.Status.FROM_CN:
+        msg = CN_STAGE_3_MESSAGE
+    else:
+        msg = Parcel.Status(status).label
+    return _history_row(parcel["id"], status, msg, occurred_at)
+
+
+def _check(parcel, history):
+    """
+    Одна посылка и её история (по возрастанию occurred_at, id) ->
+    (вид расхождения или None, исправления {"stage", "status", "rows", "status_row", "after"}).
+    """
+    # стадии выше 3 остались от старой цепочки (Кашгар/Бишкек) — для сверки это 3
+    stage = min(parcel["auto_flow_stage"], max(CN_STAGES))
+    status = parcel["status"]
+    started = parcel["auto_flow_started_at"]
+    kind = None
+    fix = {}
+
+    if started is not None:
+        # у старых строк message_hash пустой — считаем по тексту
+        seen = [
+            _CN_STAGE_BY_HASH.get((h["status"], h["message_hash"] or _hash_message(h["message"])))
+            for h in history
+        ]
+        evidenced = max((s for s in seen if s), default=0)
+        if evidenced > stage:
+            kind = "stage_behind"
+            fix["stage"] = evidenced
+            if status < CN_STAGES[evidenced][0]:
+                fix["status"] = CN_STAGES[evidenced][0]
+        elif stage > evidenced or len({s for s in seen if s}) < evidenced:
+            kind = "cn_history"
+            fix["rows"] = _cn_rows(parcel["id"], _norm_dt(started), stage)
+        if kind:
+            return kind, fix
+
+    if not history:
+        if status == Parcel.Status.WAITING_CN:
+            return None, fix
+        return "history_behind", {"status_row": True}
+
+    latest = history[-1]
+    if latest["status"] == status:
+        return None, fix
+    if latest["status"] > status and parcel["updated_at"] <= latest["occurred_at"]:
+        return "status_behind", {"status": latest["status"]}
+    # новая строка должна встать последней, иначе следующий проход снова её не увидит
+    return "history_behind", {"status_row": True, "after": latest["occurred_at"]}
+
+
+def check_chunk(lo: int, hi: int, repair: bool = False) -> dict:
+    """
+    Проверяет (и при repair чинит) посылки с id из [lo, hi).
+    Возвращает {"lo", "hi", "parcels", "mismatches": {вид: n}, "samples", "repaired"}.
+    """
+    result = {"lo": lo, "hi": hi, "parcels": 0, "mismatches": Counter(), "samples": [], "repaired": 0}
+    with transaction.atomic():
+        qs = Parcel.objects.filter(id__gte=lo, id__lt=hi).order_by("id")
+        if repair:
+            qs = qs.select_for_update()
+        parcels = list(
+            qs.values(
+                "id", "track_number", "user_id", "status", "auto_flow_stage", "auto_flow_started_at",
+                "pickup_point_id", "updated_at",
+            )
+        )
+        result["parcels"] = len(parcels)
+        if not parcels:
+            return result
+
+        history = defaultdict(list)
+        for h in (
+            ParcelHistory.objects.filter(parcel_id__gte=lo, parcel_id__lt=hi)
+            .order_by("parcel_id", "occurred_at", "id")
+            .values("parcel_id", "status", "message", "message_hash", "occurred_at")
+        ):
+            history[h["parcel_id"]].append(h)
+
+        found = []
+        for p in parcels:
+            kind, fix = _check(p, history.get(p["id"], ()))
+            if kind is None:
+                continue
+            result["mismatches"][kind] += 1
+            if len(result["samples"]) < SAMPLES_PER_CHUNK:
+                latest = history[p["id"]][-1]["status"] if history.get(p["id"]) else None
+                result["samples"].append((p["track_number"], kind, p["status"], latest))
+            found.append((p, fix))
+
+        if repair and found:
+            _repair(found)
+            result["repaired"] = len(found)
+
+    result["mismatches"] = dict(result["mismatches"])
+    return result
+
+
+def _repair(found) -> None:
+    """
+    Исправления куска одним заходом: bulk-вставка истории и по UPDATE на
+    каждую пару (стадия, статус); смены статуса — в счётчики и outbox.
+    """
+    now = _norm_dt(timezone.now())
+    point_ids = {p["pickup_point_id"] for p, fix in found if fix.get("status_row") and p["pickup_point_id"]}
+    points = PickupPoint.objects.in_bulk(point_ids) if point_ids else {}
+
+    rows = []
+    updates = defaultdict(list)  # (stage, status) -> [id]
+    moves = Counter()
+    events = []
+    for p, fix in found:
+        rows.extend(fix.get("rows", ()))
+        if fix.get("status_row"):
+            occurred_at = p["updated_at"]
+            if fix.get("after"):
+                # _history_row отбрасывает микросекунды — берём следующую секунду
+                occurred_at = max(occurred_at, _norm_dt(fix["after"]) + timedelta(seconds=1))
+            rows.append(_status_row(p, points, min(occurred_at, now)))
+        if "stage" in fix or "status" in fix:
+            new_status = fix.get("status", p["status"])
+            updates[(fix.get("stage"), new_status)].append(p["id"])
+            if new_status != p["status"]:
+                moves[(p["user_id"], p["status"], new_status)] += 1
+                events.append(make_event(p["id"], p["track_number"], p["user_id"], p["status"], new_status, now))
+
+    if rows:
+        _bulk_add_history(rows)
+    for (stage, status), ids in updates.items():
+        values = {"status": status}
+        if stage is not None:
+            values["auto_flow_stage"] = stage
+        Parcel.objects.filter(pk__in=ids).update(**values)
+    if moves:
+        record_moves(moves)
+    emit(events)
+
+
+def reconcile(workers: int = 4, chunk_size: int = CHUNK_SIZE, repair: bool = False, restart: bool = False,
+              on_chunk=None) -> dict:
+    """
+    Проходит все посылки кусками по chunk_size id в workers процессах.
+
+    Прогресс хранится в JobWatermark(_job_name(repair)).last_id: все id <=
+    last_id проверены. Отчёт и починка ведут разные знаки — иначе прерванный
+    отчёт заставил бы починку пропустить начало таблицы. Куски завершаются
+    не по порядку, поэтому знак двигается только до первого незавершённого
+    куска; прерванный запуск продолжится с него (restart=True — с начала).
+    После полного прохода знак удаляется.
+    on_chunk(result, totals) — после каждого куска (в основном процессе).
+    """
+    name = _job_name(repair)
+    if restart:
+        JobWatermark.objects.filter(name=name).delete()
+    mark, _ = JobWatermark.objects.get_or_create(name=name)
+    max_id = Parcel.objects.aggregate(m=Max("id"))["m"] or 0
+    chunks = [(lo, min(lo + chunk_size, max_id + 1)) for lo in range(mark.last_id + 1, max_id + 1, chunk_size)]
+
+    totals = {"parcels": 0, "chunks": 0, "repaired": 0, "mismatches": Counter(), "samples": [],
+              "resumed_from": mark.last_id}
+    finished = set()
+    frontier = 0  # индекс первого незавершённого куска
+
+    def finish(result):
+        nonlocal frontier
+        totals["parcels"] += result["parcels"]
+        totals["chunks"] += 1
+        totals["repaired"] += result["repaired"]
+        totals["mismatches"].update(result["mismatches"])
+        totals["samples"].extend(result["samples"])
+        finished.add(result["lo"])
+        moved = False
+        while frontier < len(chunks) and chunks[frontier][0] in finished:
+            finished.discard(chunks[frontier][0])
+            frontier += 1
+            moved = True
+        if moved:
+            JobWatermark.objects.filter(pk=mark.pk).update(
+                last_id=chunks[frontier - 1][1] - 1, updated_at=timezone.now()
+            )
+        if on_chunk is not None:
+            on_chunk(result, totals)
+
+    if workers <= 1:
+        for lo, hi in chunks:
+            finish(check_chunk(lo, hi, repair=repair))
+    else:
+        tasks = iter(chunks)
+        # spawn, а не fork: воркер открывает своё соединение и не делит сокет с родителем.
+        # initializer — сам django.setup: этот модуль нельзя импортировать до него
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            running = set()
+            while True:
+                # не больше нескольких кусков на воркер в очереди — память и прогресс
+                while len(running) < workers * 2:
+                    chunk = next(tasks, None)
+                    if chunk is None:
+                        break
+                    running.add(pool.submit(check_chunk, chunk[0], chunk[1], repair))
+                if not running:
+                    break
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future.result())
+
+    JobWatermark.objects.filter(pk=mark.pk).delete()
+    totals["mismatches"] = dict(totals["mismatches"])
+    return totals
@@ -0,0 +1,140 @@
+"""
+Кэш справочных данных (SiteSettings, активные PickupPoint, статистика
+времени в пути для ETA) в памяти процесса.
+
+Каждое значение живёт REFDATA_CACHE_TTL секунд и сбрасывается раньше,
+если изменилась общая версия в Django-кэше: её увеличивают сигналы
+post_save/post_delete (см. signals.py). Обычный рендер страницы не делает
+ни одного запроса к БД за этими моделями.
+
+Сброс во всех воркерах работает, только если кэш общий (CACHES, например
+shm_cache.SharedMemoryCache). С LocMemCache версия у каждого процесса своя,
+и остальные воркеры увидят изменения лишь через TTL — об этом
+предупреждает проверка main.W001.
+"""
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+
+from .eta import load_stats
+from .models import PickupPoint, SiteSettings
+
+VERSION_KEY = "main:refdata:version"
+
+# кэши, которые живут в памяти одного процесса
+PROCESS_LOCAL_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+_local = {}
+_lock = threading.Lock()
+
+
+def _ttl() -> float:
+    return float(getattr(settings, "REFDATA_CACHE_TTL", 300))
+
+
+def _current_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_version() -> None:
+    """
+    Инвалидирует справочники во всех процессах, которые видят общий кэш.
+    """
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # ключа ещё нет (или его вытеснили) — любая новая версия отличается от старой
+        cache.set(VERSION_KEY, int(time.time()), timeout=None)
+    with _lock:
+        _local.clear()
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs=None, **kwargs):
+    backend = type(caches["default"])
+    if f"{backend.__module__}.{backend.__qualname__}" not in PROCESS_LOCAL_CACHES:
+        return []
+    return [
+        checks.Warning(
+            "Кэш по умолчанию не общий для процессов: изменения SiteSettings и пунктов "
+            "выдачи дойдут до других воркеров только через REFDATA_CACHE_TTL.",
+            hint="Укажите в CACHES общий бэкенд, например apps.main.shm_cache.SharedMemoryCache.",
+            id="main.W001",
+        )
+    ]
+
+
+_MISSING = object()
+
+
+def _fresh(name: str, version):
+    entry = _local.get(name)
+    if entry and entry[0] == version and entry[1] > time.monotonic():
+        return entry[2]
+    return _MISSING
+
+
+def _cached(name: str, loader):
+    version = _current_version()
+    value = _fresh(name, version)
+    if value is not _MISSING:
+        return value
+
+    now = time.monotonic()
+    value = loader()
+    with _lock:
+        _local[name] = (version, now + _ttl(), value)
+    return value
+
+
+def get_site_settings():
+    return _cached("site_settings", lambda: SiteSettings.objects.first())
+
+
+def get_active_pickup_points():
+    """
+    Кортеж активных пунктов выдачи, отсортированных по имени.
+    """
+    return _cached(
+        "pickup_points",
+        lambda: tuple(PickupPoint.objects.filter(is_active=True).order_by("name")),
+    )
+
+
+def get_active_pickup_point(pk):
+    """
+    Активный пункт выдачи по pk (строка из формы тоже подходит) или None.
+    """
+    for point in get_active_pickup_points():
+        if str(point.pk) == str(pk):
+            return point
+    return None
+
+
+def get_transit_stats() -> dict:
+    """
+    Перцентили времени в пути (eta.load_stats). Пересчитываются периодически
+    командой update_transit_stats, поэтому хватает TTL без сброса по сигналам.
+    """
+    return _cached("transit_stats", load_stats)
+
+
+async def aget_transit_stats() -> dict:
+    """
+    То же для async-view: в sync-поток уходим, только если кэш устарел.
+    """
+    value = _fresh("transit_stats", _current_version())
+    if value is not _MISSING:
+        return value
+    return await sync_to_async(get_transit_stats)()
@@ -0,0 +1,206 @@
+"""
+Сводки для дашборда сотрудника: DailyRollup по (день, ПВЗ, статус).
+
+update_rollups() читает только новые строки ParcelHistory — после
+JobWatermark("daily_rollup").last_id, по возрастанию id — и прибавляет их
+к агрегатам. Строки моложе ROLLUP_SAFETY_SECONDS не берутся: id выдаются
+при INSERT, а коммит более ранней транзакции может прийти позже, и
+водяной знак проскочил бы её строки.
+
+Событие — переход в статус: на AT_CN _advance_cn_flow пишет две строки
+(этапы 1 и 2), считается только первая.
+
+Удалённая история (вместе с посылкой) из сводок не вычитается — для
+точной картины есть update_rollups --rebuild.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .auto_status import CN_STAGE_1_MESSAGE, _hash_message
+from .models import DailyRollup, JobWatermark, Parcel, ParcelHistory, PickupPoint
+
+JOB_NAME = "daily_rollup"
+BATCH_SIZE = 5000
+
+# ПВЗ в сводке — только у событий, которые происходят в ПВЗ
+POINT_STATUSES = (Parcel.Status.AT_PICKUP, Parcel.Status.RECEIVED)
+
+_CN_STAGE_1_HASH = _hash_message(CN_STAGE_1_MESSAGE)
+
+
+def _safety_seconds() -> float:
+    return float(getattr(settings, "ROLLUP_SAFETY_SECONDS", 120))
+
+
+def _aggregate(rows):
+    """
+    Строки истории -> {(day, pickup_point_id, status): [events, transit_sum, transit_count]}.
+    """
+    acc = defaultdict(lambda: [0, 0, 0])
+    for row in rows:
+        status = row["status"]
+        # у старых строк message_hash пустой — считаем по тексту
+        if status == Parcel.Status.AT_CN and (row["message_hash"] or _hash_message(row["message"])) != _CN_STAGE_1_HASH:
+            continue
+        point_id = row["parcel__pickup_point_id"] if status in POINT_STATUSES else None
+        bucket = acc[(timezone.localdate(row["occurred_at"]), point_id, status)]
+        bucket[0] += 1
+        started = row["parcel__auto_flow_started_at"]
+        if status == Parcel.Status.AT_PICKUP and started and row["occurred_at"] >= started:
+            bucket[1] += int((row["occurred_at"] - started).total_seconds())
+            bucket[2] += 1
+    return acc
+
+
+def _merge(acc) -> None:
+    """
+    Прибавляет агрегаты пачки к DailyRollup: одним SELECT существующих строк
+    за затронутые дни, bulk_update для них и bulk_create для новых.
+    """
+    existing = {
+        (r.day, r.pickup_point_id, r.status): r
+        for r in DailyRollup.objects.filter(day__in={key[0] for key in acc})
+    }
+    to_update, to_create = [], []
+    for (day, point_id, status), (events, transit_sum, transit_count) in acc.items():
+        row = existing.get((day, point_id, status))
+        if row is None:
+            to_create.append(
+                DailyRollup(
+                    day=day,
+                    pickup_point_id=point_id,
+                    status=status,
+                    events=events,
+                    transit_seconds_sum=transit_sum,
+                    transit_count=transit_count,
+                )
+            )
+        else:
+            row.events += events
+            row.transit_seconds_sum += transit_sum
+            row.transit_count += transit_count
+            to_update.append(row)
+    if to_update:
+        DailyRollup.objects.bulk_update(to_update, ["events", "transit_seconds_sum", "transit_count"])
+    if to_create:
+        DailyRollup.objects.bulk_create(to_create)
+
+
+def update_rollups(batch_size: int = BATCH_SIZE, max_batches: int | None = None, on_batch=None) -> dict:
+    """
+    Догоняет сводки до текущего момента (минус запас). Каждая пачка —
+    одна транзакция вместе со сдвигом водяного знака, поэтому прерванный
+    запуск ничего не посчитает дважды. Возвращает {"rows", "batches", "last_id"}.
+    """
+    rows_total = 0
+    batches = 0
+    last_id = 0
+    done = False
+
+    while not done and (max_batches is None or batches < max_batches):
+        cutoff = timezone.now() - timedelta(seconds=_safety_seconds())
+        with transaction.atomic():
+            mark, _ = JobWatermark.objects.select_for_update().get_or_create(name=JOB_NAME)
+            rows = list(
+                ParcelHistory.objects.filter(id__gt=mark.last_id)
+                .order_by("id")
+                .values(
+                    "id",
+                    "status",
+                    "message",
+                    "message_hash",
+                    "occurred_at",
+                    "created_at",
+                    "parcel__pickup_point_id",
+                    "parcel__auto_flow_started_at",
+                )[:batch_size]
+            )
+            # до первой слишком свежей строки: дальше могут быть «дыры» от незакоммиченных транзакций
+            for i, row in enumerate(rows):
+                if row["created_at"] > cutoff:
+                    rows = rows[:i]
+                    done = True
+                    break
+            if len(rows) < batch_size:
+                done = True
+            if rows:
+                _merge(_aggregate(rows))
+                mark.last_id = rows[-1]["id"]
+                mark.save(update_fields=["last_id", "updated_at"])
+            last_id = mark.last_id
+
+        if rows:
+            batches += 1
+            rows_total += len(rows)
+            if on_batch is not None:
+                on_batch(batches, rows_total, last_id)
+
+    return {"rows": rows_total, "batches": batches, "last_id": last_id}
+
+
+def reset_rollups() -> None:
+    with transaction.atomic():
+        DailyRollup.objects.all().delete()
+        JobWatermark.objects.filter(name=JOB_NAME).delete()
+
+
+def dashboard_data(days: int = 14) -> dict:
+    """
+    Данные дашборда за последние days дней — чтение только из DailyRollup
+    (строк не больше days × ПВЗ × статусы, сколько бы ни было истории).
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = list(
+        DailyRollup.objects.filter(day__gte=since).values(
+            "day", "pickup_point_id", "status", "events", "transit_seconds_sum", "transit_count"
+        )
+    )
+
+    by_day = defaultdict(lambda: {status: 0 for status in Parcel.Status.values})
+    by_point = defaultdict(lambda: {"arrived": 0, "received": 0, "transit_sum": 0, "transit_count": 0})
+    transit_sum = transit_count = 0
+    for r in rows:
+        by_day[r["day"]][r["status"]] += r["events"]
+        transit_sum += r["transit_seconds_sum"]
+        transit_count += r["transit_count"]
+        if r["pickup_point_id"] is None:
+            continue
+        point = by_point[r["pickup_point_id"]]
+        if r["status"] == Parcel.Status.AT_PICKUP:
+            point["arrived"] += r["events"]
+        elif r["status"] == Parcel.Status.RECEIVED:
+            point["received"] += r["events"]
+        point["transit_sum"] += r["transit_seconds_sum"]
+        point["transit_count"] += r["transit_count"]
+
+    def avg_hours(total, count):
+        return round(total / count / 3600, 1) if count else None
+
+    names = dict(PickupPoint.objects.filter(pk__in=list(by_point)).values_list("id", "name"))
+    mark = JobWatermark.objects.filter(name=JOB_NAME).values("last_id", "updated_at").first()
+    return {
+        "since": since,
+        "days": [
+            {"day": day, "counts": [counts[status] for status in Parcel.Status.values]}
+            for day, counts in sorted(by_day.items(), reverse=True)
+        ],
+        "points": sorted(
+            (
+                {
+                    "id": point_id,
+                    "name": names.get(point_id, f"ПВЗ #{point_id}"),
+                    **data,
+                    "avg_transit_hours": avg_hours(data["transit_sum"], data["transit_count"]),
+                }
+                for point_id, data in by_point.items()
+            ),
+            key=lambda p: -p["arrived"],
+        ),
+        "avg_transit_hours": avg_hours(transit_sum, transit_count),
+        "updated_at": mark["updated_at"] if mark else None,
+    }
+
@@ -0,0 +1,469 @@
+"""
+Поиск сотрудника по обрывку трек-номера, телефона или ФИО, и
+полнотекстовый поиск по сообщениям истории (history_fulltext_q).
+
+Индексы ставит миграция 0013 (install_search_indexes):
+  - PostgreSQL: pg_trgm, GIN по track_number, phone и UPPER(full_name) —
+    LIKE '%x%' и similarity() идут по индексу; плюс UPPER(track_number)
+    varchar_pattern_ops для iexact/istartswith;
+  - SQLite (>= 3.34): FTS5-таблица main_search_fts с токенизатором trigram
+    и триггерами. rowid = id * 2 для посылок, id * 2 + 1 для профилей.
+
+История (миграция 0014, install_history_search_index):
+  - PostgreSQL: GIN по to_tsvector(HISTORY_TS_CONFIG, message), запрос —
+    websearch_to_tsquery; индекс по выражению обновляется сам;
+  - SQLite: external-content FTS5 main_history_fts (unicode61) поверх
+    main_parcelhistory, синхронизация триггерами.
+
+Триграммы не работают для строк короче 3 символов — такие запросы не ищем.
+После пересоздания таблиц на SQLite (AlterField и т.п. удаляют триггеры)
+запустить manage.py rebuild_search_index.
+"""
+import re
+import sqlite3
+
+from django.db import connections, router
+from django.db.models import BooleanField, F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest, Upper
+
+from .models import CabinetProfile, Parcel, ParcelHistory
+
+MIN_QUERY_LENGTH = 3
+FTS_TABLE = "main_search_fts"
+
+HISTORY_FTS_TABLE = "main_history_fts"
+# Сообщения на русском + названия/адреса ПВЗ; стемминг русских слов
+HISTORY_TS_CONFIG = "russian"
+
+_NON_DIGIT_RE = re.compile(r"\D+")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+PG_INDEX_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    (
+        "CREATE INDEX IF NOT EXISTS parcel_track_upper_like_idx "
+        "ON main_parcel (UPPER(track_number::text) varchar_pattern_ops)"
+    ),
+    "CREATE INDEX IF NOT EXISTS parcel_track_trgm_idx ON main_parcel USING gin (track_number gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS cabinet_phone_trgm_idx ON main_cabinetprofile USING gin (phone gin_trgm_ops)",
+    (
+        "CREATE INDEX IF NOT EXISTS cabinet_full_name_trgm_idx "
+        "ON main_cabinetprofile USING gin (UPPER(full_name::text) gin_trgm_ops)"
+    ),
+]
+
+PG_DROP_SQL = [
+    "DROP INDEX IF EXISTS cabinet_full_name_trgm_idx",
+    "DROP INDEX IF EXISTS cabinet_phone_trgm_idx",
+    "DROP INDEX IF EXISTS parcel_track_trgm_idx",
+    "DROP INDEX IF EXISTS parcel_track_upper_like_idx",
+]
+
+_PROFILE_BODY = "{row}.full_name || ' ' || COALESCE({row}.phone, '')"
+
+SQLITE_INDEX_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(body, tokenize='trigram')",
+    # посылки
+    (
+        "CREATE TRIGGER IF NOT EXISTS main_search_parcel_ai AFTER INSERT ON main_parcel BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, body) VALUES (NEW.id * 2, NEW.track_number); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS main_search_parcel_au AFTER UPDATE OF track_number ON main_parcel BEGIN "
+        f"DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id * 2; "
+        f"INSERT INTO {FTS_TABLE}(rowid, body) VALUES (NEW.id * 2, NEW.track_number); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS main_search_parcel_ad AFTER DELETE ON main_parcel BEGIN "
+        f"DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id * 2; END"
+    ),
+    # профили: ФИО + телефон
+    (
+        "CREATE TRIGGER IF NOT EXISTS main_search_profile_ai AFTER INSERT ON main_cabinetprofile BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, body) VALUES (NEW.id * 2 + 1, {_PROFILE_BODY.format(row='NEW')}); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS main_search_profile_au AFTER UPDATE OF full_name, phone "
+        "ON main_cabinetprofile BEGIN "
+        f"DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id * 2 + 1; "
+        f"INSERT INTO {FTS_TABLE}(rowid, body) VALUES (NEW.id * 2 + 1, {_PROFILE_BODY.format(row='NEW')}); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS main_search_profile_ad AFTER DELETE ON main_cabinetprofile BEGIN "
+        f"DELETE FROM {FTS_TABLE} WHERE rowid = OLD.id * 2 + 1; END"
+    ),
+    # заполнение по существующим данным
+    f"DELETE FROM {FTS_TABLE}",
+    f"INSERT INTO {FTS_TABLE}(rowid, body) SELECT id * 2, track_number FROM main_parcel",
+    (
+        f"INSERT INTO {FTS_TABLE}(rowid, body) "
+        f"SELECT id * 2 + 1, {_PROFILE_BODY.format(row='main_cabinetprofile')} FROM main_cabinetprofile"
+    ),
+]
+
+SQLITE_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS main_search_profile_ad",
+    "DROP TRIGGER IF EXISTS main_search_profile_au",
+    "DROP TRIGGER IF EXISTS main_search_profile_ai",
+    "DROP TRIGGER IF EXISTS main_search_parcel_ad",
+    "DROP TRIGGER IF EXISTS main_search_parcel_au",
+    "DROP TRIGGER IF EXISTS main_search_parcel_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+PG_HISTORY_INDEX_SQL = [
+    (
+        "CREATE INDEX IF NOT EXISTS parcel_history_message_tsv_idx ON main_parcelhistory "
+        f"USING gin (to_tsvector('{HISTORY_TS_CONFIG}'::regconfig, message))"
+    ),
+]
+
+PG_HISTORY_DROP_SQL = [
+    "DROP INDEX IF EXISTS parcel_history_message_tsv_idx",
+]
+
+SQLITE_HISTORY_INDEX_SQL = [
+    (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {HISTORY_FTS_TABLE} USING fts5("
+        "message, content='main_parcelhistory', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS main_history_fts_ai AFTER INSERT ON main_parcelhistory BEGIN "
+        f"INSERT INTO {HISTORY_FTS_TABLE}(rowid, message) VALUES (NEW.id, NEW.message); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS main_history_fts_ad AFTER DELETE ON main_parcelhistory BEGIN "
+        f"INSERT INTO {HISTORY_FTS_TABLE}({HISTORY_FTS_TABLE}, rowid, message) "
+        "VALUES ('delete', OLD.id, OLD.message); END"
+    ),
+    (
+        "CREATE TRIGGER IF NOT EXISTS main_history_fts_au AFTER UPDATE OF message ON main_parcelhistory BEGIN "
+        f"INSERT INTO {HISTORY_FTS_TABLE}({HISTORY_FTS_TABLE}, rowid, message) VALUES ('delete', OLD.id, OLD.message); "
+        f"INSERT INTO {HISTORY_FTS_TABLE}(rowid, message) VALUES (NEW.id, NEW.message); END"
+    ),
+    # external content: 'rebuild' перечитывает main_parcelhistory целиком, идемпотентно
+    f"INSERT INTO {HISTORY_FTS_TABLE}({HISTORY_FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_HISTORY_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS main_history_fts_au",
+    "DROP TRIGGER IF EXISTS main_history_fts_ad",
+    "DROP TRIGGER IF EXISTS main_history_fts_ai",
+    f"DROP TABLE IF EXISTS {HISTORY_FTS_TABLE}",
+]
+
+
+# ---------- DDL ----------
+
+
+def _sqlite_fts_supported() -> bool:
+    return sqlite3.sqlite_version_info >= (3, 34)
+
+
+def _ddl(connection, install: bool):
+    if connection.vendor == "postgresql":
+        return PG_INDEX_SQL if install else PG_DROP_SQL
+    if connection.vendor == "sqlite" and _sqlite_fts_supported():
+        return SQLITE_INDEX_SQL if install else SQLITE_DROP_SQL
+    return []
+
+
+def install_search_indexes(connection) -> None:
+    """
+    Создаёт индексы/FTS-таблицу для СУБД соединения (идемпотентно; на SQLite
+    заново заполняет main_search_fts).
+    """
+    with connection.cursor() as cursor:
+        for sql in _ddl(connection, install=True):
+            cursor.execute(sql)
+
+
+def drop_search_indexes(connection) -> None:
+    with connection.cursor() as cursor:
+        for sql in _ddl(connection, install=False):
+            cursor.execute(sql)
+
+
+_fts_tables = set()
+
+
+def _history_ddl(connection, install: bool):
+    if connection.vendor == "postgresql":
+        return PG_HISTORY_INDEX_SQL if install else PG_HISTORY_DROP_SQL
+    if connection.vendor == "sqlite" and _sqlite_fts_supported():
+        return SQLITE_HISTORY_INDEX_SQL if install else SQLITE_HISTORY_DROP_SQL
+    return []
+
+
+def install_history_search_index(connection) -> None:
+    with connection.cursor() as cursor:
+        for sql in _history_ddl(connection, install=True):
+            cursor.execute(sql)
+
+
+def drop_history_search_index(connection) -> None:
+    with connection.cursor() as cursor:
+        for sql in _history_ddl(connection, install=False):
+            cursor.execute(sql)
+
+
+def _has_fts_table(connection, table: str = FTS_TABLE) -> bool:
+    # кэшируем только «есть»: таблица может появиться после migrate
+    if (connection.alias, table) not in _fts_tables:
+        if table not in connection.introspection.table_names():
+            return False
+        _fts_tables.add((connection.alias, table))
+    return True
+
+
+# ---------- поиск ----------
+
+
+def _similarity(expression, value: str):
+    return Func(expression, Value(value), function="similarity", output_field=FloatField())
+
+
+def _text_rank(text: str, term: str) -> int:
+    """
+    0 — точное совпадение, 1 — префикс, 2 — вхождение, 3 — прочее.
+    """
+    if not term:
+        return 3
+    text = (text or "").upper()
+    term = term.upper()
+    if text == term:
+        return 0
+    if text.startswith(term):
+        return 1
+    if term in text:
+        return 2
+    return 3
+
+
+def _terms(query: str):
+    """
+    (трек, цифры телефона, ФИО) — каждый либо строка, либо "" если слишком короткий.
+    """
+    q = " ".join((query or "").split())
+    track = q.replace(" ", "").upper()
+    digits = _NON_DIGIT_RE.sub("", q)
+    return (
+        track if len(track) >= MIN_QUERY_LENGTH else "",
+        digits if len(digits) >= MIN_QUERY_LENGTH else "",
+        q if len(q) >= MIN_QUERY_LENGTH else "",
+    )
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _candidates_postgres(track, digits, name, limit):
+    parcels = []
+    if track:
+        parcels = list(
+            Parcel.objects.filter(track_number__contains=track)
+            .select_related("user")
+            .annotate(score=_similarity(F("track_number"), track))
+            .order_by(F("score").desc(nulls_last=True), "track_number")[:limit]
+        )
+
+    profile_q = Q()
+    scores = []
+    if digits:
+        profile_q |= Q(phone__contains=digits)
+        scores.append(_similarity(F("phone"), digits))
+    if name:
+        profile_q |= Q(full_name__icontains=name)
+        scores.append(_similarity(Upper("full_name"), name.upper()))
+    profiles = []
+    if scores:
+        score = scores[0] if len(scores) == 1 else Greatest(*scores)
+        profiles = list(
+            CabinetProfile.objects.filter(profile_q)
+            .select_related("user", "pickup_point")
+            .annotate(score=score)
+            .order_by(F("score").desc(nulls_last=True), "full_name")[:limit]
+        )
+    return parcels, profiles
+
+
+def _candidates_sqlite_fts(connection, track, digits, name, limit):
+    phrases = [_fts_phrase(t) for t in dict.fromkeys((track, digits, name)) if t]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rank LIMIT %s",
+            [" OR ".join(phrases), limit * 10],
+        )
+        rowids = [r[0] for r in cursor.fetchall()]
+    parcel_ids = [r // 2 for r in rowids if r % 2 == 0]
+    profile_ids = [r // 2 for r in rowids if r % 2 == 1]
+    parcels = list(Parcel.objects.filter(pk__in=parcel_ids).select_related("user")) if parcel_ids else []
+    profiles = (
+        list(CabinetProfile.objects.filter(pk__in=profile_ids).select_related("user", "pickup_point"))
+        if profile_ids
+        else []
+    )
+    return parcels, profiles
+
+
+def _candidates_fallback(track, digits, name, limit):
+    parcels = list(Parcel.objects.filter(track_number__icontains=track).select_related("user")[: limit * 5]) if track else []
+    profile_q = Q()
+    if digits:
+        profile_q |= Q(phone__contains=digits)
+    if name:
+        profile_q |= Q(full_name__icontains=name)
+    profiles = (
+        list(CabinetProfile.objects.filter(profile_q).select_related("user", "pickup_point")[: limit * 5])
+        if profile_q
+        else []
+    )
+    return parcels, profiles
+
+
+def search_staff(query: str, limit: int = 20) -> dict:
+    """
+    {"parcels": [...], "profiles": [...]} — лучшие совпадения первыми
+    (точное > префикс > вхождение > похожесть). Пустые списки, если запрос
+    короче MIN_QUERY_LENGTH.
+    """
+    track, digits, name = _terms(query)
+    if not (track or digits or name):
+        return {"parcels": [], "profiles": []}
+
+    connection = connections[router.db_for_read(Parcel)]
+    if connection.vendor == "postgresql":
+        parcels, profiles = _candidates_postgres(track, digits, name, limit)
+    elif connection.vendor == "sqlite" and _has_fts_table(connection):
+        parcels, profiles = _candidates_sqlite_fts(connection, track, digits, name, limit)
+    else:
+        parcels, profiles = _candidates_fallback(track, digits, name, limit)
+
+    def profile_rank(p):
+        ranks = [_text_rank(p.full_name, name)]
+        if digits:
+            ranks.append(_text_rank(_NON_DIGIT_RE.sub("", p.phone or ""), digits))
+        return min(ranks)
+
+    # порядок СУБД (similarity/bm25) сохраняется внутри одного ранга — sort стабильный
+    parcels.sort(key=lambda p: (_text_rank(p.track_number, track), len(p.track_number)))
+    profiles.sort(key=profile_rank)
+
+    return {
+        "parcels": [
+            {
+                "id": p.pk,
+                "track_number": p.track_number,
+                "status": p.status,
+                "status_label": p.get_status_display(),
+                "owner": p.user.username if p.user_id else None,
+            }
+            for p in parcels[:limit]
+        ],
+        "profiles": [
+            {
+                "user_id": p.user_id,
+                "full_name": p.full_name,
+                "phone": p.phone or p.user.username,
+                "is_employee": p.is_employee,
+                "pickup_point": p.pickup_point.name if p.pickup_point_id else None,
+            }
+            for p in profiles[:limit]
+        ],
+    }
+
+
+# ---------- история ----------
+
+
+class _TsMatch(Func):
+    """
+    to_tsvector(cfg, message) @@ websearch_to_tsquery(cfg, q) — в том же виде,
+    что и выражение индекса parcel_history_message_tsv_idx.
+    """
+
+    output_field = BooleanField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        field_sql, field_params = compiler.compile(self.source_expressions[0])
+        query_sql, query_params = compiler.compile(self.source_expressions[1])
+        sql = (
+            f"to_tsvector('{HISTORY_TS_CONFIG}'::regconfig, {field_sql}) "
+            f"@@ websearch_to_tsquery('{HISTORY_TS_CONFIG}'::regconfig, {query_sql})"
+        )
+        return sql, (*field_params, *query_params)
+
+
+def _fts5_words_query(text: str) -> str:
+    """
+    Слова пользователя -> FTS5-запрос «все слова», последнее — по префиксу.
+    Кавычки убирают операторы FTS5 из пользовательского ввода.
+    """
+    words = _WORD_RE.findall(text)
+    if not words:
+        return ""
+    parts = [_fts_phrase(w) for w in words]
+    parts[-1] += "*"
+    return " ".join(parts)
+
+
+def history_fulltext_q(text: str, using: str | None = None) -> Q:
+    """
+    Q-условие «сообщение истории содержит все слова text» для ParcelHistory,
+    по полнотекстовому индексу СУБД (без индекса — icontains).
+    """
+    connection = connections[using or router.db_for_read(ParcelHistory)]
+    if connection.vendor == "postgresql":
+        return Q(_TsMatch(F("message"), Value(text)))
+    if connection.vendor == "sqlite" and _has_fts_table(connection, HISTORY_FTS_TABLE):
+        fts_query = _fts5_words_query(text)
+        if not fts_query:
+            return Q(pk__in=[])
+        return Q(
+            pk__in=RawSQL(
+                f"SELECT rowid FROM {HISTORY_FTS_TABLE} WHERE {HISTORY_FTS_TABLE} MATCH %s",
+                [fts_query],
+            )
+        )
+    q = Q()
+    for word in _WORD_RE.findall(text):
+        q &= Q(message__icontains=word)
+    return q
+
+
+def search_history(text: str, status=None, since=None, until=None, before_id=None, limit: int = 50) -> dict:
+    """
+    События истории по тексту сообщения, новые первыми (keyset по id:
+    before_id — id последнего события предыдущей страницы).
+    """
+    qs = ParcelHistory.objects.filter(history_fulltext_q(text)).select_related("parcel")
+    if status is not None:
+        qs = qs.filter(status=status)
+    if since is not None:
+        qs = qs.filter(occurred_at__gte=since)
+    if until is not None:
+        qs = qs.filter(occurred_at__lt=until)
+    if before_id is not None:
+        qs = qs.filter(pk__lt=before_id)
+
+    rows = list(qs.order_by("-id")[: limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "events": [
+            {
+                "id": h.pk,
+                "parcel_id": h.parcel_id,
+                "track_number": h.parcel.track_number,
+                "parcel_status": h.parcel.status,
+                "status": h.status,
+                "status_label": h.get_status_display(),
+                "occurred_at": h.occurred_at.isoformat(),
+                "message": h.message,
+            }
+            for h in rows
+        ],
+        "next_before": rows[-1].pk if has_more and rows else None,
+    }
@@ -0,0 +1,350 @@
+"""
+Кэш-бэкенд на общем mmap-файле: один экземпляр на хост для всех воркеров.
+
+Файл фиксированного размера делится на слоты по SLOT_SIZE байт, слоты
+сгруппированы в наборы по WAYS штук (set-associative). Ключ хэшируется в
+набор, внутри набора свободный слот ищется линейно, а при заполнении
+вытесняется по алгоритму clock (бит обращения на слот + стрелка на набор).
+
+Блокировки: fcntl.lockf на байт стрелки набора (между процессами)
++ threading.Lock (между потоками одного процесса).
+
+    CACHES = {
+        "default": {
+            "BACKEND": "apps.main.shm_cache.SharedMemoryCache",
+            "LOCATION": "/dev/shm/kargo-cache.bin",
+            "OPTIONS": {"SLOTS": 8192, "SLOT_SIZE": 2048, "WAYS": 8},
+        }
+    }
+
+Значения больше SLOT_SIZE - 32 байт не кэшируются (set молча удаляет ключ).
+
+Геометрия входит в имя файла (LOCATION cache.shm -> cache.8192x2048x8.shm):
+воркеры, запущенные с другими OPTIONS, работают со своим файлом и не трогают
+отображение старых. Файл, который уже может быть отображён, не урезается —
+при чужом заголовке он подменяется новым через os.replace (иначе у
+остальных процессов SIGBUS). Файлы прежних геометрий остаются на диске
+(в /dev/shm — до перезагрузки), их можно удалить после смены воркеров.
+
+Сейчас кэш держит только версию справочников refcache; история и поиск
+в нём не кэшируются.
+"""
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+try:
+    import fcntl
+except ImportError:  # Windows: остаёмся только с блокировкой потоков
+    fcntl = None
+
+
+MAGIC = b"KGSHM001"
+# magic, slots, slot_size, ways
+HEADER = struct.Struct("<8sIII")
+HEADER_SIZE = 64
+# digest, expires_at (0 = бессрочно), длина payload, занят, бит обращения
+SLOT_HEADER = struct.Struct("<16sdIBB2x")
+
+
+def _geometry_path(location, slots, slot_size, ways) -> str:
+    root, ext = os.path.splitext(str(location))
+    return f"{root}.{slots}x{slot_size}x{ways}{ext}"
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+class _Store:
+    """
+    Собственно mmap-хранилище; один объект на процесс и путь к файлу.
+    """
+
+    def __init__(self, path, slots, slot_size, ways):
+        if slot_size <= SLOT_HEADER.size:
+            raise ValueError("SLOT_SIZE слишком маленький.")
+        self.ways = max(1, min(int(ways), 255))
+        self.nsets = max(1, int(slots) // self.ways)
+        self.slots = self.nsets * self.ways
+        self.slot_size = int(slot_size)
+        self.payload_size = self.slot_size - SLOT_HEADER.size
+
+        hands_size = self.nsets
+        self.data_offset = HEADER_SIZE + ((hands_size + 63) // 64) * 64
+        self.size = self.data_offset + self.slots * self.slot_size
+        self.path = _geometry_path(path, self.slots, self.slot_size, self.ways)
+
+        self._thread_lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        expected = HEADER.pack(MAGIC, self.slots, self.slot_size, self.ways)
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self.fd = fd
+            self._lock_range(0, 1)
+            try:
+                size = os.fstat(fd).st_size
+                if size == 0:
+                    # новый файл: пустой никто отобразить не мог, размечаем на месте
+                    os.ftruncate(fd, self.size)
+                    os.pwrite(fd, expected, 0)
+                    break
+                if size == self.size and os.pread(fd, HEADER.size, 0) == expected:
+                    break
+                # чужой заголовок (другой MAGIC, оборванная разметка) — подменяем файл
+                self._replace_file(expected)
+            finally:
+                self._unlock_range(0, 1)
+            # открываем заново: по пути теперь лежит новый файл
+            os.close(fd)
+        self.mm = mmap.mmap(fd, self.size)
+
+    def _replace_file(self, header):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, self.size)
+            os.pwrite(fd, header, 0)
+        finally:
+            os.close(fd)
+        os.replace(tmp, self.path)
+
+    # ---------- блокировки ----------
+
+    def _lock_range(self, start, length):
+        if fcntl is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, length, start)
+
+    def _unlock_range(self, start, length):
+        if fcntl is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, length, start)
+
+    @contextmanager
+    def _locked_set(self, set_no):
+        with self._thread_lock:
+            self._lock_range(HEADER_SIZE + set_no, 1)
+            try:
+                yield
+            finally:
+                self._unlock_range(HEADER_SIZE + set_no, 1)
+
+    # ---------- слоты ----------
+
+    def _set_no(self, digest):
+        return int.from_bytes(digest[:8], "little") % self.nsets
+
+    def _slot_offset(self, set_no, way):
+        return self.data_offset + (set_no * self.ways + way) * self.slot_size
+
+    def _read_header(self, off):
+        return SLOT_HEADER.unpack_from(self.mm, off)
+
+    def _write_header(self, off, digest, expires_at, length, used, ref):
+        SLOT_HEADER.pack_into(self.mm, off, digest, expires_at, length, used, ref)
+
+    def _find(self, set_no, digest, now):
+        """
+        Смещение живого слота с этим ключом или None. Просроченные слоты освобождаются.
+        """
+        for way in range(self.ways):
+            off = self._slot_offset(set_no, way)
+            d, expires_at, _length, used, _ref = self._read_header(off)
+            if not used or d != digest:
+                continue
+            if expires_at and expires_at <= now:
+                self._write_header(off, b"\0" * 16, 0.0, 0, 0, 0)
+                return None
+            return off
+        return None
+
+    def _victim(self, set_no, now):
+        hand_off = HEADER_SIZE + set_no
+        for way in range(self.ways):
+            off = self._slot_offset(set_no, way)
+            _d, expires_at, _length, used, _ref = self._read_header(off)
+            if not used or (expires_at and expires_at <= now):
+                return off
+
+        # clock: пропускаем слоты с битом обращения, сбрасывая его
+        hand = self.mm[hand_off] % self.ways
+        for _ in range(self.ways * 2):
+            off = self._slot_offset(set_no, hand)
+            d, expires_at, length, used, ref = self._read_header(off)
+            hand = (hand + 1) % self.ways
+            if ref:
+                self._write_header(off, d, expires_at, length, used, 0)
+                continue
+            self.mm[hand_off] = hand
+            return off
+        self.mm[hand_off] = hand
+        return self._slot_offset(set_no, hand)
+
+    # ---------- операции ----------
+
+    def get(self, digest):
+        now = time.time()
+        set_no = self._set_no(digest)
+        with self._locked_set(set_no):
+            off = self._find(set_no, digest, now)
+            if off is None:
+                return None
+            d, expires_at, length, used, ref = self._read_header(off)
+            if not ref:
+                self._write_header(off, d, expires_at, length, used, 1)
+            start = off + SLOT_HEADER.size
+            return bytes(self.mm[start:start + length])
+
+    def set(self, digest, payload, expires_at, only_if_missing=False):
+        if len(payload) > self.payload_size:
+            self.delete(digest)
+            return False
+        now = time.time()
+        set_no = self._set_no(digest)
+        with self._locked_set(set_no):
+            off = self._find(set_no, digest, now)
+            if off is not None and only_if_missing:
+                return False
+            if off is None:
+                off = self._victim(set_no, now)
+            self._write_payload(off, digest, payload, expires_at)
+            return True
+
+    def _write_payload(self, off, digest, payload, expires_at):
+        # сначала «освобождаем» слот, чтобы оборванная запись не читалась как живая
+        self._write_header(off, b"\0" * 16, 0.0, 0, 0, 0)
+        start = off + SLOT_HEADER.size
+        self.mm[start:start + len(payload)] = payload
+        self._write_header(off, digest, expires_at or 0.0, len(payload), 1, 1)
+
+    def update(self, digest, func):
+        """
+        Атомарно меняет значение: func(payload) -> (new_payload, result). Нет ключа — None.
+        """
+        now = time.time()
+        set_no = self._set_no(digest)
+        with self._locked_set(set_no):
+            off = self._find(set_no, digest, now)
+            if off is None:
+                return None
+            _d, expires_at, length, _used, _ref = self._read_header(off)
+            start = off + SLOT_HEADER.size
+            new_payload, result = func(bytes(self.mm[start:start + length]))
+            if len(new_payload) > self.payload_size:
+                self._write_header(off, b"\0" * 16, 0.0, 0, 0, 0)
+                return result
+            self._write_payload(off, digest, new_payload, expires_at)
+            return result
+
+    def touch(self, digest, expires_at):
+        now = time.time()
+        set_no = self._set_no(digest)
+        with self._locked_set(set_no):
+            off = self._find(set_no, digest, now)
+            if off is None:
+                return False
+            d, _, length, used, _ref = self._read_header(off)
+            self._write_header(off, d, expires_at or 0.0, length, used, 1)
+            return True
+
+    def delete(self, digest):
+        set_no = self._set_no(digest)
+        with self._locked_set(set_no):
+            off = self._find(set_no, digest, time.time())
+            if off is None:
+                return False
+            self._write_header(off, b"\0" * 16, 0.0, 0, 0, 0)
+            return True
+
+    def clear(self):
+        for set_no in range(self.nsets):
+            with self._locked_set(set_no):
+                for way in range(self.ways):
+                    self._write_header(self._slot_offset(set_no, way), b"\0" * 16, 0.0, 0, 0, 0)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _get_store(path, slots, slot_size, ways):
+    key = (str(path), os.getpid())
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = _Store(path, slots, slot_size, ways)
+        return store
+
+
+class SharedMemoryCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._path = location
+        self._slots = int(options.get("SLOTS", 8192))
+        self._slot_size = int(options.get("SLOT_SIZE", 2048))
+        self._ways = int(options.get("WAYS", 8))
+
+    @property
+    def _store(self):
+        # после fork у дочернего процесса свой fd (lockf-блокировки привязаны к процессу)
+        return _get_store(self._path, self._slots, self._slot_size, self._ways)
+
+    def _key_digest(self, key, version):
+        return _digest(self.make_and_validate_key(key, version=version))
+
+    def _expires_at(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        payload = pickle.dumps(value, self.pickle_protocol)
+        return self._store.set(
+            self._key_digest(key, version), payload, self._expires_at(timeout), only_if_missing=True
+        )
+
+    def get(self, key, default=None, version=None):
+        payload = self._store.get(self._key_digest(key, version))
+        if payload is None:
+            return default
+        try:
+            return pickle.loads(payload)
+        except Exception:
+            self._store.delete(self._key_digest(key, version))
+            return default
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        payload = pickle.dumps(value, self.pickle_protocol)
+        self._store.set(self._key_digest(key, version), payload, self._expires_at(timeout))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store.touch(self._key_digest(key, version), self._expires_at(timeout))
+
+    def incr(self, key, delta=1, version=None):
+        def _apply(payload):
+            value = pickle.loads(payload) + delta
+            return pickle.dumps(value, self.pickle_protocol), value
+
+        result = self._store.update(self._key_digest(key, version), _apply)
+        if result is None:
+            raise ValueError("Key '%s' not found" % key)
+        return result
+
+    def has_key(self, key, version=None):
+        return self._store.get(self._key_digest(key, version)) is not None
+
+    def delete(self, key, version=None):
+        return self._store.delete(self._key_digest(key, version))
+
+    def clear(self):
+        self._store.clear()
@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CabinetProfile, Parcel, PickupPoint, SiteSettings
+from .refcache import bump_version
+
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+@receiver(post_save, sender=PickupPoint)
+@receiver(post_delete, sender=PickupPoint)
+def invalidate_reference_data(sender, **kwargs):
+    # после коммита, иначе другой процесс успеет закэшировать старые данные
+    transaction.on_commit(bump_version)
+
+
+@receiver(post_save, sender=CabinetProfile)
+def update_parcel_destinations(sender, instance, update_fields=None, **kwargs):
+    """
+    Сменился ПВЗ в профиле — посылки клиента в пути теперь едут туда.
+    bulk_create профилей (generate_synthetic_data) сюда не попадает.
+    """
+    if update_fields is not None and "pickup_point" not in update_fields:
+        return
+    Parcel.objects.filter(user_id=instance.user_id, status__lt=Parcel.Status.AT_PICKUP).update(
+        destination_id=instance.pickup_point_id
+    )
@@ -0,0 +1,230 @@
+"""
+Журнал медленных SQL-запросов с автоматическим EXPLAIN.
+
+Включается настройкой SLOW_QUERY_THRESHOLD_MS (None — выключено). Хук
+execute_wrapper ставится на каждое новое соединение; запросы дольше порога
+пишутся JSON-строками в SLOW_QUERY_LOG (RotatingFileHandler) вместе с
+источником (view или management-команда) и планом. Сводка — команда
+slow_query_report.
+
+EXPLAIN ANALYZE повторно выполняет запрос, поэтому делается только на
+PostgreSQL, только для SELECT без FOR UPDATE и только при
+SLOW_QUERY_EXPLAIN_ANALYZE = True. План одного и того же запроса снимается
+не чаще раза в SLOW_QUERY_EXPLAIN_INTERVAL секунд на процесс.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+logger = logging.getLogger("apps.main.slow_queries")
+
+# Текущий HTTP-запрос (ставит RequestMetricsMiddleware) — имя view берётся лениво,
+# т.к. resolver_match появляется уже после входа в middleware.
+_current_request = ContextVar("main_slow_query_request", default=None)
+
+# Явная метка источника (команды, фоновые задачи) — см. source().
+_current_label = ContextVar("main_slow_query_label", default=None)
+
+# Защита от рекурсии: EXPLAIN идёт через тот же execute_wrapper.
+_explaining = ContextVar("main_slow_query_explaining", default=False)
+
+_IN_LIST_RE = re.compile(r"\bIN \((?:%s, )*%s\)", re.IGNORECASE)
+_WS_RE = re.compile(r"\s+")
+
+_explained_at = {}
+_explained_lock = threading.Lock()
+_handler_ready = False
+
+
+def _threshold_ms():
+    return getattr(settings, "SLOW_QUERY_THRESHOLD_MS", None)
+
+
+def fingerprint(sql: str) -> str:
+    """
+    Нормализованный текст: IN-списки любой длины (и из одного элемента)
+    сводятся к одному виду.
+    """
+    return _WS_RE.sub(" ", _IN_LIST_RE.sub("IN (...)", sql)).strip()
+
+
+def bind_request(request):
+    return _current_request.set(request)
+
+
+def unbind_request(token) -> None:
+    _current_request.reset(token)
+
+
+@contextmanager
+def source(label: str):
+    """
+    Пометить запросы блока, например source("command:process_parcel_flows").
+    Без метки команды определяются по sys.argv (manage.py <команда>).
+    """
+    token = _current_label.set(label)
+    try:
+        yield
+    finally:
+        _current_label.reset(token)
+
+
+def _source() -> str:
+    label = _current_label.get()
+    if label is not None:
+        return label
+    request = _current_request.get()
+    if request is not None:
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name or match._func_path) if match else "unresolved"
+        return f"view:{view}"
+    argv = sys.argv
+    if len(argv) > 1 and os.path.basename(argv[0]) in ("manage.py", "django-admin"):
+        return f"command:{argv[1]}"
+    return "other"
+
+
+def _explain_sql(connection, sql: str):
+    """
+    (префикс EXPLAIN, analyze?) для СУБД соединения или (None, False).
+    """
+    head = sql.lstrip()[:6].upper()
+    vendor = connection.vendor
+    if vendor == "postgresql":
+        safe = head == "SELECT" and "FOR UPDATE" not in sql.upper()
+        if safe and getattr(settings, "SLOW_QUERY_EXPLAIN_ANALYZE", False):
+            return "EXPLAIN (ANALYZE, BUFFERS) ", True
+        return "EXPLAIN ", False
+    if vendor == "sqlite":
+        return "EXPLAIN QUERY PLAN ", False
+    if vendor == "mysql":
+        return "EXPLAIN ", False
+    return None, False
+
+
+def _should_explain(fp: str) -> bool:
+    interval = float(getattr(settings, "SLOW_QUERY_EXPLAIN_INTERVAL", 300))
+    now = time.monotonic()
+    with _explained_lock:
+        last = _explained_at.get(fp)
+        if last is not None and now - last < interval:
+            return False
+        _explained_at[fp] = now
+    return True
+
+
+def _explain(connection, sql: str, params):
+    prefix, analyze = _explain_sql(connection, sql)
+    if prefix is None:
+        return None, False
+    token = _explaining.set(True)
+    try:
+        # savepoint: на PostgreSQL ошибка EXPLAIN иначе «сломает» внешнюю транзакцию
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                rows = cursor.fetchall()
+    except DatabaseError as exc:
+        return f"EXPLAIN failed: {exc}", False
+    finally:
+        _explaining.reset(token)
+    return "\n".join(" ".join(str(col) for col in row) for row in rows), analyze
+
+
+def _ensure_handler() -> None:
+    global _handler_ready
+    if _handler_ready:
+        return
+    _handler_ready = True
+    path = getattr(settings, "SLOW_QUERY_LOG", None)
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handler = RotatingFileHandler(
+        path,
+        maxBytes=int(getattr(settings, "SLOW_QUERY_LOG_MAX_BYTES", 10 * 1024 * 1024)),
+        backupCount=int(getattr(settings, "SLOW_QUERY_LOG_BACKUPS", 5)),
+        encoding="utf-8",
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def _record(connection, sql, params, many, elapsed_ms) -> None:
+    fp = fingerprint(sql)
+    plan, analyzed = (None, False)
+    if not many and _should_explain(fp):
+        plan, analyzed = _explain(connection, sql, params)
+
+    _ensure_handler()
+    logger.info(json.dumps({
+        "ts": timezone.now().isoformat(),
+        "source": _source(),
+        "db": connection.alias,
+        "ms": round(elapsed_ms, 2),
+        "fingerprint": fp,
+        "sql": sql[:4000],
+        "params": repr(params)[:500],
+        "many": many,
+        "plan": plan,
+        "analyzed": analyzed,
+    }, ensure_ascii=False))
+
+
+def _slow_query_hook(execute, sql, params, many, context):
+    if _explaining.get():
+        return execute(sql, params, many, context)
+    t0 = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    threshold = _threshold_ms()
+    if threshold is not None and elapsed_ms >= threshold:
+        try:
+            _record(context["connection"], sql, params, many, elapsed_ms)
+        except Exception:  # журнал не должен ронять запрос
+            logger.exception("Slow query capture failed")
+    return result
+
+
+def _install_hook(sender, connection, **kwargs):
+    if _threshold_ms() is None:
+        return
+    if _slow_query_hook not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_slow_query_hook)
+
+
+connection_created.connect(_install_hook, dispatch_uid="main_slow_query_hook")
+
+
+def read_log(path: str):
+    """
+    Записи журнала и его ротированных копий (.1, .2, ...), старые сначала.
+    """
+    paths = []
+    backups = int(getattr(settings, "SLOW_QUERY_LOG_BACKUPS", 5))
+    for i in range(backups, 0, -1):
+        paths.append(f"{path}.{i}")
+    paths.append(path)
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+
+from apps.main.counters import STATUS_FIELDS, _count_from_parcels
+from apps.main.models import CabinetProfile, PickupPoint
+
+User = get_user_model()
+
+
+def make_point(name="ПВЗ 1", **fields):
+    return PickupPoint.objects.create(name=name, address="ул. Тестовая, 1", **fields)
+
+
+def make_user(username, point=None, employee=False, phone=None):
+    """
+    Пользователь с профилем кабинета (как после регистрации).
+    """
+    # без пароля: хэширование медленное, а в тестах вход через force_login
+    user = User.objects.create_user(username=username)
+    CabinetProfile.objects.create(
+        user=user, full_name=username, phone=phone, pickup_point=point, is_employee=employee
+    )
+    return User.objects.select_related("cabinet_profile__pickup_point").get(pk=user.pk)
+
+
+def table_counts(user_id) -> dict:
+    """
+    {status: n} по таблице посылок — с этим сверяются счётчики.
+    """
+    counts = _count_from_parcels(user_id)
+    return {status: counts[field] for status, field in STATUS_FIELDS.items()}
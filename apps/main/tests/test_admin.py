@@ -0,0 +1,63 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.main.admin import ParcelAdmin
+from apps.main.models import Parcel
+from apps.main.paginators import EstimatedCountPaginator
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        Parcel.objects.bulk_create(Parcel(track_number=f"TRACK{i:04d}") for i in range(12))
+        self.qs = Parcel.objects.order_by("id")
+
+    def test_small_table_is_counted_exactly(self):
+        paginator = EstimatedCountPaginator(self.qs, 5)
+        # на SQLite оценки нет — ограниченный подсчёт
+        self.assertEqual((paginator.count, paginator.num_pages, paginator.is_capped), (12, 3, False))
+
+    @mock.patch.object(EstimatedCountPaginator, "count_cap", 5)
+    def test_count_stops_at_cap(self):
+        paginator = EstimatedCountPaginator(self.qs, 2)
+        self.assertEqual((paginator.count_limit, paginator.count, paginator.is_capped), (5, 6, True))
+        self.assertEqual(paginator.num_pages, 3)
+
+    @mock.patch.object(EstimatedCountPaginator, "count_cap", 5)
+    def test_window_moves_with_current_page(self):
+        # с 3-й страницы видно ещё count_cap записей вперёд
+        paginator = EstimatedCountPaginator(self.qs, 2, current_page=3)
+        self.assertEqual((paginator.count_limit, paginator.count, paginator.is_capped), (9, 10, True))
+        self.assertEqual([p.track_number for p in paginator.page(5)], ["TRACK0008", "TRACK0009"])
+
+        last = EstimatedCountPaginator(self.qs, 2, current_page=6)
+        self.assertEqual((last.count, last.is_capped), (12, False))
+        self.assertEqual([p.track_number for p in last.page(6)], ["TRACK0010", "TRACK0011"])
+
+
+class ParcelAdminTests(TestCase):
+    def setUp(self):
+        admin = get_user_model().objects.create_superuser("admin", "admin@example.com", None)
+        self.client.force_login(admin)
+        Parcel.objects.bulk_create(Parcel(track_number=t) for t in ("ABC00001", "ABC00002", "XABC0001", "ZZZ00001"))
+        self.url = reverse("admin:main_parcel_changelist")
+
+    def _tracks(self, response):
+        return sorted(p.track_number for p in response.context["cl"].result_list)
+
+    def test_prefix_search(self):
+        response = self.client.get(self.url, {"q": " abc "})
+        self.assertEqual(self._tracks(response), ["ABC00001", "ABC00002"])
+
+    @mock.patch.object(EstimatedCountPaginator, "count_cap", 2)
+    @mock.patch.object(ParcelAdmin, "list_per_page", 1)
+    def test_capped_changelist_pages_past_cap(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, "больше 2")
+        # 4-я страница — дальше, чем первый подсчёт
+        response = self.client.get(self.url, {"p": 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["cl"].result_list), 1)
+        self.assertFalse(response.context["cl"].paginator.is_capped)
@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.main.auto_status import _norm_dt
+from apps.main.models import Parcel, ParcelHistory
+from apps.main.views import _serialize_history
+
+from .helpers import make_point, make_user
+
+
+class ParcelHistoryViewTests(TestCase):
+    def setUp(self):
+        self.user = make_user("customer", make_point())
+        self.parcel = Parcel.objects.create(track_number="TRACK0001", user=self.user, status=Parcel.Status.AT_CN)
+        now = _norm_dt(timezone.now())
+        rows = ((10, Parcel.Status.WAITING_CN, "Ожидается"), (5, Parcel.Status.AT_CN, "На складе"))
+        for minutes, status, message in rows:
+            ParcelHistory.objects.create(
+                parcel=self.parcel, status=status, message=message, occurred_at=now - timedelta(minutes=minutes)
+            )
+
+    def _urls(self, pk):
+        return [reverse("parcel_history", args=[pk]), reverse("parcel_history_public", args=[pk])]
+
+    def test_anonymous_is_redirected_to_login(self):
+        for url in self._urls(self.parcel.pk):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 302)
+            self.assertIn(reverse("login"), response["Location"])
+
+    def test_other_users_parcel_is_404(self):
+        self.client.force_login(make_user("other"))
+        for url in self._urls(self.parcel.pk):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_payload_matches_sync_serializer(self):
+        self.client.force_login(self.user)
+        expected = _serialize_history(self.parcel)
+        for url in self._urls(self.parcel.pk):
+            data = self.client.get(url).json()
+            self.assertEqual(data["track_number"], "TRACK0001")
+            self.assertEqual(data["events"], expected)
+        self.assertEqual([e["message"] for e in expected], ["На складе", "Ожидается"])
+        self.assertEqual([e["is_latest"] for e in expected], [True, False])
+        self.assertTrue(expected[0]["datetime"].endswith("Z"))
+
+    def test_parcel_without_history_shows_current_state(self):
+        parcel = Parcel.objects.create(track_number="TRACK0002", user=self.user)
+        self.client.force_login(self.user)
+        (event,) = self.client.get(reverse("parcel_history", args=[parcel.pk])).json()["events"]
+        self.assertEqual(event["status_display"], parcel.get_status_display())
+        self.assertEqual((event["message"], event["is_latest"]), ("", True))
+
+    async def test_async_client(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("parcel_history", args=[self.parcel.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["events"]), 2)
+
+
+class TrackPublicLookupViewTests(TestCase):
+    def _get(self, track):
+        return self.client.get(reverse("track_public_lookup"), {"track": track})
+
+    def test_lookup_is_public_and_advances_flow(self):
+        Parcel.objects.create(
+            track_number="TRACK0001",
+            auto_flow_started_at=_norm_dt(timezone.now() - timedelta(days=3)),
+            auto_flow_stage=0,
+        )
+        data = self._get("track0001").json()
+        self.assertTrue(data["ok"])
+        self.assertEqual(data["status"], Parcel.Status.FROM_CN)
+        self.assertEqual(data["status_label"], Parcel.Status.FROM_CN.label)
+        self.assertEqual(len(data["events"]), 3)
+        self.assertNotIn("parcel_id", data)
+
+    def test_errors(self):
+        self.assertEqual(self._get("").status_code, 400)
+        self.assertEqual(self._get("NOSUCH001").status_code, 404)
+
+    async def test_async_client(self):
+        await Parcel.objects.acreate(track_number="TRACK0002")
+        response = await self.async_client.get(reverse("track_public_lookup"), {"track": "TRACK0002"})
+        self.assertEqual(response.json()["events"][0]["is_latest"], True)
@@ -0,0 +1,48 @@
+from django.contrib.auth import BACKEND_SESSION_KEY, get_user
+from django.contrib.auth.hashers import make_password
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from apps.main.auth_backends import CabinetModelBackend
+
+from .helpers import make_point, make_user
+
+BACKEND = "apps.main.auth_backends.CabinetModelBackend"
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class CabinetModelBackendTests(TestCase):
+    def setUp(self):
+        self.user = make_user("+996700000001", make_point())
+        self.user.password = make_password("secret")
+        self.user.save(update_fields=["password"])
+
+    def test_request_user_loads_profile_and_point_in_one_query(self):
+        self.client.force_login(self.user, backend=BACKEND)
+        request = RequestFactory().get("/")
+        request.session = self.client.session
+        with self.assertNumQueries(2):  # сессия + пользователь с профилем и ПВЗ
+            user = get_user(request)
+            self.assertEqual(user.cabinet_profile.pickup_point.name, "ПВЗ 1")
+
+    def test_get_user(self):
+        backend = CabinetModelBackend()
+        with self.assertNumQueries(1):
+            user = backend.get_user(self.user.pk)
+            self.assertEqual(user.cabinet_profile.pickup_point.name, "ПВЗ 1")
+        self.assertIsNone(backend.get_user(0))
+
+    def test_login(self):
+        response = self.client.post(reverse("login"), {"phone": "700000001", "password": "secret"})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY], BACKEND)
+
+        self.client.logout()
+        response = self.client.post(reverse("login"), {"phone": "700000001", "password": "wrong"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Неверный телефон или пароль.", response.content.decode())
+
+    def test_inactive_user_cannot_log_in(self):
+        self.user.is_active = False
+        self.user.save(update_fields=["is_active"])
+        self.assertIsNone(CabinetModelBackend().authenticate(None, username=self.user.username, password="secret"))
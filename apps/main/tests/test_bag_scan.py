@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.main.auto_status import CN_STAGE_3_MESSAGE, _norm_dt, _process_bag_scan
+from apps.main.counters import get_status_counts
+from apps.main.models import Bag, Parcel, ParcelEvent, ParcelHistory
+
+from .helpers import make_point, make_user, table_counts
+
+
+class BagScanTests(TestCase):
+    def setUp(self):
+        self.point = make_point()
+        self.staff = make_user("staff", self.point, employee=True)
+        self.customer = make_user("customer", self.point)
+        self.bag = Bag.objects.create(code="BAG-001")
+
+    def _parcel(self, track, **fields):
+        return Parcel.objects.create(track_number=track, bag=self.bag, user=self.customer, **fields)
+
+    def test_first_and_second_scan_in_one_pass(self):
+        fresh = self._parcel("TRACK0001")
+        old_start = _norm_dt(timezone.now() - timedelta(days=3))
+        ready = self._parcel(
+            "TRACK0002", status=Parcel.Status.AT_CN, auto_flow_started_at=old_start, auto_flow_stage=2
+        )
+        done = self._parcel("TRACK0003", status=Parcel.Status.AT_PICKUP, auto_flow_started_at=old_start)
+        # счётчик заводим до скана — дальше он только правится дельтами
+        get_status_counts(self.customer.pk)
+
+        message = _process_bag_scan(self.staff, "bag-001")
+
+        self.assertIn("1 скан — 1, 2 скан — 1, пропущено — 1", message)
+        fresh.refresh_from_db()
+        self.assertEqual((fresh.status, fresh.auto_flow_stage), (Parcel.Status.AT_CN, 1))
+        self.assertIsNotNone(fresh.auto_flow_started_at)
+
+        ready.refresh_from_db()
+        self.assertEqual(ready.status, Parcel.Status.AT_PICKUP)
+        self.assertEqual(ready.auto_flow_stage, 3)
+        self.assertEqual(ready.pickup_point, self.point)
+        history = list(ParcelHistory.objects.filter(parcel=ready).order_by("occurred_at"))
+        self.assertEqual([h.status for h in history], [Parcel.Status.FROM_CN, Parcel.Status.AT_PICKUP])
+        self.assertEqual(history[0].message, CN_STAGE_3_MESSAGE)
+        self.assertIn(self.point.name, history[1].message)
+
+        done.refresh_from_db()
+        self.assertEqual(done.status, Parcel.Status.AT_PICKUP)
+        self.assertFalse(ParcelHistory.objects.filter(parcel=done).exists())
+
+        events = list(ParcelEvent.objects.order_by("id").values_list("parcel_id", "old_status", "status"))
+        self.assertEqual(
+            events,
+            [
+                (fresh.pk, Parcel.Status.WAITING_CN, Parcel.Status.AT_CN),
+                (ready.pk, Parcel.Status.AT_CN, Parcel.Status.FROM_CN),
+                (ready.pk, Parcel.Status.FROM_CN, Parcel.Status.AT_PICKUP),
+            ],
+        )
+
+        self.bag.refresh_from_db()
+        self.assertIsNotNone(self.bag.first_scanned_at)
+        self.assertIsNotNone(self.bag.second_scanned_at)
+        self.assertEqual(get_status_counts(self.customer.pk), table_counts(self.customer.pk))
+
+    def test_early_second_scan_is_skipped(self):
+        parcel = self._parcel(
+            "TRACK0004", status=Parcel.Status.AT_CN, auto_flow_started_at=_norm_dt(timezone.now()), auto_flow_stage=1
+        )
+        message = _process_bag_scan(self.staff, "BAG-001")
+        self.assertIn("пропущено — 1", message)
+        parcel.refresh_from_db()
+        self.assertEqual(parcel.status, Parcel.Status.AT_CN)
+
+    def test_unknown_or_empty_bag(self):
+        with self.assertRaisesMessage(ValueError, "не найден"):
+            _process_bag_scan(self.staff, "BAG-404")
+        with self.assertRaisesMessage(ValueError, "пуст"):
+            _process_bag_scan(self.staff, "BAG-001")
@@ -0,0 +1,54 @@
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from apps.main.bench import measure, percentile, summarize
+from apps.main.models import Parcel
+
+
+class PercentileTests(SimpleTestCase):
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        # ранг округляется вверх и не меньше 1
+        self.assertEqual(percentile([10, 20, 30], 50), 20)
+        self.assertEqual(percentile([10, 20, 30], 0), 10)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_summarize_in_milliseconds(self):
+        stats = summarize([0.004, 0.001, 0.003, 0.002], wall_seconds=0.5)
+        self.assertEqual(
+            stats,
+            {
+                "count": 4,
+                "min_ms": 1.0,
+                "mean_ms": 2.5,
+                "p50_ms": 2.0,
+                "p95_ms": 4.0,
+                "p99_ms": 4.0,
+                "max_ms": 4.0,
+                "rps": 8.0,
+            },
+        )
+        self.assertEqual(summarize([])["count"], 0)
+
+
+class MeasureTests(TestCase):
+    def test_counts_queries_per_iteration_without_setup_and_warmup(self):
+        calls = []
+
+        def setup(i):
+            Parcel.objects.exists()  # подготовка в замер не входит
+            return i
+
+        def func(i):
+            calls.append(i)
+            for _ in range(2 if i == 1 else 1):
+                Parcel.objects.count()
+
+        stats = measure(func, 3, connection, warmup=1, setup=setup)
+        self.assertEqual(calls, [-1, 0, 1, 2])
+        self.assertEqual(stats["count"], 3)
+        self.assertEqual((stats["queries_mean"], stats["queries_max"]), (1.33, 2))
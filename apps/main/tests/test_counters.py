@@ -0,0 +1,97 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.main.auto_status import _advance_cn_flow, _norm_dt
+from apps.main.counters import deferred, get_status_counts, rebuild_status_counters, record_moves, status_changed
+from apps.main.models import Parcel, ParcelEvent, UserStatusCounter
+
+from .helpers import make_point, make_user, table_counts
+
+WAITING, AT_CN, FROM_CN = Parcel.Status.WAITING_CN, Parcel.Status.AT_CN, Parcel.Status.FROM_CN
+
+
+class StatusCounterTests(TestCase):
+    def setUp(self):
+        self.user = make_user("customer")
+
+    def test_first_read_counts_from_table(self):
+        Parcel.objects.create(track_number="TRACK0001", user=self.user)
+        Parcel.objects.create(track_number="TRACK0002", user=self.user, status=AT_CN)
+        self.assertFalse(UserStatusCounter.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(get_status_counts(self.user.pk), table_counts(self.user.pk))
+        self.assertTrue(UserStatusCounter.objects.filter(pk=self.user.pk).exists())
+
+    def test_missing_row_is_created_including_the_move(self):
+        Parcel.objects.create(track_number="TRACK0001", user=self.user, status=AT_CN)
+        # посылка уже записана, счётчика ещё нет — строка считается по таблице без двойного учёта
+        status_changed(self.user.pk, WAITING, AT_CN)
+        self.assertEqual(get_status_counts(self.user.pk)[AT_CN], 1)
+        self.assertEqual(get_status_counts(self.user.pk)[WAITING], 0)
+
+    def test_deltas(self):
+        get_status_counts(self.user.pk)
+        status_changed(self.user.pk, None, WAITING, n=3)
+        status_changed(self.user.pk, WAITING, AT_CN)
+        status_changed(self.user.pk, AT_CN, AT_CN)
+        status_changed(None, WAITING, AT_CN)
+        counts = get_status_counts(self.user.pk)
+        self.assertEqual((counts[WAITING], counts[AT_CN]), (2, 1))
+
+    def test_deferred_applies_once_at_exit(self):
+        get_status_counts(self.user.pk)
+        with deferred():
+            record_moves({(self.user.pk, None, WAITING): 2})
+            with deferred():
+                status_changed(self.user.pk, WAITING, FROM_CN)
+            self.assertEqual(get_status_counts(self.user.pk)[WAITING], 0)
+        counts = get_status_counts(self.user.pk)
+        self.assertEqual((counts[WAITING], counts[FROM_CN]), (1, 1))
+
+    def test_rebuild(self):
+        Parcel.objects.create(track_number="TRACK0001", user=self.user, status=FROM_CN)
+        UserStatusCounter.objects.create(user=self.user, at_cn=7)
+        self.assertEqual(rebuild_status_counters([self.user.pk]), 1)
+        self.assertEqual(get_status_counts(self.user.pk), table_counts(self.user.pk))
+
+
+class AdvanceCnFlowRaceTests(TestCase):
+    def test_stale_copy_does_not_count_twice(self):
+        user = make_user("customer")
+        Parcel.objects.create(
+            track_number="TRACK0001", user=user, status=AT_CN, auto_flow_stage=2,
+            auto_flow_started_at=_norm_dt(timezone.now() - timedelta(days=3)),
+        )
+        get_status_counts(user.pk)
+        now = timezone.now()
+        # две копии, прочитанные до смены — как кабинет и process_parcel_flows
+        first, stale = Parcel.objects.get(track_number="TRACK0001"), Parcel.objects.get(track_number="TRACK0001")
+
+        self.assertEqual(_advance_cn_flow(first, now), 1)
+        self.assertEqual(_advance_cn_flow(stale, now), 0)
+
+        self.assertEqual((stale.status, stale.auto_flow_stage), (FROM_CN, 3))
+        self.assertEqual(ParcelEvent.objects.filter(status=FROM_CN).count(), 1)
+        self.assertEqual(get_status_counts(user.pk), table_counts(user.pk))
+
+
+class CabinetClaimTests(TestCase):
+    def test_claim_counts_once(self):
+        point = make_point()
+        user = make_user("customer", point)
+        other = make_user("other")
+        Parcel.objects.create(track_number="TAKEN0001", user=other)
+        get_status_counts(user.pk)
+        self.client.force_login(user)
+
+        for _ in range(2):
+            response = self.client.post(reverse("cabinet_home"), {"tracks": ["track0001", "TAKEN0001"]})
+            self.assertEqual(response.status_code, 302)
+
+        parcel = Parcel.objects.get(track_number="TRACK0001")
+        self.assertEqual((parcel.user_id, parcel.destination_id), (user.pk, point.pk))
+        self.assertEqual(Parcel.objects.get(track_number="TAKEN0001").user_id, other.pk)
+        self.assertEqual(get_status_counts(user.pk), table_counts(user.pk))
+        self.assertEqual(get_status_counts(user.pk)[WAITING], 1)
@@ -0,0 +1,120 @@
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from apps.main import db_router
+from apps.main.db_router import PIN_SESSION_KEY, ReplicaRouter, ReplicaStickinessMiddleware, replica_reads
+from apps.main.models import Parcel
+
+
+def _request(method="get", session=None):
+    request = getattr(RequestFactory(), method)("/")
+    request.session = session if session is not None else SessionStore()
+    return request
+
+
+@replica_reads
+def _read_view(request):
+    return HttpResponse(db_router._read_alias.get() or "")
+
+
+@replica_reads
+async def _aread_view(request):
+    return HttpResponse(db_router._read_alias.get() or "")
+
+
+@mock.patch.object(db_router, "_replica_alias", return_value="replica")
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads_go_to_primary_outside_replica_reads(self, _alias):
+        self.assertEqual(self.router.db_for_read(Parcel), "default")
+
+    def test_reads_inside_replica_reads(self, _alias):
+        token = db_router._read_alias.set("replica")
+        try:
+            self.assertEqual(self.router.db_for_read(Parcel), "replica")
+            # сессии — всегда с основной
+            self.assertEqual(self.router.db_for_read(Session), "default")
+        finally:
+            db_router._read_alias.reset(token)
+
+    def test_write_in_request_switches_reads_to_primary(self, _alias):
+        state_token = db_router._request_state.set({"wrote": False})
+        alias_token = db_router._read_alias.set("replica")
+        try:
+            self.assertEqual(self.router.db_for_read(Parcel), "replica")
+            self.assertEqual(self.router.db_for_write(Parcel), "default")
+            self.assertEqual(self.router.db_for_read(Parcel), "default")
+        finally:
+            db_router._read_alias.reset(alias_token)
+            db_router._request_state.reset(state_token)
+
+    def test_no_migrations_on_replica(self, _alias):
+        self.assertIs(self.router.allow_migrate("replica", "main"), False)
+        self.assertIsNone(self.router.allow_migrate("default", "main"))
+
+
+@mock.patch.object(db_router, "_replica_alias", return_value="replica")
+class ReplicaReadsTests(SimpleTestCase):
+    def test_get_reads_from_replica(self, _alias):
+        self.assertEqual(_read_view(_request()).content, b"replica")
+        self.assertIsNone(db_router._read_alias.get())
+
+    def test_post_stays_on_primary(self, _alias):
+        self.assertEqual(_read_view(_request("post")).content, b"")
+
+    def test_pinned_session_stays_on_primary(self, _alias):
+        session = SessionStore()
+        session[PIN_SESSION_KEY] = time.time() + 60
+        self.assertEqual(_read_view(_request(session=session)).content, b"")
+
+    def test_expired_pin_reads_from_replica(self, _alias):
+        session = SessionStore()
+        session[PIN_SESSION_KEY] = time.time() - 1
+        self.assertEqual(_read_view(_request(session=session)).content, b"replica")
+
+    def test_async_view(self, _alias):
+        self.assertEqual(async_to_sync(_aread_view)(_request()).content, b"replica")
+        session = SessionStore()
+        session[PIN_SESSION_KEY] = time.time() + 60
+        self.assertEqual(async_to_sync(_aread_view)(_request(session=session)).content, b"")
+
+    def test_without_replica_configured(self, alias):
+        alias.return_value = None
+        self.assertEqual(_read_view(_request()).content, b"")
+
+
+@mock.patch.object(db_router, "_replica_alias", return_value="replica")
+class StickinessMiddlewareTests(SimpleTestCase):
+    def _run(self, view):
+        request = _request()
+        ReplicaStickinessMiddleware(view)(request)
+        return request.session
+
+    def test_write_pins_session(self, _alias):
+        def view(request):
+            ReplicaRouter().db_for_write(Parcel)
+            return HttpResponse()
+
+        session = self._run(view)
+        self.assertGreater(session[PIN_SESSION_KEY], time.time())
+
+    def test_read_only_request_does_not_pin(self, _alias):
+        session = self._run(lambda request: HttpResponse())
+        self.assertNotIn(PIN_SESSION_KEY, session)
+
+    def test_async_write_pins_session(self, _alias):
+        async def view(request):
+            ReplicaRouter().db_for_write(Parcel)
+            return HttpResponse()
+
+        request = _request()
+        async_to_sync(ReplicaStickinessMiddleware(view))(request)
+        self.assertGreater(request.session[PIN_SESSION_KEY], time.time())
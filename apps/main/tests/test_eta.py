@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.main import refcache
+from apps.main.auto_status import _norm_dt
+from apps.main.eta import BUCKET_SECONDS, parcel_eta, reset_transit_stats, update_transit_stats
+from apps.main.models import Parcel, ParcelHistory, TransitStat
+
+from .helpers import make_point
+
+AT_CN, FROM_CN, AT_PICKUP = Parcel.Status.AT_CN, Parcel.Status.FROM_CN, Parcel.Status.AT_PICKUP
+
+
+@override_settings(ROLLUP_SAFETY_SECONDS=0, ETA_HALF_LIFE_DAYS=30, ETA_MIN_SAMPLES=2)
+class TransitStatsTests(TestCase):
+    def setUp(self):
+        self.point = make_point()
+        self.now = _norm_dt(timezone.now())
+        self.n = 0
+
+    def _arrival(self, days_in_transit, arrived_days_ago=0, point=None):
+        """
+        Посылка, прибывшая в ПВЗ arrived_days_ago дней назад после days_in_transit дней пути.
+        """
+        self.n += 1
+        arrived = self.now - timedelta(days=arrived_days_ago)
+        parcel = Parcel.objects.create(
+            track_number=f"TRACK{self.n:04d}",
+            status=AT_PICKUP,
+            pickup_point=point or self.point,
+            auto_flow_started_at=arrived - timedelta(days=days_in_transit),
+        )
+        ParcelHistory.objects.create(parcel=parcel, status=AT_PICKUP, message="в ПВЗ", occurred_at=arrived)
+
+    def _stat(self, stage, point=None):
+        return TransitStat.objects.get(stage=stage, pickup_point=point)
+
+    def test_percentiles_per_point_and_overall(self):
+        for days in (4, 5, 5, 5, 9):
+            self._arrival(days)
+        self._arrival(1, point=make_point("ПВЗ 2"))
+
+        self.assertEqual(update_transit_stats()["rows"], 6)
+
+        row = self._stat(AT_CN, self.point)
+        self.assertEqual(row.samples, 5)
+        self.assertEqual(row.p50_seconds, (5 * 24 + 1) * BUCKET_SECONDS)
+        self.assertEqual(row.p90_seconds, (9 * 24 + 1) * BUCKET_SECONDS)
+        # от отправки из Китая — на 2 дня меньше
+        self.assertEqual(self._stat(FROM_CN, self.point).p50_seconds, (3 * 24 + 1) * BUCKET_SECONDS)
+        self.assertEqual(self._stat(AT_CN).samples, 6)
+
+    def test_older_arrivals_weigh_less(self):
+        self._arrival(10, arrived_days_ago=30)
+        self._arrival(2)
+        update_transit_stats()
+
+        row = self._stat(AT_CN, self.point)
+        self.assertEqual(row.histogram, {str(10 * 24): 0.5, str(2 * 24): 1.0})
+        self.assertEqual(row.decayed_to, self.now)
+        # вес недавней посылки больше половины — медиана по ней
+        self.assertEqual(row.p50_seconds, (2 * 24 + 1) * BUCKET_SECONDS)
+
+    def test_incremental_run_matches_rebuild(self):
+        self._arrival(10, arrived_days_ago=30)
+        update_transit_stats()
+        TransitStat.objects.update(updated_at=self.now - timedelta(days=1))
+        self._arrival(2)
+        update_transit_stats()
+        incremental = self._stat(AT_CN, self.point)
+        self.assertGreater(incremental.updated_at, self.now - timedelta(days=1))
+
+        reset_transit_stats()
+        update_transit_stats()
+        rebuilt = self._stat(AT_CN, self.point)
+        self.assertEqual(incremental.histogram, rebuilt.histogram)
+        self.assertEqual(incremental.decayed_to, rebuilt.decayed_to)
+
+    def test_watermark(self):
+        self._arrival(5)
+        update_transit_stats()
+        self.assertEqual(update_transit_stats()["rows"], 0)
+        self.assertEqual(self._stat(AT_CN, self.point).samples, 1)
+
+    def test_parcel_eta_falls_back_to_all_points(self):
+        self._arrival(5)
+        self._arrival(5)
+        lonely = make_point("ПВЗ 2")
+        self._arrival(7, point=lonely)
+        update_transit_stats()
+        refcache.bump_version()
+        stats = refcache.get_transit_stats()
+
+        started = self.now
+        eta = parcel_eta(stats, AT_CN, started, self.point.pk)
+        self.assertEqual(eta["samples"], 2)
+        self.assertEqual(eta["from"], (started + timedelta(hours=5 * 24 + 1)).isoformat())
+        # у ПВЗ 2 одна посылка — меньше ETA_MIN_SAMPLES, берём общую
+        self.assertEqual(parcel_eta(stats, AT_CN, started, lonely.pk)["samples"], 3)
+        self.assertIsNone(parcel_eta(stats, AT_PICKUP, started, self.point.pk))
+        self.assertIsNone(parcel_eta(stats, AT_CN, None, self.point.pk))
@@ -0,0 +1,55 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.main.auto_status import _cn_flow_lag_seconds
+from apps.main.models import Parcel
+
+NOW = timezone.now().replace(microsecond=0)
+
+
+class FlowLagTests(TestCase):
+    def _parcel(self, track, stage, started_ago):
+        parcel = Parcel.objects.create(track_number=track)
+        started = NOW - started_ago if started_ago is not None else None
+        Parcel.objects.filter(pk=parcel.pk).update(auto_flow_stage=stage, auto_flow_started_at=started)
+
+    def setUp(self):
+        self._parcel("NOFLOW", 0, None)
+        self._parcel("DONE", 3, timedelta(days=10))
+        self._parcel("STAGE2_NOT_DUE", 2, timedelta(days=1))
+        self._parcel("STAGE0_DUE", 0, timedelta(seconds=5))
+        # этап 2 наступил через 10 с после старта — 20 с назад
+        self._parcel("STAGE1_DUE", 1, timedelta(seconds=30))
+
+    def test_lag_is_age_of_oldest_due_transition(self):
+        self.assertEqual(_cn_flow_lag_seconds(NOW), 20.0)
+
+        self._parcel("STAGE2_DUE", 2, timedelta(days=2, seconds=100))
+        self.assertEqual(_cn_flow_lag_seconds(NOW), 100.0)
+
+    def test_no_due_transitions(self):
+        Parcel.objects.filter(auto_flow_stage__lt=2).delete()
+        self.assertEqual(_cn_flow_lag_seconds(NOW), 0.0)
+
+    @override_settings(FLOW_LAG_ALERT_SECONDS=60)
+    def test_health_computes_lag_without_published_gauge(self):
+        self._parcel("STAGE2_DUE", 2, timedelta(days=2, seconds=100))
+        with mock.patch("apps.main.views.collect", return_value={"gauges": {}}):
+            response = self.client.get(reverse("flow_health"))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "lagging")
+        self.assertGreaterEqual(response.json()["lag_seconds"], 100)
+
+    @override_settings(FLOW_LAG_ALERT_SECONDS=60)
+    def test_health_trusts_fresh_published_gauge(self):
+        self._parcel("STAGE2_DUE", 2, timedelta(days=2, seconds=100))
+        gauges = {("kargo_flow_lag_seconds", ()): (0.0, time.time())}
+        with mock.patch("apps.main.views.collect", return_value={"gauges": gauges}):
+            response = self.client.get(reverse("flow_health"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["lag_seconds"], 0)
@@ -0,0 +1,81 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from apps.main.models import CabinetProfile, Parcel, ParcelHistory
+from apps.main.search import HISTORY_FTS_TABLE, _has_fts_table, search_history
+
+User = get_user_model()
+
+
+class HistorySearchTests(TestCase):
+    def setUp(self):
+        self.assertTrue(_has_fts_table(connection, HISTORY_FTS_TABLE))
+        self.parcel = Parcel.objects.create(track_number="YT1000000001")
+        self.other = Parcel.objects.create(track_number="LP2000000002")
+        self.arrived = ParcelHistory.objects.create(
+            parcel=self.parcel, status=Parcel.Status.AT_PICKUP, message="Прибыла в ПВЗ Бишкек, ул. Киевская"
+        )
+        self.sorted = ParcelHistory.objects.create(
+            parcel=self.other, status=Parcel.Status.FROM_CN, message="Отправлена из Гуанчжоу в Бишкек"
+        )
+
+    def _ids(self, text, **filters):
+        return [e["id"] for e in search_history(text, **filters)["events"]]
+
+    def test_found_by_all_words_last_one_by_prefix(self):
+        self.assertEqual(self._ids("Бишкек"), [self.sorted.pk, self.arrived.pk])
+        self.assertEqual(self._ids("бишкек киев"), [self.arrived.pk])
+        self.assertEqual(self._ids("Бишкек", status=Parcel.Status.FROM_CN), [self.sorted.pk])
+
+        event = search_history("Гуанчжоу")["events"][0]
+        self.assertEqual(event["track_number"], "LP2000000002")
+
+    def test_edited_and_deleted_messages_are_reindexed(self):
+        self.arrived.message = "Выдана получателю"
+        self.arrived.save(update_fields=["message"])
+        self.assertEqual(self._ids("Киевская"), [])
+        self.assertEqual(self._ids("выдана"), [self.arrived.pk])
+
+        self.sorted.delete()
+        self.assertEqual(self._ids("Гуанчжоу"), [])
+
+    def test_keyset_pagination(self):
+        page = search_history("Бишкек", limit=1)
+        self.assertEqual([e["id"] for e in page["events"]], [self.sorted.pk])
+        self.assertEqual(self._ids("Бишкек", before_id=page["next_before"], limit=1), [self.arrived.pk])
+
+    def test_staff_endpoint(self):
+        employee = User.objects.create_user(username="staff")
+        CabinetProfile.objects.create(user=employee, full_name="Сотрудник", is_employee=True)
+        self.client.force_login(employee)
+        url = reverse("staff_history_search")
+
+        data = self.client.get(url, {"q": "Киевская"}).json()
+        self.assertEqual([e["id"] for e in data["events"]], [self.arrived.pk])
+        self.assertEqual(self.client.get(url, {"q": "ab"}).status_code, 400)
+
+
+class HistoryAdminSearchTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser("admin", "admin@example.com", None)
+        self.client.force_login(admin)
+        parcel = Parcel.objects.create(track_number="YT1000000001")
+        other = Parcel.objects.create(track_number="LP2000000002")
+        self.by_track = ParcelHistory.objects.create(parcel=parcel, status=Parcel.Status.AT_CN, message="Принята")
+        self.by_text = ParcelHistory.objects.create(
+            parcel=other, status=Parcel.Status.AT_CN, message="Принята на склад YT"
+        )
+        ParcelHistory.objects.create(parcel=other, status=Parcel.Status.FROM_CN, message="Отправлена")
+        self.url = reverse("admin:main_parcelhistory_changelist")
+
+    def _ids(self, q):
+        response = self.client.get(self.url, {"q": q})
+        return sorted(h.pk for h in response.context["cl"].result_list)
+
+    def test_found_by_track_prefix_or_message(self):
+        # трек — по префиксу через подзапрос id посылок, текст — по FTS
+        self.assertEqual(self._ids("yt1000"), [self.by_track.pk])
+        self.assertEqual(self._ids("yt"), [self.by_track.pk, self.by_text.pk])
+        self.assertEqual(self._ids("склад"), [self.by_text.pk])
@@ -0,0 +1,66 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from apps.main.http_load import HttpClient, LoadStats
+
+RESPONSES = [
+    b"HTTP/1.1 200 OK\r\nSet-Cookie: sessionid=abc; Path=/\r\nContent-Length: 5\r\n\r\nhello",
+    b"HTTP/1.1 404 Not Found\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nfoo\r\n4\r\nbar!\r\n0\r\n\r\n",
+]
+
+
+class HttpClientTests(SimpleTestCase):
+    def test_keep_alive_cookies_and_chunked_body(self):
+        requests = []
+        connections = []
+
+        async def handle(reader, writer):
+            connections.append(writer)
+            for response in RESPONSES:
+                requests.append(await reader.readuntil(b"\r\n\r\n"))
+                writer.write(response)
+                await writer.drain()
+            writer.close()
+
+        async def scenario():
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            client = HttpClient(f"http://127.0.0.1:{port}")
+            try:
+                first = await client.request("GET", "/cabinet/")
+                second = await client.request("GET", "/missing/")
+            finally:
+                await client.close()
+                server.close()
+                await server.wait_closed()
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        self.assertEqual((first[0], first[2]), (200, b"hello"))
+        self.assertEqual((second[0], second[2]), (404, b"foobar!"))
+        # одно соединение, cookie из первого ответа уходит во втором запросе
+        self.assertEqual(len(connections), 1)
+        self.assertNotIn(b"Cookie:", requests[0])
+        self.assertIn(b"Cookie: sessionid=abc\r\n", requests[1])
+
+    def test_only_http_is_supported(self):
+        with self.assertRaises(ValueError):
+            HttpClient("https://example.com")
+
+
+class LoadStatsTests(SimpleTestCase):
+    def test_report_per_endpoint_and_total(self):
+        stats = LoadStats()
+        stats.record("cabinet_home", 0.010, 200)
+        stats.record("cabinet_home", 0.030, 200)
+        stats.record("parcel_history", 0.020, 404)
+        stats.record_error("parcel_history", ConnectionResetError())
+
+        report = stats.report(wall_seconds=2.0)
+        self.assertEqual(report["total"]["count"], 3)
+        self.assertEqual(report["total"]["p50_ms"], 20.0)
+        self.assertEqual(report["endpoints"]["cabinet_home"]["statuses"], {"200": 2})
+        self.assertEqual(report["endpoints"]["cabinet_home"]["rps"], 1.0)
+        self.assertEqual(report["endpoints"]["parcel_history"]["statuses"], {"404": 1})
+        self.assertEqual(report["errors"], {"parcel_history: ConnectionResetError": 1})
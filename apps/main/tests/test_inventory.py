@@ -0,0 +1,67 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.main.auto_status import _norm_dt, _process_staff_scan
+from apps.main.models import Parcel
+
+from .helpers import make_point, make_user
+
+
+class SecondScanPickupPointTests(TestCase):
+    def test_second_scan_stores_staff_pickup_point(self):
+        point = make_point()
+        staff = make_user("staff", point, employee=True)
+        parcel = Parcel.objects.create(
+            track_number="TRACK0001",
+            status=Parcel.Status.AT_CN,
+            auto_flow_started_at=_norm_dt(timezone.now() - timedelta(days=3)),
+            auto_flow_stage=2,
+        )
+
+        _process_staff_scan(staff, "TRACK0001")
+
+        parcel.refresh_from_db()
+        self.assertEqual(parcel.status, Parcel.Status.AT_PICKUP)
+        self.assertEqual(parcel.pickup_point, point)
+
+
+class InventoryViewTests(TestCase):
+    def setUp(self):
+        self.point = make_point()
+        self.other = make_point("ПВЗ 2")
+        self.staff = make_user("staff", self.point, employee=True)
+        self.client.force_login(self.staff)
+        for i in range(3):
+            Parcel.objects.create(track_number=f"HERE000{i}", status=Parcel.Status.AT_PICKUP, pickup_point=self.point)
+        Parcel.objects.create(track_number="THERE0001", status=Parcel.Status.AT_PICKUP, pickup_point=self.other)
+        Parcel.objects.create(track_number="GONE00001", status=Parcel.Status.RECEIVED, pickup_point=self.point)
+
+    def _get(self, **params):
+        return self.client.get(reverse("staff_inventory"), params)
+
+    def test_defaults_to_staff_point_newest_first(self):
+        data = self._get().json()
+        self.assertEqual(data["pickup_point"]["id"], self.point.pk)
+        self.assertEqual([p["track_number"] for p in data["parcels"]], ["HERE0002", "HERE0001", "HERE0000"])
+        self.assertIsNone(data["next_before"])
+
+    def test_keyset_pages(self):
+        first = self._get(limit=2).json()
+        self.assertEqual(len(first["parcels"]), 2)
+        second = self._get(limit=2, before=first["next_before"]).json()
+        self.assertEqual([p["track_number"] for p in second["parcels"]], ["HERE0000"])
+        self.assertIsNone(second["next_before"])
+
+    def test_other_point(self):
+        data = self._get(point=self.other.pk).json()
+        self.assertEqual([p["track_number"] for p in data["parcels"]], ["THERE0001"])
+
+    def test_unknown_point(self):
+        self.assertEqual(self._get(point=999999).status_code, 404)
+
+    def test_customer_is_forbidden(self):
+        self.client.force_login(make_user("customer", self.point))
+        self.assertEqual(self._get().status_code, 403)
@@ -0,0 +1,117 @@
+import io
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.main import manifest
+from apps.main.counters import get_status_counts
+from apps.main.manifest import ManifestResult, import_manifest
+from apps.main.models import Parcel, ParcelEvent, ParcelHistory
+
+from .helpers import make_point, make_user, table_counts
+
+
+def _lines(text):
+    return io.StringIO(text)
+
+
+class ImportManifestTests(TestCase):
+    def setUp(self):
+        self.customer = make_user("customer")
+
+    def test_import_starts_new_and_claimed_parcels(self):
+        claimed = Parcel.objects.create(track_number="CLAIMED01", user=self.customer)
+        started = Parcel.objects.create(
+            track_number="STARTED01", status=Parcel.Status.AT_CN, auto_flow_started_at=timezone.now()
+        )
+        get_status_counts(self.customer.pk)
+
+        result = import_manifest(
+            _lines("id;track\n1;new00001\n2;claimed01\n3;STARTED01\n4;bad!\n5;NEW00001\n")
+        )
+
+        self.assertEqual((result.rows, result.accepted, result.rejected), (5, 3, 2))
+        self.assertEqual((result.created, result.started, result.skipped), (1, 2, 1))
+        self.assertEqual([r[0] for r in result.rejects], [5, 6])
+
+        new = Parcel.objects.get(track_number="NEW00001")
+        claimed.refresh_from_db()
+        for parcel in (new, claimed):
+            self.assertEqual((parcel.status, parcel.auto_flow_stage), (Parcel.Status.AT_CN, 1))
+            self.assertEqual(ParcelHistory.objects.filter(parcel=parcel).count(), 1)
+        self.assertFalse(ParcelHistory.objects.filter(parcel=started).exists())
+
+        self.assertEqual(ParcelEvent.objects.filter(user=self.customer).count(), 1)
+        self.assertEqual(get_status_counts(self.customer.pk), table_counts(self.customer.pk))
+
+    def test_repeat_in_later_chunk_is_rejected(self):
+        result = import_manifest(_lines("TRACK0001\nTRACK0002\nTRACK0001\n"), chunk_size=2)
+        self.assertEqual((result.accepted, result.started, result.skipped, result.rejected), (2, 2, 0, 1))
+        self.assertEqual(result.rejects, [(3, "TRACK0001", "Повтор трек-номера в файле.")])
+        self.assertEqual(ParcelHistory.objects.count(), 2)
+
+    def test_parcel_inserted_concurrently_is_not_counted_as_created(self):
+        original = Parcel.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # параллельный скан вставил и запустил один из треков раньше нас
+            Parcel.objects.create(
+                track_number="TRACK0002", status=Parcel.Status.AT_CN, auto_flow_started_at=timezone.now()
+            )
+            return original(objs, **kwargs)
+
+        with mock.patch.object(Parcel.objects, "bulk_create", racing_bulk_create):
+            result = import_manifest(_lines("TRACK0001\nTRACK0002\n"))
+        self.assertEqual((result.accepted, result.created, result.started, result.skipped), (2, 1, 1, 1))
+
+    def test_reimport_skips_started_tracks(self):
+        import_manifest(_lines("TRACK0001\nTRACK0002\n"))
+        result = import_manifest(_lines("TRACK0001\nTRACK0002\n"))
+        self.assertEqual((result.accepted, result.started, result.skipped), (2, 0, 2))
+        self.assertEqual(ParcelHistory.objects.count(), 2)
+
+    def test_failure_keeps_committed_chunks_in_result(self):
+        original = manifest._import_chunk
+        calls = []
+
+        def failing(chunk, now, result):
+            calls.append(chunk)
+            if len(calls) == 2:
+                raise RuntimeError("db gone")
+            original(chunk, now, result)
+
+        result = ManifestResult()
+        with mock.patch.object(manifest, "_import_chunk", failing), self.assertRaises(RuntimeError):
+            import_manifest(_lines("TRACK0001\nTRACK0002\nTRACK0003\nTRACK0004\n"), chunk_size=2, result=result)
+        self.assertEqual(result.accepted, 2)
+        self.assertEqual(Parcel.objects.filter(status=Parcel.Status.AT_CN).count(), 2)
+
+
+class ManifestViewTests(TestCase):
+    def setUp(self):
+        self.staff = make_user("staff", make_point(), employee=True)
+        self.client.force_login(self.staff)
+
+    def _upload(self, body: bytes):
+        return self.client.post(reverse("staff_manifest"), {"manifest": SimpleUploadedFile("m.csv", body)})
+
+    def test_upload(self):
+        response = self._upload(b"track\nTRACK0001\nTRACK0002\n")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["result"].started, 2)
+        self.assertEqual(response.context["error_message"], "")
+
+    def test_failure_shows_partial_result(self):
+        with mock.patch.object(manifest, "_import_chunk", side_effect=RuntimeError("db gone")), \
+                self.assertLogs("apps.main.views", "ERROR"):
+            response = self._upload(b"TRACK0001\n")
+        self.assertIn("Импорт прерван", response.context["error_message"])
+        self.assertEqual(response.context["result"].rows, 1)
+
+    def test_customer_is_redirected(self):
+        self.client.force_login(make_user("customer"))
+        response = self._upload(b"TRACK0001\n")
+        self.assertRedirects(response, reverse("cabinet_home"), fetch_redirect_response=False)
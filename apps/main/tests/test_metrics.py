@@ -0,0 +1,64 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from apps.main import metrics
+
+ALIVE = 111
+
+
+def _snap(requests, gauge=None, ts=0.0):
+    snap = {"counters": [["kargo_requests_total", [["view", "x"]], requests]], "histograms": [], "gauges": []}
+    if gauge is not None:
+        snap["gauges"].append(["kargo_flow_lag_seconds", [], gauge, ts])
+    return snap
+
+
+@mock.patch.object(metrics, "_pid_alive", lambda pid: pid == ALIVE)
+class FoldExitedTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def _put(self, pid, snap):
+        metrics._write(os.path.join(self.dir, f"metrics-{pid}.json"), snap)
+
+    def _files(self):
+        return sorted(f for f in os.listdir(self.dir) if f.endswith(".json"))
+
+    def _total(self):
+        snaps = [metrics._read(os.path.join(self.dir, f)) for f in self._files()]
+        data = metrics._merge(snaps)
+        return data["counters"][("kargo_requests_total", (("view", "x"),))], data["gauges"]
+
+    def test_dead_processes_fold_into_one_file(self):
+        self._put(ALIVE, _snap(1))
+        self._put(222, _snap(2, gauge=5.0, ts=100.0))
+        self._put(333, _snap(3, gauge=7.0, ts=50.0))
+
+        metrics._fold_exited(self.dir)
+
+        self.assertEqual(self._files(), [f"metrics-{ALIVE}.json", metrics._EXITED])
+        total, gauges = self._total()
+        self.assertEqual(total, 6)
+        self.assertEqual(gauges[("kargo_flow_lag_seconds", ())], (5.0, 100.0))
+
+    def test_exited_file_accumulates(self):
+        self._put(222, _snap(2))
+        metrics._fold_exited(self.dir)
+        self._put(333, _snap(3))
+        metrics._fold_exited(self.dir)
+        # нечего сливать — файл не переписывается
+        metrics._fold_exited(self.dir)
+
+        self.assertEqual(self._files(), [metrics._EXITED])
+        self.assertEqual(self._total()[0], 5)
+
+    def test_broken_snapshot_is_left_alone(self):
+        with open(os.path.join(self.dir, "metrics-444.json"), "w") as f:
+            f.write("{")
+        metrics._fold_exited(self.dir)
+        self.assertEqual(self._files(), ["metrics-444.json"])
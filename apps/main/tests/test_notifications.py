@@ -0,0 +1,114 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.main.models import Notification, Parcel
+from apps.main.notifications import NotificationProvider, _claim, dispatch
+from apps.main.outbox import emit, make_event
+
+from .helpers import make_point, make_user
+
+AT_PICKUP = Parcel.Status.AT_PICKUP
+
+
+class RecordingProvider(NotificationProvider):
+    max_batch = 2
+
+    def __init__(self, error=None):
+        self.error = error
+        self.batches = []
+
+    def send_batch(self, messages):
+        self.batches.append(list(messages))
+        return [self.error] * len(messages)
+
+
+@override_settings(NOTIFY_DELAY_SECONDS=0, NOTIFY_MAX_ATTEMPTS=2)
+class DispatchTests(TestCase):
+    def setUp(self):
+        self.point = make_point()
+
+    def _arrive(self, user, track):
+        parcel = Parcel.objects.create(track_number=track, user=user, status=AT_PICKUP, pickup_point=self.point)
+        emit([make_event(parcel.pk, track, user.pk if user else None, Parcel.Status.FROM_CN, AT_PICKUP, timezone.now())])
+        return parcel
+
+    def test_enqueue_only_owned_arrivals(self):
+        user = make_user("customer", phone="+70000000001")
+        parcel = self._arrive(user, "TRACK0001")
+        self._arrive(None, "TRACK0002")
+        emit([make_event(parcel.pk, "TRACK0001", user.pk, Parcel.Status.AT_CN, Parcel.Status.FROM_CN, timezone.now())])
+        self.assertEqual(list(Notification.objects.values_list("parcel_id", flat=True)), [parcel.pk])
+
+    def test_messages_coalesce_per_user_across_batch_size(self):
+        first = make_user("first", phone="+70000000001")
+        second = make_user("second", phone="+70000000002")
+        for i in range(3):
+            self._arrive(first, f"FIRST000{i}")
+        self._arrive(second, "SECOND001")
+        provider = RecordingProvider()
+
+        stats = dispatch(batch_size=1, provider=provider)
+
+        # batch_size=1 забирает первую строку и остальные строки того же клиента
+        self.assertEqual((stats["notifications"], stats["messages"], stats["sent"]), (3, 1, 3))
+        (message,) = provider.batches[0]
+        self.assertEqual(message.phone, "+70000000001")
+        self.assertIn("FIRST0000, FIRST0001, FIRST0002", message.text)
+        self.assertIn(self.point.name, message.text)
+
+        self.assertEqual(dispatch(batch_size=1, provider=provider)["sent"], 1)
+        self.assertEqual(Notification.objects.filter(state=Notification.State.SENT).count(), 4)
+        self.assertEqual(dispatch(provider=provider)["notifications"], 0)
+
+    def test_failure_retries_then_fails(self):
+        user = make_user("customer", phone="+70000000001")
+        self._arrive(user, "TRACK0001")
+        provider = RecordingProvider(error="gateway down")
+
+        stats = dispatch(provider=provider)
+        self.assertEqual((stats["retry"], stats["failed"]), (1, 0))
+        row = Notification.objects.get()
+        self.assertEqual((row.state, row.attempts, row.last_error), (Notification.State.PENDING, 1, "gateway down"))
+        self.assertGreater(row.next_attempt_at, timezone.now())
+        # повтор ещё не созрел
+        self.assertEqual(dispatch(provider=provider)["notifications"], 0)
+
+        Notification.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        stats = dispatch(provider=provider)
+        self.assertEqual((stats["retry"], stats["failed"]), (0, 1))
+        row.refresh_from_db()
+        self.assertEqual((row.state, row.attempts), (Notification.State.FAILED, 2))
+
+    def test_provider_exception_fails_whole_batch(self):
+        user = make_user("customer", phone="+70000000001")
+        self._arrive(user, "TRACK0001")
+
+        class Crashing(NotificationProvider):
+            def send_batch(self, messages):
+                raise RuntimeError("boom")
+
+        with self.assertLogs("apps.main.notify", "WARNING"):
+            self.assertEqual(dispatch(provider=Crashing())["retry"], 1)
+        self.assertEqual(Notification.objects.get().last_error, "RuntimeError: boom")
+
+    def test_claimed_rows_are_leased(self):
+        user = make_user("customer", phone="+70000000001")
+        self._arrive(user, "TRACK0001")
+        # воркер забрал строки и упал до записи итога
+        self.assertEqual(len(_claim(10, timezone.now())), 1)
+        self.assertEqual(dispatch(provider=RecordingProvider())["notifications"], 0)
+
+        Notification.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(dispatch(provider=RecordingProvider())["sent"], 1)
+
+    def test_user_without_phone_fails(self):
+        user = get_user_model().objects.create_user(username="nophone")
+        self._arrive(user, "TRACK0001")
+        provider = RecordingProvider()
+        stats = dispatch(provider=provider)
+        self.assertEqual((stats["messages"], stats["failed"]), (0, 1))
+        self.assertEqual(provider.batches, [])
+        self.assertEqual(Notification.objects.get().state, Notification.State.FAILED)
@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.main.models import ApiToken, Parcel, ParcelEvent
+from apps.main.outbox import create_token, deferred, emit, make_event, prune_events, read_feed
+
+from .helpers import make_user
+
+WAITING, AT_CN, FROM_CN = Parcel.Status.WAITING_CN, Parcel.Status.AT_CN, Parcel.Status.FROM_CN
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.user = make_user("customer")
+        self.parcel = Parcel.objects.create(track_number="TRACK0001", user=self.user)
+        self.other = Parcel.objects.create(track_number="TRACK0002")
+
+    def _emit(self, parcel, old, new):
+        emit([make_event(parcel.pk, parcel.track_number, parcel.user_id, old, new, timezone.now())])
+
+    def test_deferred_writes_once_at_exit(self):
+        with transaction.atomic(), deferred():
+            self._emit(self.parcel, WAITING, AT_CN)
+            with deferred():
+                self._emit(self.parcel, AT_CN, FROM_CN)
+            self.assertFalse(ParcelEvent.objects.exists())
+        self.assertEqual(
+            list(ParcelEvent.objects.order_by("id").values_list("old_status", "status")),
+            [(WAITING, AT_CN), (AT_CN, FROM_CN)],
+        )
+
+    @override_settings(CHANGE_FEED_SAFETY_SECONDS=0)
+    def test_cursor_pages(self):
+        self._emit(self.parcel, WAITING, AT_CN)
+        self._emit(self.other, WAITING, AT_CN)
+        self._emit(self.parcel, AT_CN, FROM_CN)
+
+        first = read_feed(0, limit=2)
+        self.assertEqual([e["track_number"] for e in first["events"]], ["TRACK0001", "TRACK0002"])
+        self.assertTrue(first["has_more"])
+        second = read_feed(first["next_after"], limit=2)
+        self.assertEqual([e["status"] for e in second["events"]], [FROM_CN])
+        self.assertFalse(second["has_more"])
+        self.assertEqual(read_feed(second["next_after"])["events"], [])
+
+    @override_settings(CHANGE_FEED_SAFETY_SECONDS=0)
+    def test_user_filter(self):
+        self._emit(self.parcel, WAITING, AT_CN)
+        self._emit(self.other, WAITING, AT_CN)
+        page = read_feed(0, user_id=self.user.pk)
+        self.assertEqual([e["parcel_id"] for e in page["events"]], [self.parcel.pk])
+
+    def test_fresh_events_wait_for_safety_window(self):
+        self._emit(self.parcel, WAITING, AT_CN)
+        old = ParcelEvent.objects.get()
+        ParcelEvent.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        self._emit(self.parcel, AT_CN, FROM_CN)
+
+        page = read_feed(0)
+        self.assertEqual([e["id"] for e in page["events"]], [old.pk])
+        self.assertEqual(page["next_after"], old.pk)
+        self.assertFalse(page["has_more"])
+
+    def test_prune(self):
+        self._emit(self.parcel, WAITING, AT_CN)
+        self._emit(self.parcel, AT_CN, FROM_CN)
+        ParcelEvent.objects.filter(status=AT_CN).update(created_at=timezone.now() - timedelta(days=40))
+        self.assertEqual(prune_events(30, batch_size=1), 1)
+        self.assertEqual(list(ParcelEvent.objects.values_list("status", flat=True)), [FROM_CN])
+
+
+@override_settings(CHANGE_FEED_SAFETY_SECONDS=0)
+class ChangeFeedViewTests(TestCase):
+    def setUp(self):
+        self.user = make_user("customer")
+        parcel = Parcel.objects.create(track_number="TRACK0001", user=self.user)
+        emit([make_event(parcel.pk, parcel.track_number, parcel.user_id, WAITING, AT_CN, timezone.now())])
+
+    def _get(self, raw, **params):
+        return self.client.get(reverse("change_feed"), params, HTTP_AUTHORIZATION=f"Bearer {raw}")
+
+    def test_token_auth(self):
+        token, raw = create_token("partner")
+        self.assertNotIn(raw, token.key_hash)
+
+        response = self._get(raw)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["events"]), 1)
+        token.refresh_from_db()
+        self.assertIsNotNone(token.last_used_at)
+
+        self.assertEqual(self._get("wrong").status_code, 401)
+        self.assertEqual(self.client.get(reverse("change_feed")).status_code, 401)
+        ApiToken.objects.filter(pk=token.pk).update(is_active=False)
+        self.assertEqual(self._get(raw).status_code, 401)
+
+    def test_user_token_and_bad_cursor(self):
+        _, raw = create_token("own", user=make_user("other"))
+        self.assertEqual(self._get(raw).json()["events"], [])
+        self.assertEqual(self._get(raw, after="x").status_code, 400)
@@ -0,0 +1,53 @@
+import glob
+import os
+import pstats
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from apps.main import profiling
+from apps.main.models import Parcel, ParcelHistory
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        override = override_settings(PROFILE_DIR=self.dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        admin = get_user_model().objects.create_superuser("admin", "admin@example.com", None)
+        self.client.force_login(admin)
+        parcel = Parcel.objects.create(track_number="TRACK0001", user=admin)
+        ParcelHistory.objects.create(parcel=parcel, status=Parcel.Status.WAITING_CN, message="Ожидается")
+        self.url = reverse("parcel_history", args=[parcel.pk])
+
+    def _profiled_functions(self):
+        (path,) = glob.glob(os.path.join(self.dir, "*.prof"))
+        return {name for _file, _line, name in pstats.Stats(path).stats}
+
+    def test_async_view_body_is_profiled(self):
+        response = self.client.get(self.url, {"__profile": "1"})
+        body = response.content.decode()
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        self.assertIn("status: 200", body)
+        # тело view выполнялось в потоке event loop async_to_sync
+        self.assertIn("_aserialize_history", self._profiled_functions())
+
+    def test_second_profile_is_rejected(self):
+        with profiling.profiled("other", threads=True):
+            response = self.client.get(self.url, {"__profile": "1"})
+        self.assertEqual(response.status_code, 409)
+        # первый профиль закончился — снова можно
+        self.assertEqual(self.client.get(self.url, {"__profile": "1"}).status_code, 200)
+        self.assertIn("_aserialize_history", self._profiled_functions())
+
+    def test_regular_user_gets_normal_response(self):
+        self.client.force_login(get_user_model().objects.create_user("customer"))
+        response = self.client.get(reverse("track_public_lookup"), {"track": "TRACK0001", "__profile": "1"})
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(os.listdir(self.dir), [])
@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.main import refcache
+from apps.main.auto_status import _norm_dt
+from apps.main.models import CabinetProfile, Parcel
+
+from .helpers import make_point, make_user
+
+
+class DestinationTests(TestCase):
+    def setUp(self):
+        refcache.bump_version()
+        self.point = make_point()
+        self.other = make_point("ПВЗ 2")
+        self.user = make_user("customer", self.point)
+
+    def test_claim_sets_destination(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse("cabinet_home"), {"tracks": ["TRACK0001"]})
+        self.assertEqual(Parcel.objects.get(track_number="TRACK0001").destination, self.point)
+
+    def test_profile_change_moves_parcels_in_transit(self):
+        moving = Parcel.objects.create(track_number="TRACK0001", user=self.user, status=Parcel.Status.FROM_CN)
+        arrived = Parcel.objects.create(
+            track_number="TRACK0002", user=self.user, status=Parcel.Status.AT_PICKUP, destination=self.point
+        )
+        self.client.force_login(self.user)
+
+        response = self.client.post(
+            reverse("cabinet_edit_profile"),
+            {"full_name": "Клиент", "phone": "700000001", "pickup_point": self.other.pk},
+        )
+
+        self.assertRedirects(response, reverse("cabinet_profile"), fetch_redirect_response=False)
+        moving.refresh_from_db()
+        arrived.refresh_from_db()
+        self.assertEqual(moving.destination, self.other)
+        self.assertEqual(arrived.destination, self.point)
+
+    def test_unrelated_profile_save_keeps_destination(self):
+        parcel = Parcel.objects.create(track_number="TRACK0001", user=self.user, destination=self.other)
+        profile = CabinetProfile.objects.get(user=self.user)
+        profile.full_name = "Клиент"
+        profile.save(update_fields=["full_name"])
+        parcel.refresh_from_db()
+        self.assertEqual(parcel.destination, self.other)
+
+
+class ReadyQueueViewTests(TestCase):
+    def setUp(self):
+        refcache.bump_version()
+        self.point = make_point()
+        self.other = make_point("ПВЗ 2")
+        self.client.force_login(make_user("staff", self.point, employee=True))
+        old = _norm_dt(timezone.now() - timedelta(days=3))
+        self.ready = [
+            self._parcel("READY0001", old - timedelta(hours=2), self.point),
+            self._parcel("READY0002", old - timedelta(hours=1), self.point),
+            self._parcel("READY0003", old, self.point),
+        ]
+        self._parcel("FRESH0001", _norm_dt(timezone.now()), self.point)
+        self._parcel("THERE0001", old, self.other)
+        self._parcel("NOBODY001", old, None)
+        self._parcel("DONE00001", old, self.point, status=Parcel.Status.AT_PICKUP)
+
+    def _parcel(self, track, started_at, destination, status=Parcel.Status.FROM_CN):
+        return Parcel.objects.create(
+            track_number=track, status=status, auto_flow_started_at=started_at, destination=destination
+        )
+
+    def _get(self, **params):
+        return self.client.get(reverse("staff_ready_queue"), params)
+
+    def _tracks(self, data):
+        return [p["track_number"] for p in data["parcels"]]
+
+    def test_staff_point_oldest_first(self):
+        data = self._get().json()
+        self.assertEqual(data["pickup_point"]["id"], self.point.pk)
+        self.assertEqual(self._tracks(data), ["READY0001", "READY0002", "READY0003"])
+        self.assertIsNone(data["next_after"])
+
+    def test_keyset_pages(self):
+        first = self._get(limit=2).json()
+        self.assertEqual(self._tracks(first), ["READY0001", "READY0002"])
+        second = self._get(limit=2, after=first["next_after"]).json()
+        self.assertEqual(self._tracks(second), ["READY0003"])
+        self.assertEqual(self._get(after="bad").status_code, 400)
+
+    def test_other_and_all_points(self):
+        self.assertEqual(self._tracks(self._get(point=self.other.pk).json()), ["THERE0001"])
+        data = self._get(point="all").json()
+        self.assertIsNone(data["pickup_point"])
+        self.assertEqual(set(self._tracks(data)), {"READY0001", "READY0002", "READY0003", "THERE0001", "NOBODY001"})
+        self.assertEqual(self._get(point=999999).status_code, 404)
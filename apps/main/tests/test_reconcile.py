@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.main.auto_status import _bulk_add_history, _norm_dt
+from apps.main.counters import get_status_counts
+from apps.main.models import JobWatermark, Parcel, ParcelEvent, ParcelHistory
+from apps.main.reconcile import JOB_NAME, _cn_rows, _job_name, reconcile
+
+from .helpers import make_point, make_user, table_counts
+
+AT_CN, FROM_CN, AT_PICKUP = Parcel.Status.AT_CN, Parcel.Status.FROM_CN, Parcel.Status.AT_PICKUP
+
+
+class ReconcileTests(TestCase):
+    def setUp(self):
+        self.point = make_point()
+        self.user = make_user("customer", self.point)
+        self.started = _norm_dt(timezone.now() - timedelta(days=3))
+
+    def _parcel(self, track, status, stage, history_stages, **fields):
+        parcel = Parcel.objects.create(
+            track_number=track, user=self.user, status=status, auto_flow_stage=stage,
+            auto_flow_started_at=self.started, **fields
+        )
+        _bulk_add_history(_cn_rows(parcel.pk, self.started, history_stages))
+        return parcel
+
+    def _statuses(self, parcel):
+        history = ParcelHistory.objects.filter(parcel=parcel).order_by("occurred_at", "id")
+        return list(history.values_list("status", flat=True))
+
+    def test_consistent_parcels_pass(self):
+        self._parcel("TRACK0001", FROM_CN, 3, 3)
+        Parcel.objects.create(track_number="TRACK0002")
+        totals = reconcile(workers=1)
+        self.assertEqual((totals["parcels"], totals["mismatches"]), (2, {}))
+
+    def test_report_does_not_change_anything(self):
+        parcel = self._parcel("TRACK0001", AT_CN, 1, 3)
+        totals = reconcile(workers=1)
+        self.assertEqual(totals["mismatches"], {"stage_behind": 1})
+        self.assertEqual(totals["samples"], [("TRACK0001", "stage_behind", AT_CN, FROM_CN)])
+        parcel.refresh_from_db()
+        self.assertEqual((parcel.status, parcel.auto_flow_stage), (AT_CN, 1))
+
+    def test_repair(self):
+        behind = self._parcel("TRACK0001", AT_CN, 1, 3)
+        no_history = self._parcel("TRACK0002", FROM_CN, 3, 1)
+        manual = self._parcel("TRACK0003", AT_PICKUP, 3, 3, pickup_point=self.point)
+        get_status_counts(self.user.pk)
+
+        totals = reconcile(workers=1, chunk_size=2, repair=True)
+
+        self.assertEqual(totals["mismatches"], {"stage_behind": 1, "cn_history": 1, "history_behind": 1})
+        self.assertEqual(totals["repaired"], 3)
+
+        behind.refresh_from_db()
+        self.assertEqual((behind.status, behind.auto_flow_stage), (FROM_CN, 3))
+        self.assertEqual(
+            list(ParcelEvent.objects.values_list("parcel_id", "old_status", "status")), [(behind.pk, AT_CN, FROM_CN)]
+        )
+        self.assertEqual(self._statuses(no_history), [AT_CN, AT_CN, FROM_CN])
+        # строка текущего статуса — последней, с ПВЗ в тексте
+        self.assertEqual(self._statuses(manual), [AT_CN, AT_CN, FROM_CN, AT_PICKUP])
+        self.assertIn(self.point.name, ParcelHistory.objects.filter(parcel=manual, status=AT_PICKUP).get().message)
+        self.assertEqual(get_status_counts(self.user.pk), table_counts(self.user.pk))
+
+        self.assertEqual(reconcile(workers=1, repair=True)["mismatches"], {})
+        self.assertFalse(JobWatermark.objects.exists())
+
+    def test_status_behind(self):
+        parcel = self._parcel("TRACK0001", FROM_CN, 3, 3)
+        ParcelHistory.objects.create(parcel=parcel, status=AT_PICKUP, message="в ПВЗ", occurred_at=timezone.now())
+        Parcel.objects.filter(pk=parcel.pk).update(updated_at=self.started)
+
+        totals = reconcile(workers=1, repair=True)
+
+        self.assertEqual(totals["mismatches"], {"status_behind": 1})
+        parcel.refresh_from_db()
+        self.assertEqual(parcel.status, AT_PICKUP)
+
+    def test_report_and_repair_keep_separate_checkpoints(self):
+        for i in range(3):
+            self._parcel(f"TRACK000{i}", AT_CN, 1, 3)
+
+        def stop(result, totals):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            reconcile(workers=1, chunk_size=1, on_chunk=stop)
+        first_id = Parcel.objects.order_by("id").first().id
+        self.assertEqual(JobWatermark.objects.get(name=JOB_NAME).last_id, first_id)
+
+        # прерванный отчёт не сдвигает починку
+        repaired = reconcile(workers=1, chunk_size=1, repair=True)
+        self.assertEqual((repaired["resumed_from"], repaired["repaired"]), (0, 3))
+        self.assertFalse(JobWatermark.objects.filter(name=_job_name(True)).exists())
+
+        resumed = reconcile(workers=1, chunk_size=1)
+        self.assertEqual((resumed["resumed_from"], resumed["parcels"]), (first_id, 2))
+        self.assertFalse(JobWatermark.objects.filter(name=JOB_NAME).exists())
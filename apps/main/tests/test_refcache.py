@@ -0,0 +1,38 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from apps.main import refcache
+from apps.main.models import PickupPoint, SiteSettings
+
+
+class RefcacheTests(TestCase):
+    def setUp(self):
+        refcache.bump_version()
+        self.settings = SiteSettings.objects.create(title="old")
+
+    def test_values_are_cached_in_process(self):
+        self.assertEqual(refcache.get_site_settings().title, "old")
+        # update() без сигналов — видно, что читается кэш
+        SiteSettings.objects.update(title="new")
+        with self.assertNumQueries(0):
+            self.assertEqual(refcache.get_site_settings().title, "old")
+
+    def test_save_invalidates(self):
+        self.assertEqual(refcache.get_site_settings().title, "old")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.settings.title = "new"
+            self.settings.save()
+        self.assertEqual(refcache.get_site_settings().title, "new")
+
+    def test_version_bumped_by_other_worker(self):
+        self.assertEqual(refcache.get_active_pickup_points(), ())
+        PickupPoint.objects.create(name="ПВЗ 1", address="ул. Тестовая, 1")
+        # другой воркер меняет только общую версию, _local этого процесса цел
+        cache.incr(refcache.VERSION_KEY)
+        self.assertEqual([p.name for p in refcache.get_active_pickup_points()], ["ПВЗ 1"])
+
+    def test_process_local_cache_warning(self):
+        self.assertEqual(refcache.check_shared_cache(), [])
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([w.id for w in refcache.check_shared_cache()], ["main.W001"])
@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.main.auto_status import _advance_cn_flow, _norm_dt
+from apps.main.models import DailyRollup, JobWatermark, Parcel, ParcelHistory
+from apps.main.rollups import JOB_NAME, reset_rollups, update_rollups
+
+from .helpers import make_point
+
+
+def _events(status):
+    return DailyRollup.objects.filter(status=status).aggregate(n=Sum("events"))["n"] or 0
+
+
+@override_settings(ROLLUP_SAFETY_SECONDS=0)
+class RollupTests(TestCase):
+    def setUp(self):
+        self.started = _norm_dt(timezone.now() - timedelta(days=3))
+
+    def _parcel(self, track, **fields):
+        parcel = Parcel.objects.create(
+            track_number=track, status=Parcel.Status.WAITING_CN, auto_flow_started_at=self.started, **fields
+        )
+        _advance_cn_flow(parcel, timezone.now())
+        return parcel
+
+    def test_cn_stages_count_once(self):
+        self._parcel("TRACK0001")
+        self._parcel("TRACK0002")
+        self.assertEqual(ParcelHistory.objects.filter(status=Parcel.Status.AT_CN).count(), 4)
+
+        result = update_rollups()
+
+        self.assertEqual(result["rows"], 6)
+        self.assertEqual(_events(Parcel.Status.AT_CN), 2)
+        self.assertEqual(_events(Parcel.Status.FROM_CN), 2)
+
+    def test_legacy_rows_without_hash(self):
+        self._parcel("TRACK0001")
+        ParcelHistory.objects.update(message_hash="")
+        update_rollups()
+        self.assertEqual(_events(Parcel.Status.AT_CN), 1)
+
+    def test_pickup_point_and_transit(self):
+        point = make_point()
+        parcel = self._parcel("TRACK0001", pickup_point=point)
+        arrived = self.started + timedelta(days=3)
+        ParcelHistory.objects.create(parcel=parcel, status=Parcel.Status.AT_PICKUP, message="в ПВЗ", occurred_at=arrived)
+
+        update_rollups()
+
+        row = DailyRollup.objects.get(status=Parcel.Status.AT_PICKUP)
+        self.assertEqual(row.pickup_point, point)
+        self.assertEqual((row.transit_count, row.transit_seconds_sum), (1, 3 * 86400))
+        self.assertIsNone(DailyRollup.objects.get(status=Parcel.Status.FROM_CN).pickup_point)
+
+    def test_watermark_adds_only_new_rows(self):
+        self._parcel("TRACK0001")
+        first = update_rollups(batch_size=2)
+        self.assertEqual((first["rows"], first["batches"]), (3, 2))
+        self.assertEqual(update_rollups()["rows"], 0)
+
+        self._parcel("TRACK0002")
+        self.assertEqual(update_rollups()["rows"], 3)
+        self.assertEqual(_events(Parcel.Status.AT_CN), 2)
+        self.assertEqual(JobWatermark.objects.get(name=JOB_NAME).last_id, ParcelHistory.objects.latest("id").id)
+
+    def test_reset(self):
+        self._parcel("TRACK0001")
+        update_rollups()
+        reset_rollups()
+        self.assertFalse(DailyRollup.objects.exists())
+        self.assertEqual(update_rollups()["rows"], 3)
+
+    @override_settings(ROLLUP_SAFETY_SECONDS=3600)
+    def test_fresh_rows_wait_for_safety_window(self):
+        self._parcel("TRACK0001")
+        self.assertEqual(update_rollups()["rows"], 0)
+        self.assertFalse(DailyRollup.objects.exists())
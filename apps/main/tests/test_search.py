@@ -0,0 +1,64 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from apps.main.models import CabinetProfile, Parcel
+from apps.main.search import _has_fts_table, search_staff
+
+
+class SearchStaffTests(TestCase):
+    """
+    На SQLite поиск идёт по FTS5-таблице — её держат в актуальном виде триггеры из 0013.
+    """
+
+    def setUp(self):
+        self.assertTrue(_has_fts_table(connection))
+        self.user = get_user_model().objects.create_user(username="+996700123456")
+        self.profile = CabinetProfile.objects.create(
+            user=self.user, full_name="Асанов Бакыт", phone="+996700123456"
+        )
+
+    def _tracks(self, query):
+        return [p["track_number"] for p in search_staff(query)["parcels"]]
+
+    def _names(self, query):
+        return [p["full_name"] for p in search_staff(query)["profiles"]]
+
+    def test_created_parcel_is_found_best_match_first(self):
+        Parcel.objects.create(track_number="YT1234567890", user=self.user)
+        Parcel.objects.create(track_number="XYT123456789")
+        self.assertEqual(self._tracks("yt123 4567"), ["YT1234567890", "XYT123456789"])
+
+        result = search_staff("YT1234567890")["parcels"][0]
+        self.assertEqual(result["owner"], "+996700123456")
+
+    def test_renamed_parcel_is_found_by_new_track_only(self):
+        parcel = Parcel.objects.create(track_number="OLDAAA111")
+        parcel.track_number = "NEWBBB222"
+        parcel.save(update_fields=["track_number"])
+        self.assertEqual(self._tracks("OLDAAA"), [])
+        self.assertEqual(self._tracks("NEWBBB"), ["NEWBBB222"])
+
+    def test_deleted_parcel_is_not_found(self):
+        Parcel.objects.create(track_number="DEL000333").delete()
+        self.assertEqual(self._tracks("DEL000"), [])
+
+    def test_profile_found_by_name_and_phone(self):
+        self.assertEqual(self._names("асанов"), ["Асанов Бакыт"])
+        self.assertEqual(self._names("700 123"), ["Асанов Бакыт"])
+
+    def test_renamed_profile_is_reindexed(self):
+        self.profile.full_name = "Токтогулов Нурлан"
+        self.profile.phone = "+996555987654"
+        self.profile.save(update_fields=["full_name", "phone"])
+        self.assertEqual(self._names("асанов"), [])
+        self.assertEqual(self._names("токтогулов"), ["Токтогулов Нурлан"])
+        self.assertEqual(self._names("987654"), ["Токтогулов Нурлан"])
+
+    def test_deleted_profile_is_not_found(self):
+        self.profile.delete()
+        self.assertEqual(self._names("асанов"), [])
+
+    def test_short_query_returns_nothing(self):
+        Parcel.objects.create(track_number="AB1")
+        self.assertEqual(search_staff("ab"), {"parcels": [], "profiles": []})
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from apps.main.shm_cache import SharedMemoryCache, _digest, _Store
+
+
+class SharedMemoryCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.shm")
+        # один набор на 4 слота — вытеснение видно сразу
+        self.cache = SharedMemoryCache(self.path, {"OPTIONS": {"SLOTS": 4, "SLOT_SIZE": 128, "WAYS": 4}})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_set_get_delete(self):
+        self.cache.set("a", {"x": 1})
+        self.assertEqual(self.cache.get("a"), {"x": 1})
+        self.assertTrue(self.cache.has_key("a"))
+        self.assertTrue(self.cache.delete("a"))
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_expiry(self):
+        now = time.time()
+        with mock.patch("time.time", return_value=now):
+            self.cache.set("a", 1, timeout=10)
+        with mock.patch("time.time", return_value=now + 5):
+            self.assertEqual(self.cache.get("a"), 1)
+        with mock.patch("time.time", return_value=now + 11):
+            self.assertIsNone(self.cache.get("a"))
+
+    def test_oversized_value_is_not_cached(self):
+        self.cache.set("a", "small")
+        self.cache.set("a", "x" * 500)
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_add_and_incr(self):
+        self.assertTrue(self.cache.add("n", 1))
+        self.assertFalse(self.cache.add("n", 5))
+        self.assertEqual(self.cache.incr("n", 2), 3)
+        self.assertEqual(self.cache.get("n"), 3)
+        with self.assertRaises(ValueError):
+            self.cache.incr("missing")
+
+    def test_clock_eviction_keeps_recently_read_entry(self):
+        for key in "abcd":
+            self.cache.set(key, key)
+        # набор полон: первый проход стрелки сбрасывает биты обращения, вытесняется a
+        self.cache.set("e", "e")
+        self.assertIsNone(self.cache.get("a"))
+        # b прочитан — стрелка его пропустит и вытеснит c
+        self.assertEqual(self.cache.get("b"), "b")
+        self.cache.set("f", "f")
+        self.assertEqual(self.cache.get("b"), "b")
+        self.assertIsNone(self.cache.get("c"))
+        for key in "def":
+            self.assertEqual(self.cache.get(key), key)
+
+    def test_expired_slot_is_reused_before_eviction(self):
+        now = time.time()
+        with mock.patch("time.time", return_value=now):
+            self.cache.set("old", 0, timeout=1)
+            for key in "abc":
+                self.cache.set(key, key)
+        with mock.patch("time.time", return_value=now + 2):
+            self.cache.set("d", "d")
+            for key in "abcd":
+                self.assertEqual(self.cache.get(key), key)
+
+    def test_other_process_mapping_sees_writes(self):
+        # отдельный _Store на тот же файл — как у другого воркера
+        other = _Store(self.path, 4, 128, 4)
+        self.cache.set("a", "shared")
+        self.assertIsNotNone(other.get(_digest(self.cache.make_and_validate_key("a"))))
+        other.clear()
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_geometry_change_uses_separate_file(self):
+        self.cache.set("a", 1)
+        digest = _digest(self.cache.make_and_validate_key("a"))
+        # воркер с другими OPTIONS получает свой файл, старые воркеры читают дальше
+        bigger = _Store(self.path, 8, 128, 4)
+        self.assertIsNone(bigger.get(digest))
+        self.assertEqual(os.path.basename(bigger.path), "cache.8x128x4.shm")
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertEqual(
+            sorted(os.listdir(self.tmp.name)), ["cache.4x128x4.shm", "cache.8x128x4.shm"]
+        )
+
+    def test_foreign_header_is_replaced_not_truncated(self):
+        self.cache.set("a", 1)
+        old = self.cache._store
+        inode = os.stat(old.path).st_ino
+        with open(old.path, "r+b") as f:
+            f.write(b"KGSHM000")
+
+        fresh = _Store(self.path, 4, 128, 4)
+
+        self.assertNotEqual(os.stat(fresh.path).st_ino, inode)
+        self.assertIsNone(fresh.get(_digest(self.cache.make_and_validate_key("a"))))
+        # отображение старого файла цело — без SIGBUS
+        self.assertEqual(self.cache.get("a"), 1)
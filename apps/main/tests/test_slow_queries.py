@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from apps.main import slow_queries
+
+SQL = "SELECT id FROM main_parcel WHERE id IN (%s, %s, %s)"
+
+
+def _slow_execute(delay):
+    def execute(sql, params, many, context):
+        time.sleep(delay)
+        return "result"
+
+    return execute
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=20, SLOW_QUERY_EXPLAIN_INTERVAL=300)
+@mock.patch.object(slow_queries, "_ensure_handler", lambda: None)
+class SlowQueryHookTests(TestCase):
+    def setUp(self):
+        slow_queries._explained_at.clear()
+
+    def _run(self, delay, sql=SQL, params=(1, 2, 3)):
+        context = {"connection": connection}
+        return slow_queries._slow_query_hook(_slow_execute(delay), sql, params, False, context)
+
+    def test_query_above_threshold_is_logged_with_plan(self):
+        with self.assertLogs("apps.main.slow_queries", "INFO") as logs:
+            with slow_queries.source("command:test"):
+                self.assertEqual(self._run(0.03), "result")
+        row = json.loads(logs.records[0].getMessage())
+        self.assertGreaterEqual(row["ms"], 20)
+        self.assertEqual(row["source"], "command:test")
+        self.assertEqual(row["fingerprint"], "SELECT id FROM main_parcel WHERE id IN (...)")
+        self.assertIn("main_parcel", row["plan"])
+
+    def test_query_below_threshold_is_not_logged(self):
+        with self.assertNoLogs("apps.main.slow_queries"):
+            self._run(0)
+
+    def test_same_shape_is_explained_once_per_interval(self):
+        with self.assertLogs("apps.main.slow_queries", "INFO") as logs:
+            self._run(0.03)
+            self._run(0.03, sql="SELECT id FROM main_parcel WHERE id IN (%s)", params=(1,))
+        first, second = (json.loads(r.getMessage()) for r in logs.records)
+        self.assertEqual(first["fingerprint"], second["fingerprint"])
+        self.assertIsNotNone(first["plan"])
+        self.assertIsNone(second["plan"])
+
+
+class SlowQueryReportTests(TestCase):
+    def test_groups_by_fingerprint_and_ranks_by_total(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "slow.jsonl")
+        rows = [
+            {"fingerprint": "SELECT a", "sql": "SELECT a", "ms": 30.0, "source": "view:x", "plan": None},
+            {"fingerprint": "SELECT b", "sql": "SELECT b", "ms": 50.0, "source": "view:y", "plan": "SCAN b"},
+            {"fingerprint": "SELECT a", "sql": "SELECT a", "ms": 40.0, "source": "view:x", "plan": None},
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(r) + "\n" for r in rows)
+
+        out = StringIO()
+        call_command("slow_query_report", log=path, plans=True, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertIn("#1 count=2 total=70ms", lines[0])
+        self.assertEqual(lines[1], "   sources: view:x×2")
+        self.assertIn("#2 count=1 total=50ms", lines[3])
+        self.assertEqual(lines[-1], "   | SCAN b")
@@ -0,0 +1,37 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from apps.main.models import CabinetProfile, Parcel, ParcelHistory
+
+
+class GenerateSyntheticDataTests(TestCase):
+    def _generate(self, **options):
+        call_command(
+            "generate_synthetic_data",
+            users=5,
+            employees=1,
+            pickup_points=2,
+            parcels=40,
+            seed=1,
+            stdout=StringIO(),
+            **options,
+        )
+
+    def test_arrived_parcels_have_pickup_point(self):
+        self._generate(mix="waiting=1,at_cn=1,at_pickup=1,received=1", unowned_share=0.3)
+        owner_points = dict(CabinetProfile.objects.values_list("user_id", "pickup_point_id"))
+
+        arrived = Parcel.objects.filter(status__gte=Parcel.Status.AT_PICKUP)
+        self.assertTrue(arrived.filter(user__isnull=False).exists())
+        self.assertTrue(arrived.filter(user__isnull=True).exists())
+        for parcel in arrived:
+            self.assertIsNotNone(parcel.pickup_point_id)
+            if parcel.user_id:
+                self.assertEqual(parcel.pickup_point_id, owner_points[parcel.user_id])
+            # сообщение о прибытии — про тот же ПВЗ
+            message = ParcelHistory.objects.get(parcel=parcel, status=Parcel.Status.AT_PICKUP).message
+            self.assertIn(parcel.pickup_point.name, message)
+
+        self.assertFalse(Parcel.objects.filter(status__lt=Parcel.Status.AT_PICKUP, pickup_point__isnull=False).exists())
@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import SimpleTestCase, override_settings
+
+from apps.main import tracing
+
+
+@tracing.traced("helper.work")
+def _work():
+    with tracing.span("helper.inner", size=3):
+        return 42
+
+
+class TracingTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "traces", "traces.json")
+        override = override_settings(TRACE_FILE=self.path, TRACE_SAMPLE_RATE=0.0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _events(self):
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], "[")
+        return {e["name"]: e for e in (json.loads(line.rstrip(",")) for line in lines[1:])}
+
+    def test_nested_spans_are_written_with_parent_ids(self):
+        with tracing.trace("http GET", force=True, path="/x/"):
+            with tracing.span("scan.lock"):
+                self.assertEqual(_work(), 42)
+
+        events = self._events()
+        self.assertEqual(set(events), {"http GET", "scan.lock", "helper.work", "helper.inner"})
+        root = events["http GET"]["args"]
+        self.assertIsNone(root["parent_id"])
+        self.assertEqual(root["path"], "/x/")
+        self.assertEqual(events["scan.lock"]["args"]["parent_id"], root["span_id"])
+        self.assertEqual(events["helper.work"]["args"]["parent_id"], events["scan.lock"]["args"]["span_id"])
+        self.assertEqual(events["helper.inner"]["args"]["parent_id"], events["helper.work"]["args"]["span_id"])
+        self.assertEqual(events["helper.inner"]["args"]["size"], 3)
+        self.assertEqual({e["args"]["trace_id"] for e in events.values()}, {root["trace_id"]})
+        self.assertEqual({e["ph"] for e in events.values()}, {"X"})
+        self.assertEqual(events["scan.lock"]["cat"], "scan")
+
+    def test_span_from_sync_to_async_thread_joins_request_trace(self):
+        async def view():
+            with tracing.trace("http GET", force=True):
+                await sync_to_async(_work)()
+
+        async_to_sync(view)()
+        events = self._events()
+        self.assertEqual(events["helper.work"]["args"]["parent_id"], events["http GET"]["args"]["span_id"])
+        self.assertNotEqual(events["helper.work"]["tid"], events["http GET"]["tid"])
+
+    def test_error_is_recorded_on_span(self):
+        with self.assertRaises(ValueError):
+            with tracing.trace("job", force=True):
+                with tracing.span("job.step"):
+                    raise ValueError
+        events = self._events()
+        self.assertEqual(events["job.step"]["args"]["error"], "ValueError")
+        self.assertEqual(events["job"]["args"]["error"], "ValueError")
+
+    def test_unsampled_trace_writes_nothing(self):
+        with tracing.trace("http GET") as root:
+            self.assertIsNone(root)
+            with tracing.span("scan.lock") as s:
+                self.assertIsNone(s)
+            self.assertEqual(_work(), 42)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_second_trace_appends_and_large_file_rotates(self):
+        with tracing.trace("first", force=True):
+            pass
+        with tracing.trace("second", force=True):
+            pass
+        self.assertEqual(set(self._events()), {"first", "second"})
+
+        with override_settings(TRACE_FILE_MAX_BYTES=1):
+            with tracing.trace("third", force=True):
+                pass
+        self.assertEqual(set(self._events()), {"third"})
+        self.assertTrue(os.path.exists(f"{self.path}.1"))
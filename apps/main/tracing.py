@@ -0,0 +1,186 @@
+"""
+Лёгкая трассировка: вложенные span-ы через context manager, выборочный
+экспорт в локальный файл.
+
+    with tracing.trace("http GET"):          # корень: решение о семплировании
+        with tracing.span("scan.lock"):      # дочерний span (no-op вне трассы)
+            ...
+
+Доля трасс — TRACE_SAMPLE_RATE (0 — выключено, span() почти бесплатен).
+Готовая трасса целиком дописывается в TRACE_FILE в формате Chrome Trace
+Event (JSON Array): первая строка «[», дальше по событию «X» на строку,
+закрывающая «]» не нужна. Файл открывается в Perfetto (ui.perfetto.dev)
+и chrome://tracing. Контекст — contextvars, поэтому span-ы из
+sync_to_async-потоков попадают в трассу своего запроса.
+"""
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+# Текущий span; _UNSAMPLED — трасса есть, но не попала в выборку.
+_current = ContextVar("main_trace_span", default=None)
+_UNSAMPLED = object()
+
+_write_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("name", "trace", "span_id", "parent_id", "attrs", "start_us", "t0", "duration_us", "tid")
+
+    def __init__(self, name: str, trace: "Trace", parent_id, attrs: dict):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start_us = time.time_ns() // 1000
+        self.t0 = time.perf_counter()
+        self.duration_us = 0
+        self.tid = threading.get_ident()
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def _finish(self) -> None:
+        self.duration_us = int((time.perf_counter() - self.t0) * 1_000_000)
+
+    def to_event(self) -> dict:
+        return {
+            "name": self.name,
+            "cat": self.name.split(".", 1)[0].split(" ", 1)[0],
+            "ph": "X",
+            "ts": self.start_us,
+            "dur": self.duration_us,
+            "pid": os.getpid(),
+            "tid": self.tid,
+            "args": {
+                "trace_id": self.trace.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                **{k: _jsonable(v) for k, v in self.attrs.items()},
+            },
+        }
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.spans = []  # list.append потокобезопасен
+
+
+def _jsonable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _sample_rate() -> float:
+    return float(getattr(settings, "TRACE_SAMPLE_RATE", 0.0))
+
+
+@contextmanager
+def _run_span(span: Span):
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.attrs["error"] = type(exc).__name__
+        raise
+    finally:
+        span._finish()
+        _current.reset(token)
+        span.trace.spans.append(span)
+
+
+@contextmanager
+def trace(name: str, force: bool = False, **attrs):
+    """
+    Корневой span. Семплируется с вероятностью TRACE_SAMPLE_RATE (force — всегда).
+    Внутри уже идущей трассы ведёт себя как span().
+    """
+    parent = _current.get()
+    if parent is not None:
+        with span(name, **attrs) as s:
+            yield s
+        return
+
+    if not force and random.random() >= _sample_rate():
+        token = _current.set(_UNSAMPLED)
+        try:
+            yield None
+        finally:
+            _current.reset(token)
+        return
+
+    root = Span(name, Trace(), None, attrs)
+    try:
+        with _run_span(root):
+            yield root
+    finally:
+        _export(root.trace)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Дочерний span текущей трассы; вне трассы или вне выборки — no-op (отдаёт None).
+    """
+    parent = _current.get()
+    if parent is None or parent is _UNSAMPLED:
+        yield None
+        return
+    with _run_span(Span(name, parent.trace, parent.span_id, attrs)) as s:
+        yield s
+
+
+def traced(name: str | None = None):
+    """
+    Декоратор для sync-функций: тело выполняется в span(name or __qualname__).
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() in (None, _UNSAMPLED):
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _export(tr: Trace) -> None:
+    path = getattr(settings, "TRACE_FILE", None)
+    if not path or not tr.spans:
+        return
+    path = str(path)
+    chunk = "".join(json.dumps(s.to_event(), ensure_ascii=False) + ",\n" for s in tr.spans)
+    max_bytes = int(getattr(settings, "TRACE_FILE_MAX_BYTES", 50 * 1024 * 1024))
+    try:
+        with _write_lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) > max_bytes:
+                os.replace(path, f"{path}.1")
+            try:
+                # кто создал файл — тот и пишет «[»; остальные только дописывают
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+                chunk = "[\n" + chunk
+            except FileExistsError:
+                fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, chunk.encode("utf-8"))
+            finally:
+                os.close(fd)
+    except OSError:
+        pass
@@ -22,6 +22,19 @@ urlpatterns = [
         name="parcel_history",
     ),
     path("staff/parcels/", views.staff_parcels_view, name="staff_parcels"),
+    path("staff/manifest/", views.staff_manifest_view, name="staff_manifest"),
+    path("staff/dashboard/", views.staff_dashboard_view, name="staff_dashboard"),
+    path("staff/api/search/", views.staff_search_view, name="staff_search"),
+    path("staff/api/history-search/", views.staff_history_search_view, name="staff_history_search"),
+    path("staff/api/inventory/", views.staff_inventory_view, name="staff_inventory"),
+    path("staff/api/ready-queue/", views.staff_ready_queue_view, name="staff_ready_queue"),
     path("cabinet/api/track/public/", views.track_public_lookup_view, name="track_public_lookup"),
     path("cabinet/api/parcels/<int:pk>/history-public/", views.parcel_history_public_view, name="parcel_history_public"),
+
+    # API интеграторов
+    path("api/feed/events/", views.change_feed_view, name="change_feed"),
+
+    # Служебное
+    path("metrics", views.metrics_view, name="metrics"),
+    path("health/flows/", views.flow_health_view, name="flow_health"),
 ]
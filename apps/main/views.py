@@ -1,21 +1,47 @@
-from datetime import timezone as dt_timezone
+import logging
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404, redirect, render
+from django.contrib.auth.views import redirect_to_login
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import aget_object_or_404, redirect, render
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
-
-from .models import CabinetProfile, PickupPoint, Parcel, track_validator
+from django.utils.crypto import constant_time_compare
+
+from .counters import get_status_counts, status_changed
+from .db_router import replica_reads
+from .eta import STAGES as ETA_STAGES, parcel_eta
+from .manifest import ManifestResult, import_manifest, text_stream
+from .metrics import collect, render_prometheus
+from .models import ApiToken, CabinetProfile, Parcel, ParcelHistory, track_validator
+from .outbox import authenticate_token, read_feed
+from .refcache import aget_transit_stats, get_active_pickup_point, get_active_pickup_points
+from .rollups import dashboard_data
+from .search import MIN_QUERY_LENGTH, search_history, search_staff
+from .tracing import span
 from apps.main.auto_status import (
     _process_staff_scan,
+    _process_bag_scan,
+    _advance_all_flows,
     _advance_cn_flow,
+    _cn_flow_lag_seconds,
     _advance_local_flow,
+    _cn_flow_due,
+    _get_second_scan_delay,
 )
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
 
 def _normalize_phone(phone: str) -> str:
     """
@@ -86,6 +112,26 @@ def _dt_str(dt) -> str:
     return dt_utc.isoformat().replace("+00:00", "Z")
 
 
+def _history_event(h, is_latest: bool) -> dict:
+    dt = getattr(h, "occurred_at", None) or h.created_at
+    return {
+        "status_display": h.get_status_display(),
+        "message": (h.message or ""),
+        "datetime": _dt_str(dt),
+        "is_latest": is_latest,
+    }
+
+
+def _current_state_event(parcel: Parcel) -> dict:
+    created = getattr(parcel, "created_at", None) or timezone.now()
+    return {
+        "status_display": parcel.get_status_display(),
+        "message": "",
+        "datetime": _dt_str(created),
+        "is_latest": True,
+    }
+
+
 def _serialize_history(parcel: Parcel):
     """
     Возвращает список событий истории в нужном формате (последнее сверху).
@@ -96,40 +142,117 @@ def _serialize_history(parcel: Parcel):
 
     if rel is not None:
         for idx, h in enumerate(rel.all().order_by("-occurred_at", "-id")):
-            dt = getattr(h, "occurred_at", None) or h.created_at
-            events.append(
-                {
-                    "status_display": h.get_status_display(),
-                    "message": (h.message or ""),
-                    "datetime": _dt_str(dt),
-                    "is_latest": idx == 0,
-                }
-            )
+            events.append(_history_event(h, idx == 0))
 
     if not events:
-        created = getattr(parcel, "created_at", None) or timezone.now()
-        events.append(
-            {
-                "status_display": parcel.get_status_display(),
-                "message": "",
-                "datetime": _dt_str(created),
-                "is_latest": True,
-            }
-        )
+        events.append(_current_state_event(parcel))
+
+    return events
+
+
+async def _aserialize_history(parcel: Parcel):
+    """
+    То же, что _serialize_history, но на async ORM.
+    """
+    events = []
+    qs = ParcelHistory.objects.filter(parcel_id=parcel.pk).order_by("-occurred_at", "-id")
+    async for h in qs:
+        events.append(_history_event(h, not events))
+
+    if not events:
+        events.append(_current_state_event(parcel))
 
     return events
 
 
+async def _aadvance_flows(parcel: Parcel, user_id, now, owner=None) -> None:
+    """
+    Догоняет авто-этапы перед показом посылки из async-view.
+    В sync-поток уходим, только если есть что записать.
+    owner — владелец, если он уже загружен вместе с профилем (request.auser()).
+    """
+    if not _cn_flow_due(parcel, now):
+        return
+
+    pickup = None
+    if owner is not None and User.cabinet_profile.is_cached(owner):
+        pickup = getattr(_get_profile(owner), "pickup_point", None)
+    elif user_id:
+        profile = await (
+            CabinetProfile.objects.select_related("pickup_point").filter(user_id=user_id).afirst()
+        )
+        pickup = getattr(profile, "pickup_point", None)
+
+    await sync_to_async(_advance_all_flows)(parcel, pickup, now)
+
+
+def _alogin_required(view_func):
+    """
+    login_required для async-view: пользователь грузится через request.auser(),
+    без похода в sync-поток на каждую проверку.
+    """
+
+    @wraps(view_func)
+    async def _wrapped(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+
+    return _wrapped
+
+
+async def _aparcel_eta(parcel: Parcel):
+    """
+    Окно прибытия для посылки в пути (см. eta.py) или None. Статистика —
+    из кэша процесса, без запроса к БД.
+    """
+    if parcel.status not in ETA_STAGES:
+        return None
+    stats = await aget_transit_stats()
+    return parcel_eta(stats, parcel.status, parcel.auto_flow_started_at, parcel.destination_id)
+
+
+async def _aparcel_history_response(request, pk: int) -> JsonResponse:
+    user = await request.auser()
+    parcel = await aget_object_or_404(Parcel, pk=pk, user_id=user.pk)
+
+    now = timezone.now().replace(microsecond=0)
+    await _aadvance_flows(parcel, user.pk, now, owner=user)
+
+    return JsonResponse(
+        {
+            "track_number": parcel.track_number,
+            "events": await _aserialize_history(parcel),
+            "eta": await _aparcel_eta(parcel),
+        }
+    )
+
+
+def _get_profile(user):
+    """
+    CabinetProfile пользователя или None.
+    Профиль и пункт выдачи уже подгружены CabinetModelBackend — без доп. запросов.
+    """
+    return getattr(user, "cabinet_profile", None)
+
+
+def _is_employee(user) -> bool:
+    profile = _get_profile(user)
+    return bool(profile and profile.is_employee)
+
+
+def _home_redirect(user):
+    return redirect("staff_parcels" if _is_employee(user) else "cabinet_home")
+
+
 # ================== РЕГИСТРАЦИЯ ==================
 
 
 @require_http_methods(["GET", "POST"])
 def register_view(request):
     if request.user.is_authenticated:
-        profile = getattr(request.user, "cabinet_profile", None)
-        if profile and profile.is_employee:
-            return redirect("staff_parcels")
-        return redirect("cabinet_home")
+        return _home_redirect(request.user)
 
     context = {"form_data": {}, "errors": {}}
 
@@ -184,10 +307,7 @@ def register_view(request):
 @require_http_methods(["GET", "POST"])
 def login_view(request):
     if request.user.is_authenticated:
-        profile = getattr(request.user, "cabinet_profile", None)
-        if profile and profile.is_employee:
-            return redirect("staff_parcels")
-        return redirect("cabinet_home")
+        return _home_redirect(request.user)
 
     context = {"errors": {}, "form_data": {}}
 
@@ -216,11 +336,7 @@ def login_view(request):
         return render(request, "login.html", context)
 
     login(request, user)
-
-    profile = getattr(user, "cabinet_profile", None)
-    if profile and profile.is_employee:
-        return redirect("staff_parcels")
-    return redirect("cabinet_home")
+    return _home_redirect(user)
 
 
 def logout_view(request):
@@ -233,8 +349,9 @@ def logout_view(request):
 
 @login_required
 @require_http_methods(["GET", "POST"])
+@replica_reads
 def cabinet_home(request):
-    profile = getattr(request.user, "cabinet_profile", None)
+    profile = _get_profile(request.user)
 
     if profile and profile.is_employee:
         return redirect("staff_parcels")
@@ -281,11 +398,7 @@ def cabinet_home(request):
             for p in user_parcels_qs:
                 _advance_cn_flow(p, now)
                 _advance_local_flow(p, pickup, now)
-            status_counts = {1: 0, 2: 0, 3: 0, 4: 0}
-            for row in user_parcels_qs.values("status").annotate(c=Count("id")):
-                st = row["status"]
-                if st in status_counts:
-                    status_counts[st] = row["c"]
+            status_counts = get_status_counts(request.user.pk)
             context["status_count_1"] = status_counts[1]
             context["status_count_2"] = status_counts[2]
             context["status_count_3"] = status_counts[3]
@@ -295,13 +408,21 @@ def cabinet_home(request):
         cleaned = cleaned[:5]
 
         for track in cleaned:
-            parcel, _ = Parcel.objects.get_or_create(
+            Parcel.objects.get_or_create(
                 track_number=track,
                 defaults={"status": Parcel.Status.WAITING_CN},
             )
-            if parcel.user_id is None:
-                parcel.user = request.user
-                parcel.save(update_fields=["user"])
+            with transaction.atomic():
+                # под блокировкой: иначе два клиента заберут один трек, а скан
+                # между чтением и записью оставит счётчику устаревший статус
+                parcel = Parcel.objects.select_for_update().only("id", "user_id", "status").get(
+                    track_number=track
+                )
+                if parcel.user_id is None:
+                    parcel.user = request.user
+                    parcel.destination_id = getattr(profile, "pickup_point_id", None)
+                    parcel.save(update_fields=["user", "destination"])
+                    status_changed(request.user.pk, None, parcel.status)
 
         return redirect("cabinet_home")
 
@@ -311,16 +432,14 @@ def cabinet_home(request):
     user_parcels_qs = Parcel.objects.filter(user=request.user)
 
     # авто-обновление статусов перед показом
-    for p in user_parcels_qs:
-        _advance_cn_flow(p, now)
-        _advance_local_flow(p, pickup, now)
+    with span("cabinet.advance_flows"):
+        for p in user_parcels_qs:
+            _advance_cn_flow(p, now)
+            _advance_local_flow(p, pickup, now)
 
-    # статистика
-    status_counts = {1: 0, 2: 0, 3: 0, 4: 0}
-    for row in user_parcels_qs.values("status").annotate(c=Count("id")):
-        st = row["status"]
-        if st in status_counts:
-            status_counts[st] = row["c"]
+    # статистика: счётчики ведутся при каждой смене статуса (counters.py)
+    with span("cabinet.status_counts"):
+        status_counts = get_status_counts(request.user.pk)
 
     context = {
         "user_profile": profile,
@@ -330,7 +449,8 @@ def cabinet_home(request):
         "status_count_3": status_counts[3],
         "status_count_4": status_counts[4],
     }
-    return render(request, "cabinet_home.html", context)
+    with span("render", template="cabinet_home.html"):
+        return render(request, "cabinet_home.html", context)
 
 
 # ================== КАБИНЕТ: ПРОФИЛЬ ==================
@@ -338,7 +458,7 @@ def cabinet_home(request):
 
 @login_required
 def cabinet_profile(request):
-    profile = getattr(request.user, "cabinet_profile", None)
+    profile = _get_profile(request.user)
     return render(request, "cabinet_profile.html", {"user_profile": profile})
 
 
@@ -353,7 +473,7 @@ def cabinet_profile_edit(request):
         },
     )
 
-    pickup_points = PickupPoint.objects.filter(is_active=True).order_by("name")
+    pickup_points = get_active_pickup_points()
 
     if request.method == "GET":
         return render(
@@ -380,9 +500,8 @@ def cabinet_profile_edit(request):
             errors["phone"] = "Пользователь с таким телефоном уже зарегистрирован."
 
     if pickup_point_id:
-        try:
-            pickup_point_obj = PickupPoint.objects.get(pk=pickup_point_id, is_active=True)
-        except PickupPoint.DoesNotExist:
+        pickup_point_obj = get_active_pickup_point(pickup_point_id)
+        if pickup_point_obj is None:
             errors["pickup_point"] = "Неверный пункт выдачи."
 
     if errors:
@@ -419,15 +538,30 @@ def cabinet_profile_edit(request):
 @login_required
 @require_http_methods(["GET", "POST"])
 def staff_parcels_view(request):
-    profile = getattr(request.user, "cabinet_profile", None)
+    profile = _get_profile(request.user)
     if not profile or not profile.is_employee:
         return redirect("cabinet_home")
 
     error_message = ""
     success_message = ""
+    bag_code = ""
 
-    if request.method == "POST":
+    if request.method == "POST" and request.POST.get("action") == "bag_scan":
+        # скан мешка: все посылки внутри одним пакетом
+        bag_raw = request.POST.get("bag_scan", "").strip()
+        if not bag_raw:
+            error_message = "Укажите код мешка."
+        else:
+            try:
+                success_message = _process_bag_scan(request.user, bag_raw)
+            except ValueError as e:
+                error_message = str(e)
+            except Exception:
+                error_message = "Ошибка обработки мешка."
+
+    elif request.method == "POST":
         track_raw = request.POST.get("track_number", "").strip()
+        bag_code = request.POST.get("bag_code", "").strip()
         
         if not track_raw:
             error_message = "Укажите трек-номер."
@@ -439,45 +573,378 @@ def staff_parcels_view(request):
             elif len(track_upper) > 18:
                 error_message = f"Трек-номер слишком длинный (максимум 18 символов). Введено: {len(track_upper)}."
             else:
-                track = _normalize_track(track_raw)
+                with span("scan.normalize"):
+                    track = _normalize_track(track_raw)
                 
                 if not track:
                     error_message = "Трек-номер имеет недопустимый формат."
                 else:
                     try:
-                        success_message = _process_staff_scan(request.user, track)
+                        success_message = _process_staff_scan(request.user, track, bag_code=bag_code)
                     except ValueError as e:
                         error_message = str(e)
                     except Exception:
                         error_message = "Ошибка обработки трек-номера."
 
     recent_parcels = Parcel.objects.order_by("-created_at")[:30]
-    return render(
-        request,
-        "staff_parcels.html",
+    with span("render", template="staff_parcels.html"):
+        return render(
+            request,
+            "staff_parcels.html",
+            {
+                "error_message": error_message,
+                "success_message": success_message,
+                "bag_code": bag_code,
+                "recent_parcels": recent_parcels,
+            },
+        )
+
+
+MANIFEST_EXTENSIONS = (".csv", ".tsv", ".txt")
+
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def staff_manifest_view(request):
+    """
+    Загрузка манифеста (CSV/TSV): все треки из файла получают 1-й скан пачками.
+    Файл читается потоком (Django держит большие загрузки во временном файле),
+    на странице — итог и первые отклонённые строки. Если импорт упал,
+    показываем, сколько пачек успело сохраниться.
+    """
+    profile = _get_profile(request.user)
+    if not profile or not profile.is_employee:
+        return redirect("cabinet_home")
+
+    error_message = ""
+    result = None
+
+    if request.method == "POST":
+        upload = request.FILES.get("manifest")
+        if not upload:
+            error_message = "Выберите файл манифеста."
+        elif not upload.name.lower().endswith(MANIFEST_EXTENSIONS):
+            error_message = "Поддерживаются только файлы .csv, .tsv и .txt."
+        else:
+            result = ManifestResult()
+            try:
+                with span("manifest.import", size=upload.size):
+                    import_manifest(text_stream(upload.file), result=result)
+            except Exception:
+                logger.exception("manifest import failed: %s after %d rows", upload.name, result.rows)
+                # принятые пачки уже закоммичены; повторная загрузка их пропустит
+                error_message = (
+                    f"Импорт прерван: сохранено {result.accepted} треков из первых {result.rows} строк. "
+                    "Загрузите файл ещё раз — уже принятые треки будут пропущены."
+                )
+
+    with span("render", template="staff_manifest.html"):
+        return render(
+            request,
+            "staff_manifest.html",
+            {
+                "error_message": error_message,
+                "result": result,
+            },
+        )
+
+
+@login_required
+@require_http_methods(["GET"])
+@replica_reads
+def staff_dashboard_view(request):
+    """
+    Дашборд для руководства: события по дням и статусам, прибытия по ПВЗ,
+    среднее время Китай -> ПВЗ. Только из DailyRollup (см. rollups.py).
+    """
+    profile = _get_profile(request.user)
+    if not profile or not profile.is_employee:
+        return redirect("cabinet_home")
+
+    try:
+        days = max(1, min(int(request.GET.get("days") or 14), 366))
+    except ValueError:
+        days = 14
+
+    with span("dashboard.query", days=days):
+        data = dashboard_data(days)
+
+    with span("render", template="staff_dashboard.html"):
+        return render(
+            request,
+            "staff_dashboard.html",
+            {
+                **data,
+                "period_days": days,
+                "status_labels": Parcel.Status.labels,
+            },
+        )
+
+
+def _employee_required(view_func):
+    """
+    Для JSON-эндпоинтов сотрудника: 401 без входа, 403 не-сотруднику
+    (в отличие от staff_parcels_view, без редиректов).
+    """
+
+    @wraps(view_func)
+    def _wrapped(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({"ok": False, "error": "auth_required"}, status=401)
+        profile = _get_profile(request.user)
+        if not profile or not profile.is_employee:
+            return JsonResponse({"ok": False, "error": "forbidden"}, status=403)
+        return view_func(request, *args, **kwargs)
+
+    return _wrapped
+
+
+@_employee_required
+@require_http_methods(["GET"])
+@replica_reads
+def staff_search_view(request):
+    """
+    Поиск по обрывку трека, телефона или ФИО (индексы — см. search.py).
+    """
+    query = (request.GET.get("q") or "").strip()
+    try:
+        limit = max(1, min(int(request.GET.get("limit") or 20), 100))
+    except ValueError:
+        limit = 20
+
+    if len(query.replace(" ", "")) < MIN_QUERY_LENGTH:
+        return JsonResponse(
+            {"ok": False, "error": "query_too_short", "min_length": MIN_QUERY_LENGTH},
+            status=400,
+        )
+
+    with span("search.staff", q_len=len(query)):
+        results = search_staff(query, limit=limit)
+    return JsonResponse({"ok": True, "query": query, **results})
+
+
+def _parse_day_bounds(value: str):
+    """
+    "YYYY-MM-DD" -> (начало суток, начало следующих) в текущей таймзоне; None при ошибке.
+    """
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+    start = timezone.make_aware(day)
+    return start, start + timedelta(days=1)
+
+
+@_employee_required
+@require_http_methods(["GET"])
+@replica_reads
+def staff_history_search_view(request):
+    """
+    Полнотекстовый поиск по сообщениям истории, например
+    ?q=Бишкек ПВЗ&status=3&date=2026-01-15 — что прибыло в этот ПВЗ в этот день.
+    Параметры: q, status, date | date_from/date_to (включительно), before, limit.
+    """
+    query = (request.GET.get("q") or "").strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return JsonResponse(
+            {"ok": False, "error": "query_too_short", "min_length": MIN_QUERY_LENGTH},
+            status=400,
+        )
+
+    status = request.GET.get("status")
+    if status is not None and status not in {str(v) for v in Parcel.Status.values}:
+        return JsonResponse({"ok": False, "error": "bad_status"}, status=400)
+
+    since = until = None
+    day = request.GET.get("date")
+    date_from = request.GET.get("date_from") or day
+    date_to = request.GET.get("date_to") or day
+    if date_from:
+        bounds = _parse_day_bounds(date_from)
+        if bounds is None:
+            return JsonResponse({"ok": False, "error": "bad_date"}, status=400)
+        since = bounds[0]
+    if date_to:
+        bounds = _parse_day_bounds(date_to)
+        if bounds is None:
+            return JsonResponse({"ok": False, "error": "bad_date"}, status=400)
+        until = bounds[1]
+
+    before = request.GET.get("before")
+    try:
+        limit = max(1, min(int(request.GET.get("limit") or 50), 200))
+    except ValueError:
+        limit = 50
+
+    with span("search.history", q_len=len(query)):
+        results = search_history(
+            query,
+            status=int(status) if status is not None else None,
+            since=since,
+            until=until,
+            before_id=int(before) if before and before.isdigit() else None,
+            limit=limit,
+        )
+    return JsonResponse({"ok": True, "query": query, **results})
+
+
+@_employee_required
+@require_http_methods(["GET"])
+@replica_reads
+def staff_inventory_view(request):
+    """
+    Что сейчас лежит в ПВЗ: посылки AT_PICKUP пункта ?point= (по умолчанию —
+    ПВЗ сотрудника), новые сверху. Keyset по id (?before=), читается
+    индексом (pickup_point, status, id) без сортировки и OFFSET.
+    """
+    point_id = request.GET.get("point")
+    if point_id:
+        point = get_active_pickup_point(point_id)
+    else:
+        point = getattr(_get_profile(request.user), "pickup_point", None)
+    if point is None:
+        return JsonResponse({"ok": False, "error": "unknown_pickup_point"}, status=404)
+
+    before = request.GET.get("before")
+    try:
+        limit = max(1, min(int(request.GET.get("limit") or 50), 200))
+    except ValueError:
+        limit = 50
+
+    qs = Parcel.objects.filter(pickup_point=point, status=Parcel.Status.AT_PICKUP)
+    if before and before.isdigit():
+        qs = qs.filter(id__lt=int(before))
+
+    with span("inventory.query", point=point.pk):
+        rows = list(
+            qs.order_by("-id").values("id", "track_number", "user__username", "created_at")[: limit + 1]
+        )
+
+    next_before = rows[limit - 1]["id"] if len(rows) > limit else None
+    parcels = [
         {
-            "error_message": error_message,
-            "success_message": success_message,
-            "recent_parcels": recent_parcels,
-        },
+            "id": r["id"],
+            "track_number": r["track_number"],
+            "client": r["user__username"],
+            "created_at": r["created_at"].isoformat(),
+        }
+        for r in rows[:limit]
+    ]
+    return JsonResponse(
+        {
+            "ok": True,
+            "pickup_point": {"id": point.pk, "name": point.name},
+            "parcels": parcels,
+            "next_before": next_before,
+        }
     )
 
 
-# ================== ИСТОРИЯ КОНКРЕТНОЙ ПОСЫЛКИ (JSON) ==================
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
 
 
-@login_required
-def parcel_history_view(request, pk: int):
-    parcel = get_object_or_404(Parcel, pk=pk, user=request.user)
+def _parse_ready_cursor(raw: str):
+    """
+    Курсор очереди 2-го скана "<мкс от эпохи>:<id>" -> (datetime, id) или None.
+    """
+    ts, _, pk = (raw or "").partition(":")
+    if not (ts.isdigit() and pk.isdigit()):
+        return None
+    return _EPOCH + timedelta(microseconds=int(ts)), int(pk)
 
-    now = timezone.now().replace(microsecond=0)
-    profile = getattr(request.user, "cabinet_profile", None)
-    pickup = getattr(profile, "pickup_point", None)
 
-    _advance_cn_flow(parcel, now)
-    _advance_local_flow(parcel, pickup, now)
+def _ready_cursor(started_at, pk: int) -> str:
+    delta = started_at - _EPOCH
+    return f"{(delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds}:{pk}"
+
+
+@_employee_required
+@require_http_methods(["GET"])
+@replica_reads
+def staff_ready_queue_view(request):
+    """
+    Очередь на 2-й скан: посылки, у которых с 1-го скана прошло
+    STAFF_SECOND_SCAN_DELAY_HOURS, но они ещё не в ПВЗ. Сначала самые давние.
+
+    ?point= — ПВЗ назначения (Parcel.destination, по умолчанию — ПВЗ
+    сотрудника), ?point=all — все, включая посылки без владельца.
+    Keyset по (auto_flow_started_at, id), курсор ?after= из next_after;
+    читается частичным индексом parcel_second_scan_dest_idx
+    (для ?point=all — parcel_second_scan_queue_idx) без сортировки.
+    """
+    point_id = request.GET.get("point")
+    point = None
+    if point_id != "all":
+        if point_id:
+            point = get_active_pickup_point(point_id)
+        else:
+            point = getattr(_get_profile(request.user), "pickup_point", None)
+        if point is None:
+            return JsonResponse({"ok": False, "error": "unknown_pickup_point"}, status=404)
+
+    try:
+        limit = max(1, min(int(request.GET.get("limit") or 50), 200))
+    except ValueError:
+        limit = 50
+
+    delay = _get_second_scan_delay()
+    cutoff = timezone.now() - delay
+    # условие частичного индекса повторено дословно, иначе планировщик его не возьмёт
+    qs = Parcel.objects.filter(
+        auto_flow_started_at__isnull=False,
+        auto_flow_started_at__lte=cutoff,
+        status__lt=Parcel.Status.AT_PICKUP,
+    )
+    if point is not None:
+        qs = qs.filter(destination=point)
+
+    after = request.GET.get("after")
+    if after:
+        cursor = _parse_ready_cursor(after)
+        if cursor is None:
+            return JsonResponse({"ok": False, "error": "bad_cursor"}, status=400)
+        started_at, pk = cursor
+        qs = qs.filter(Q(auto_flow_started_at__gt=started_at) | Q(auto_flow_started_at=started_at, id__gt=pk))
+
+    with span("ready_queue.query", point=point.pk if point else None):
+        rows = list(
+            qs.order_by("auto_flow_started_at", "id").values(
+                "id", "track_number", "status", "auto_flow_started_at", "user__username", "bag__code"
+            )[: limit + 1]
+        )
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    parcels = [
+        {
+            "id": r["id"],
+            "track_number": r["track_number"],
+            "status": r["status"],
+            "client": r["user__username"],
+            "bag": r["bag__code"],
+            "first_scan_at": r["auto_flow_started_at"].isoformat(),
+            "ready_at": (r["auto_flow_started_at"] + delay).isoformat(),
+        }
+        for r in rows
+    ]
+    last = rows[-1] if has_more else None
+    return JsonResponse(
+        {
+            "ok": True,
+            "pickup_point": {"id": point.pk, "name": point.name} if point else None,
+            "parcels": parcels,
+            "next_after": _ready_cursor(last["auto_flow_started_at"], last["id"]) if last else None,
+        }
+    )
+
+
+# ================== ИСТОРИЯ КОНКРЕТНОЙ ПОСЫЛКИ (JSON) ==================
 
-    return JsonResponse({"track_number": parcel.track_number, "events": _serialize_history(parcel)})
+
+@_alogin_required
+@replica_reads
+async def parcel_history_view(request, pk: int):
+    return await _aparcel_history_response(request, pk)
 
 
 # ================== РЕДИРЕКТ С ГЛАВНОЙ ==================
@@ -485,10 +952,7 @@ def parcel_history_view(request, pk: int):
 
 def index_redirect(request):
     if request.user.is_authenticated:
-        profile = getattr(request.user, "cabinet_profile", None)
-        if profile and profile.is_employee:
-            return redirect("staff_parcels")
-        return redirect("cabinet_home")
+        return _home_redirect(request.user)
     return redirect("login")
 
 
@@ -496,7 +960,8 @@ def index_redirect(request):
 
 
 @require_http_methods(["GET"])
-def track_public_lookup_view(request):
+@replica_reads
+async def track_public_lookup_view(request):
     """
     ПУБЛИЧНЫЙ трекинг:
     - доступен всем
@@ -510,7 +975,8 @@ def track_public_lookup_view(request):
             status=400
         )
 
-    parcel = Parcel.objects.filter(track_number__iexact=track).first()
+    with span("lookup.query"):
+        parcel = await Parcel.objects.filter(track_number__iexact=track).afirst()
     if not parcel:
         return JsonResponse(
             {"ok": False, "error": "not_found"},
@@ -520,12 +986,11 @@ def track_public_lookup_view(request):
     now = timezone.now().replace(microsecond=0)
 
     # авто-обновление статусов
-    _advance_cn_flow(parcel, now)
+    with span("lookup.advance"):
+        await _aadvance_flows(parcel, parcel.user_id, now)
 
-    if parcel.user_id:
-        profile = getattr(parcel.user, "cabinet_profile", None)
-        pickup = getattr(profile, "pickup_point", None)
-        _advance_local_flow(parcel, pickup, now)
+    with span("lookup.serialize"):
+        events = await _aserialize_history(parcel)
 
     return JsonResponse(
         {
@@ -533,23 +998,109 @@ def track_public_lookup_view(request):
             "track_number": parcel.track_number,
             "status": parcel.status,
             "status_label": parcel.get_status_display(),
-            "events": _serialize_history(parcel),
+            "events": events,
+            "eta": await _aparcel_eta(parcel),
         }
     )
 
-@login_required
+@_alogin_required
 @require_http_methods(["GET"])
-def parcel_history_public_view(request, pk: int):
+async def parcel_history_public_view(request, pk: int):
     """
     Безопасность: нельзя смотреть чужие посылки по pk.
     """
-    parcel = get_object_or_404(Parcel, pk=pk, user=request.user)
+    return await _aparcel_history_response(request, pk)
 
-    now = timezone.now().replace(microsecond=0)
-    profile = getattr(request.user, "cabinet_profile", None)
-    pickup = getattr(profile, "pickup_point", None)
 
-    _advance_cn_flow(parcel, now)
-    _advance_local_flow(parcel, pickup, now)
+# ================== API: ЛЕНТА ИЗМЕНЕНИЙ ==================
+
+
+@require_http_methods(["GET"])
+def change_feed_view(request):
+    """
+    События смены статуса после курсора: ?after=<id>&limit=<до 5000>.
+    Authorization: Bearer <токен> (create_api_token). Клиент хранит
+    next_after и приходит с ним снова; has_more — можно сразу за следующей.
 
-    return JsonResponse({"track_number": parcel.track_number, "events": _serialize_history(parcel)})
+    Читается только с основной БД: запас CHANGE_FEED_SAFETY_SECONDS меряется
+    от коммита на основной, а реплика с большим отставанием показала бы
+    событие с большим id раньше меньшего, и курсор проскочил бы его.
+    """
+    token = authenticate_token(request.headers.get("Authorization", ""))
+    if token is None:
+        return JsonResponse({"ok": False, "error": "invalid_token"}, status=401)
+
+    after = request.GET.get("after") or "0"
+    if not after.isdigit():
+        return JsonResponse({"ok": False, "error": "bad_cursor"}, status=400)
+    try:
+        limit = int(request.GET.get("limit") or 1000)
+    except ValueError:
+        limit = 1000
+
+    with span("feed.read", limit=limit):
+        page = read_feed(int(after), limit=limit, user_id=token.user_id)
+
+    # не чаще раза в минуту
+    now = timezone.now()
+    if token.last_used_at is None or now - token.last_used_at > timedelta(minutes=1):
+        ApiToken.objects.filter(pk=token.pk).update(last_used_at=now)
+
+    return JsonResponse({"ok": True, **page})
+
+
+# ================== МЕТРИКИ (Prometheus) ==================
+
+
+def _metrics_allowed(request) -> bool:
+    """
+    Staff-пользователь или Prometheus с Authorization: Bearer <METRICS_TOKEN>.
+    """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    auth = request.headers.get("Authorization", "")
+    if token and constant_time_compare(auth, f"Bearer {token}"):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def _flow_lag_seconds(gauges: dict) -> float:
+    """
+    Отставание, которое опубликовал process_parcel_flows (если оно было —
+    плюс время с публикации). Если gauge нет или он старше
+    FLOW_LAG_ALERT_SECONDS (команда не запускается, METRICS_DIR не задан) —
+    считаем сами, по запросу на этап.
+    """
+    published = gauges.get(("kargo_flow_lag_seconds", ()))
+    if published is not None:
+        value, ts = published
+        age = max(0.0, time.time() - ts)
+        if age <= float(getattr(settings, "FLOW_LAG_ALERT_SECONDS", 600)):
+            return value + age if value else 0.0
+    return _cn_flow_lag_seconds(timezone.now())
+
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    if not _metrics_allowed(request):
+        return HttpResponse(status=403)
+    data = collect()
+    lag = _flow_lag_seconds(data["gauges"])
+    return HttpResponse(
+        render_prometheus(extra_gauges=[("kargo_flow_lag_seconds", {}, lag)], data=data),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@require_http_methods(["GET"])
+def flow_health_view(request):
+    """
+    Проверка для алертов/балансировщика: 503, если самый старый
+    просроченный переход старше FLOW_LAG_ALERT_SECONDS.
+    """
+    threshold = float(getattr(settings, "FLOW_LAG_ALERT_SECONDS", 600))
+    lag = _flow_lag_seconds(collect()["gauges"])
+    ok = lag <= threshold
+    return JsonResponse(
+        {"status": "ok" if ok else "lagging", "lag_seconds": round(lag, 1), "threshold_seconds": threshold},
+        status=200 if ok else 503,
+    )
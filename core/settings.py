@@ -44,10 +44,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'apps.main.middleware.RequestMetricsMiddleware',
+    'apps.main.middleware.TracingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'apps.main.db_router.ReplicaStickinessMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.main.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -94,6 +98,34 @@ DATABASES = {
 #     }
 # }
 
+# Реплика только для чтения (кабинет, история, публичный трекинг).
+# Локально можно проверить на второй копии SQLite:
+#   cp db.sqlite3 db_replica.sqlite3
+# DATABASES["replica"] = {
+#     "ENGINE": "django.db.backends.sqlite3",
+#     "NAME": BASE_DIR / "db_replica.sqlite3",
+#     "TEST": {"MIRROR": "default"},
+# }
+
+DATABASE_ROUTERS = ["apps.main.db_router.ReplicaRouter"]
+REPLICA_DATABASE_ALIAS = "replica"
+# сколько секунд после записи сессия читает только с основной БД
+REPLICA_STICKY_SECONDS = 10
+
+# Кэш общий для всех воркеров на хосте (mmap-файл, без отдельного сервиса).
+# На Linux лучше держать файл в /dev/shm.
+CACHES = {
+    "default": {
+        "BACKEND": "apps.main.shm_cache.SharedMemoryCache",
+        "LOCATION": BASE_DIR / "var" / "cache.shm",
+        "OPTIONS": {
+            "SLOTS": 8192,
+            "SLOT_SIZE": 2048,
+            "WAYS": 8,
+        },
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -142,11 +174,84 @@ MEDIA_ROOT = BASE_DIR/ 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# CabinetModelBackend грузит пользователя вместе с профилем и пунктом выдачи.
+# ModelBackend остаётся для сессий, открытых до него (в сессии записан путь
+# бэкенда); новые входы идут через CabinetModelBackend.
+AUTHENTICATION_BACKENDS = [
+    "apps.main.auth_backends.CabinetModelBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
+
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "cabinet_home"
 LOGOUT_REDIRECT_URL = "login"
 
 
 
+# TTL кэша справочников (SiteSettings, пункты выдачи) в памяти процесса, сек
+REFDATA_CACHE_TTL = 300
+
 STAFF_SECOND_SCAN_DELAY_HOURS = 48
 STAFF_AUTO_RECEIVED_AFTER_DAYS = 15
+
+# ===== Метрики / производительность =====
+# снимки метрик каждого воркера, /metrics их суммирует
+METRICS_DIR = BASE_DIR / "var" / "metrics"
+METRICS_FLUSH_SECONDS = 2
+# токен для Prometheus (Authorization: Bearer ...); пусто — только staff-сессия
+METRICS_TOKEN = ""
+# запросы сверх бюджета пишутся в лог apps.main.perf
+PERF_QUERY_BUDGET = 50
+PERF_LATENCY_BUDGET_MS = 1000
+# /health/flows/ отдаёт 503, если этап Китая просрочен дольше этого, сек
+FLOW_LAG_ALERT_SECONDS = 600
+
+# ===== Медленные SQL =====
+# порог в мс; None — хук не ставится. Пример для отладки: 200
+SLOW_QUERY_THRESHOLD_MS = None
+SLOW_QUERY_LOG = BASE_DIR / "var" / "slow_queries.jsonl"
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+# EXPLAIN ANALYZE повторно выполняет запрос — только SELECT и только PostgreSQL
+SLOW_QUERY_EXPLAIN_ANALYZE = False
+SLOW_QUERY_EXPLAIN_INTERVAL = 300
+
+# ===== Профилирование (?__profile=1 для суперпользователя, --profile у команд) =====
+PROFILE_DIR = BASE_DIR / "var" / "profiles"
+PROFILE_TOP = 30
+
+# ===== Трассировка (tracing.py) =====
+# доля запросов/пачек, попадающих в трассы; 0 — выключено
+TRACE_SAMPLE_RATE = 0.0
+TRACE_FILE = BASE_DIR / "var" / "traces.json"
+TRACE_FILE_MAX_BYTES = 50 * 1024 * 1024
+
+# ===== Сводки дашборда (update_rollups) =====
+# строки истории моложе этого не сворачиваются: ждём коммита параллельных транзакций, сек
+ROLLUP_SAFETY_SECONDS = 120
+
+# ===== Оценка прибытия (update_transit_stats, eta.py) =====
+# меньше посылок по ПВЗ — окно считается по всем ПВЗ; меньше и там — окна нет
+ETA_MIN_SAMPLES = 20
+# вес посылки в гистограмме вдвое меньше за каждые столько дней с её прибытия
+ETA_HALF_LIFE_DAYS = 30
+
+# ===== Лента изменений (outbox ParcelEvent, /api/feed/events/) =====
+# события моложе этого не отдаются: ждём коммита параллельных транзакций, сек
+CHANGE_FEED_SAFETY_SECONDS = 10
+# prune_parcel_events удаляет события старше, дней
+CHANGE_FEED_RETENTION_DAYS = 30
+
+# ===== Уведомления клиентам (dispatch_notifications) =====
+# класс провайдера (NotificationProvider); ConsoleProvider пишет в stdout
+NOTIFY_PROVIDER = "apps.main.notifications.ConsoleProvider"
+# первая попытка не раньше чем через столько секунд — склейка посылок одного клиента
+NOTIFY_DELAY_SECONDS = 60
+NOTIFY_BATCH_SIZE = 500
+NOTIFY_MAX_ATTEMPTS = 6
+# задержка повтора: 30с, 60с, 120с ... не больше часа
+NOTIFY_BACKOFF_SECONDS = 30
+NOTIFY_BACKOFF_MAX_SECONDS = 3600
+# забранные строки не видны другим воркерам столько секунд (время на отправку);
+# если воркер упал, они снова в очереди
+NOTIFY_CLAIM_SECONDS = 300